@@ -12,7 +12,10 @@ resource "aws_lambda_function" "api_lambda" {
       DATABASE_URL = local.secrets["db-credentials"]
       API_KEY      = local.secrets["api-key"]
       ANTHROPIC_API_KEY = local.secrets["anthropic-api-key"]
+      # /admin/usage stays disabled while the secret has no admin-api-key
+      ADMIN_API_KEY = lookup(local.secrets, "admin-api-key", "")
       TOKEN_TRACKING_TABLE = aws_dynamodb_table.llm_token_usage.name
+      RESPONSE_CACHE_TABLE = aws_dynamodb_table.llm_response_cache.name
 
       # configs
       IS_API_KEY_AUTH_DISABLED = 1  # Using gateway auth instead
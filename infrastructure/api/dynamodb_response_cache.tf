@@ -0,0 +1,28 @@
+resource "aws_dynamodb_table" "llm_response_cache" {
+  name         = "${var.name}-llm-response-cache"
+  billing_mode = "PAY_PER_REQUEST"  # On-demand pricing
+
+  hash_key = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  # TTL configuration - entries expire after RESPONSE_CACHE_TTL_SECONDS
+  ttl {
+    enabled        = true
+    attribute_name = "ttl"
+  }
+
+  # Encryption at rest
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Name        = "${var.name}-llm-response-cache"
+    Environment = var.app_env
+    Service     = "llm-tracking"
+  }
+}
@@ -59,13 +59,35 @@ data "aws_iam_policy_document" "api_lambda" {
       "dynamodb:PutItem",
       "dynamodb:Query",
       "dynamodb:GetItem",
-      "dynamodb:BatchWriteItem"
+      "dynamodb:BatchWriteItem",
+      "dynamodb:UpdateItem"
     ]
     resources = [
       aws_dynamodb_table.llm_token_usage.arn,
       "${aws_dynamodb_table.llm_token_usage.arn}/index/*"
     ]
   }
+
+  # LLM response cache
+  statement {
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:PutItem"
+    ]
+    resources = [
+      aws_dynamodb_table.llm_response_cache.arn
+    ]
+  }
+
+  # Speculative pre-generation (SPECULATION_DISPATCH=lambda) invokes the API function asynchronously
+  statement {
+    actions = [
+      "lambda:InvokeFunction"
+    ]
+    resources = [
+      "arn:aws:lambda:*:*:function:${var.name}-api-lambda"
+    ]
+  }
 }
 
 resource "aws_iam_role" "api_lambda" {
@@ -0,0 +1,50 @@
+# Offline chapter summarization (Message Batches API), same image as the API with another handler
+resource "aws_lambda_function" "summarize_chapters_job" {
+  image_uri     = "${data.aws_ecr_repository.api_lambda.repository_url}:${var.image_tag}"
+  package_type  = "Image"
+  function_name = "${var.name}-summarize-chapters-job"
+  timeout       = 900
+  role          = aws_iam_role.api_lambda.arn
+  memory_size   = 256
+
+  image_config {
+    command = ["app.jobs.summarize_chapters.handler"]
+  }
+
+  environment {
+    variables = {
+      # secrets
+      DATABASE_URL = local.secrets["db-credentials"]
+      ANTHROPIC_API_KEY = local.secrets["anthropic-api-key"]
+      TOKEN_TRACKING_TABLE = aws_dynamodb_table.llm_token_usage.name
+
+      # configs
+      APP_ENV                 = var.app_env
+      APP_VERSION             = var.image_tag
+      PYTHONDONTWRITEBYTECODE = 1
+    }
+  }
+
+  depends_on = [
+    aws_iam_role_policy_attachment.api_lambda,
+  ]
+}
+
+resource "aws_cloudwatch_event_rule" "summarize_chapters_job" {
+  name                = "${var.name}-summarize-chapters-job"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "summarize_chapters_job" {
+  rule  = aws_cloudwatch_event_rule.summarize_chapters_job.name
+  arn   = aws_lambda_function.summarize_chapters_job.arn
+  input = jsonencode({ limit = 1000, wait_seconds = 780 })
+}
+
+resource "aws_lambda_permission" "summarize_chapters_job" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.summarize_chapters_job.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.summarize_chapters_job.arn
+}
@@ -53,6 +53,8 @@ class Config:
         # secrets
         self.api_key: str = os.environ.get("API_KEY")
         self.database_url: str = os.environ.get("DATABASE_URL")
+        # derived from DATABASE_URL (pymysql -> aiomysql) when not set explicitly
+        self.async_database_url: str = os.environ.get("ASYNC_DATABASE_URL")
         self.anthropic_api_key: str = os.environ.get("ANTHROPIC_API_KEY")
 
         # configs
@@ -61,3 +63,63 @@ class Config:
         self.anthropic_model: str = os.environ.get("ANTHROPIC_MODEL", "claude-opus-4-1-20250805")
         self.anthropic_max_tokens: int = int(os.environ.get("ANTHROPIC_MAX_TOKENS", 1024))
         self.llm_client_type: str = os.environ.get("LLM_CLIENT_TYPE", "anthropic")
+        self.bedrock_max_concurrency: int = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", 8))
+        # retries and failover (see llm_resilience); defaults to the other family, "none" disables failover
+        self.llm_fallback_type: str | None = os.environ.get("LLM_FALLBACK_TYPE")
+        self.llm_max_attempts: int = int(os.environ.get("LLM_MAX_ATTEMPTS", 3))
+        self.llm_backoff_base_seconds: float = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 0.5))
+        self.llm_backoff_max_seconds: float = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 8))
+        self.llm_circuit_failure_threshold: int = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", 5))
+        self.llm_circuit_reset_seconds: float = float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", 30))
+        # response cache for deterministic calls (see response_cache): "dynamodb", "sqlite" or "memory"
+        self.response_cache_backend: str = os.environ.get("RESPONSE_CACHE_BACKEND", "dynamodb")
+        self.response_cache_table: str = os.environ.get("RESPONSE_CACHE_TABLE", "llm-response-cache")
+        self.response_cache_sqlite_path: str = os.environ.get("RESPONSE_CACHE_SQLITE_PATH", ".cache/llm_responses.sqlite")
+        self.response_cache_ttl_seconds: int = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+        self.response_cache_max_entries: int = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+        self.response_cache_sqlite_max_entries: int = int(os.environ.get("RESPONSE_CACHE_SQLITE_MAX_ENTRIES", 100_000))
+        # DM request input budget (estimated tokens) and the share retrieved memory may take of it
+        self.dm_input_token_budget: int = int(os.environ.get("DM_INPUT_TOKEN_BUDGET", 12000))
+        self.dm_memory_token_budget: int = int(os.environ.get("DM_MEMORY_TOKEN_BUDGET", 1500))
+        # speculative pre-generation of the next turn (opt-in): "background" task or async "lambda" self-invoke.
+        # Under Mangum a Lambda invocation waits for background tasks, so on Lambda it is always "lambda"
+        self.speculation_enabled: bool = os.environ.get("SPECULATION_ENABLED", "0") == "1"
+        self.speculation_dispatch: str = "lambda" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") \
+            else os.environ.get("SPECULATION_DISPATCH", "background")
+        self.speculation_top_k: int = int(os.environ.get("SPECULATION_TOP_K", 2))
+        self.speculation_max_cost_per_turn_usd: float = float(os.environ.get("SPECULATION_MAX_COST_PER_TURN_USD", 0.25))
+        self.speculation_daily_budget_usd: float = float(os.environ.get("SPECULATION_DAILY_BUDGET_USD", 10))
+        # write-behind token usage tracking: buffered items, written by a background thread in batches
+        self.token_tracking_buffer_size: int = int(os.environ.get("TOKEN_TRACKING_BUFFER_SIZE", 1000))
+        self.token_tracking_flush_interval_seconds: float = float(os.environ.get("TOKEN_TRACKING_FLUSH_INTERVAL_SECONDS", 1.0))
+        # DynamoDB endpoint override, e.g. http://localhost:8000 for DynamoDB Local
+        self.dynamodb_endpoint_url: str | None = os.environ.get("DYNAMODB_ENDPOINT_URL")
+        # /admin/usage: concurrent day queries and closed days kept in the report cache
+        self.usage_query_max_workers: int = int(os.environ.get("USAGE_QUERY_MAX_WORKERS", 8))
+        self.usage_query_cache_max_days: int = int(os.environ.get("USAGE_QUERY_CACHE_MAX_DAYS", 400))
+        # per-user limits (see rate_limit); request counts stay per container ("memory") unless
+        # "dynamodb" is opted into, which shares them at the cost of a DynamoDB write per request
+        self.rate_limit_enabled: bool = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+        self.rate_limit_backend: str = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+        self.rate_limit_requests_per_minute: int = int(os.environ.get("RATE_LIMIT_REQUESTS_PER_MINUTE", 20))
+        self.rate_limit_tokens_per_day: int = int(os.environ.get("RATE_LIMIT_TOKENS_PER_DAY", 2_000_000))
+        self.rate_limit_usage_cache_seconds: float = float(os.environ.get("RATE_LIMIT_USAGE_CACHE_SECONDS", 30))
+        # record/replay backend (see replay): LLM_CLIENT_TYPE=replay replays LLM_REPLAY_PATH with these latencies
+        self.llm_replay_path: str | None = os.environ.get("LLM_REPLAY_PATH")
+        self.llm_record_path: str | None = os.environ.get("LLM_RECORD_PATH")
+        self.replay_llm_latency: str = os.environ.get("REPLAY_LLM_LATENCY", "lognormal:1500,0.4")
+        self.replay_embedding_latency: str = os.environ.get("REPLAY_EMBEDDING_LATENCY", "lognormal:80,0.3")
+        self.replay_seed: int | None = int(os.environ["REPLAY_SEED"]) if os.environ.get("REPLAY_SEED") else None
+        # cache breakpoints on system prompt, tools and message history (disable for models without support)
+        self.prompt_caching: bool = os.environ.get("PROMPT_CACHING", "1") == "1"
+        # Bedrock model ids to send breakpoints to as well (comma separated), e.g. anthropic.claude-3-5-haiku-20241022-v1:0
+        self.bedrock_prompt_caching_models: set[str] = {
+            model for model in os.environ.get("BEDROCK_PROMPT_CACHING_MODELS", "").split(",") if model.strip()
+        }
+
+        # database pool (tuned for Lambda: few connections per container, pre-ping after thaw)
+        self.db_pool_size: int = int(os.environ.get("DB_POOL_SIZE", 2))
+        self.db_max_overflow: int = int(os.environ.get("DB_MAX_OVERFLOW", 3))
+        self.db_pool_timeout: int = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+        self.db_pool_recycle: int = int(os.environ.get("DB_POOL_RECYCLE", 280))
+        self.db_pool_pre_ping: bool = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
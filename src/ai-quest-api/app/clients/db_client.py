@@ -1,36 +1,277 @@
 import contextlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Iterator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
 from app.clients import config
 
+_LOGGER = logging.getLogger(__name__)
+
 config = config.Config()
 
 
-def get_db() -> Session:
-    engine = create_engine(config.database_url, echo=(config.debug == 1))
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
+@dataclass
+class PoolStats:
+    """Counters collected from pool events; latencies are in seconds"""
+    connects: int = 0
+    connect_seconds_total: float = 0.0
+    checkouts: int = 0
+    checkout_seconds_total: float = 0.0
+    checkout_seconds_max: float = 0.0
+    checkins: int = 0
+    invalidations: int = 0
+
+
+# One engine (and one connection pool) per process, reused by warm Lambda invocations
+_engine: Engine | None = None
+_session_factory: sessionmaker | None = None
+_engine_lock = threading.Lock()
+_async_engine: AsyncEngine | None = None
+_async_session_factory: async_sessionmaker | None = None
+_stats = PoolStats()
+_stats_lock = threading.Lock()
+_connect_started = threading.local()
+
+
+def _engine_kwargs(database_url: str) -> dict:
+    kwargs = {
+        "echo": config.debug == 1,
+        "pool_pre_ping": config.db_pool_pre_ping,
+    }
+    # Sizing is for the MySQL pool; file-based SQLite (tests) keeps SQLAlchemy's default
+    # QueuePool of 5 + 10 overflow, and :memory: databases do not pool at all
+    if not database_url.startswith("sqlite"):
+        kwargs.update(
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+            pool_recycle=config.db_pool_recycle,
+        )
+    return kwargs
+
+
+def _to_async_url(database_url: str) -> str:
+    """Swap the synchronous DBAPI driver for its asyncio counterpart."""
+    for sync_prefix, async_prefix in (
+        ("mysql+pymysql://", "mysql+aiomysql://"),
+        ("mysql://", "mysql+aiomysql://"),
+        ("sqlite+pysqlite://", "sqlite+aiosqlite://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if database_url.startswith(sync_prefix):
+            return async_prefix + database_url[len(sync_prefix):]
+    return database_url
+
+
+def _register_pool_listeners(engine: Engine) -> None:
+    @event.listens_for(engine, "do_connect")
+    def _on_do_connect(dialect, conn_rec, cargs, cparams):
+        _connect_started.value = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        started = getattr(_connect_started, "value", None)
+        with _stats_lock:
+            _stats.connects += 1
+            if started is not None:
+                _stats.connect_seconds_total += time.perf_counter() - started
+        _connect_started.value = None
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        with _stats_lock:
+            _stats.checkins += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        with _stats_lock:
+            _stats.invalidations += 1
+
+
+class _AsyncSessionBase(Session):
+    """Sync half of the asyncio sessions: connections are checked out on first use, not on open"""
+
+
+@event.listens_for(_AsyncSessionBase, "do_orm_execute")
+def _on_execute(orm_execute_state):
+    # The statement may be about to check a connection out; after_begin tells whether it did
+    orm_execute_state.session.info["checkout_started"] = time.perf_counter()
+
+
+@event.listens_for(_AsyncSessionBase, "after_begin")
+def _on_begin(session, transaction, connection):
+    started = session.info.pop("checkout_started", None)
+    if started is not None:
+        _record_checkout(time.perf_counter() - started)
+
+
+@event.listens_for(_AsyncSessionBase, "after_transaction_end")
+def _on_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("checkout_started", None)
+
+
+def get_engine() -> Engine:
+    """Return the process-wide engine, creating it on first use."""
+    global _engine, _session_factory
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(config.database_url, **_engine_kwargs(config.database_url))
+                _register_pool_listeners(engine)
+                _session_factory = sessionmaker(
+                    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+                )
+                _engine = engine
+                _LOGGER.info("Created database engine")
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Return the process-wide asyncio engine, creating it on first use.
+
+    Pooled connections are bound to the event loop that opened them; Mangum keeps
+    one loop per container, so the pool survives across warm invocations.
+    """
+    global _async_engine, _async_session_factory
+
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                database_url = config.async_database_url or _to_async_url(config.database_url)
+                engine = create_async_engine(database_url, **_engine_kwargs(database_url))
+                _register_pool_listeners(engine.sync_engine)
+                _async_session_factory = async_sessionmaker(
+                    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine,
+                    sync_session_class=_AsyncSessionBase,
+                )
+                _async_engine = engine
+                _LOGGER.info("Created async database engine")
+    return _async_engine
+
+
+def dispose_engine() -> None:
+    """Close all pooled connections and forget the engine (tests, shutdown)."""
+    global _engine, _session_factory, _stats
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _session_factory = None
+        with _stats_lock:
+            _stats = PoolStats()
+
+
+async def dispose_async_engine() -> None:
+    """Async counterpart of dispose_engine()."""
+    global _async_engine, _async_session_factory, _stats
+
+    engine = _async_engine
+    with _engine_lock:
+        _async_engine = None
+        _async_session_factory = None
+        with _stats_lock:
+            _stats = PoolStats()
+    if engine is not None:
+        await engine.dispose()
+
+
+def _open_session() -> Session:
+    get_engine()
+    db = _session_factory()
+
+    # Check the connection out eagerly so the time spent waiting on the pool is measurable
+    started = time.perf_counter()
+    db.connection()
+    _record_checkout(time.perf_counter() - started)
+
     return db
 
 
+def _record_checkout(elapsed: float) -> None:
+    with _stats_lock:
+        _stats.checkouts += 1
+        _stats.checkout_seconds_total += elapsed
+        _stats.checkout_seconds_max = max(_stats.checkout_seconds_max, elapsed)
+
+
+async def _open_async_session() -> AsyncSession:
+    # Unlike sync sessions, the connection is checked out lazily (and timed then): async handlers
+    # await LLM calls, and a session must not hold a pooled connection while nothing runs on it
+    get_async_engine()
+    return _async_session_factory()
+
+
+def pool_stats() -> dict:
+    """Snapshot of pool occupancy and checkout latency counters."""
+    pool = _async_engine.pool if _async_engine is not None else get_engine().pool
+
+    with _stats_lock:
+        stats = asdict(_stats)
+
+    stats["checkout_seconds_avg"] = (
+        stats["checkout_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    )
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[f"pool_{name}"] = getattr(pool, name)()
+    return stats
+
+
+def get_db() -> Iterator[Session]:
+    """
+    FastAPI dependency yielding a pooled session for the duration of a request.
+
+    Commits when the request handler succeeds, rolls back when it raises,
+    and always returns the connection to the pool.
+    """
+    db = _open_session()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 @contextlib.contextmanager
 def session():
     """
     A context manager that yields a database connection and cleans up after itself.
 
-    Will close the connection before exiting, and if there was an unhandled exception
-    it will first perform a rollback and then close the connection.
+    Will commit and close the connection before exiting, and if there was an unhandled
+    exception it will first perform a rollback and then close the connection.
     """
-    engine = create_engine(config.database_url, echo=(config.debug == 1))
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
+    yield from get_db()
 
+
+@contextlib.asynccontextmanager
+async def async_session():
+    """Asyncio counterpart of session()."""
+    db = await _open_async_session()
     try:
         yield db
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
     finally:
-        db.close()
+        await db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Asyncio counterpart of get_db() for handlers that must not block the event loop."""
+    async with async_session() as db:
+        yield db
@@ -1,50 +1,196 @@
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import copy
 import json
 import logging
-from typing import Literal
+import threading
+import time
+from typing import AsyncIterator, Literal
 
 import anthropic
 import boto3
+from botocore.config import Config as BotoConfig
+from jiter import from_json
 
 from app.clients import config
-from app.clients.token_tracker import DynamoDBTokenTracker
+from app.clients import llm_resilience
+from app.clients import model_routing
+from app.clients import response_cache
+from app.clients.token_tracker import get_token_tracker
 
 logger = logging.getLogger(__name__)
 config = config.Config()
 
+LLMFamily = Literal["anthropic", "bedrock", "replay"]
+
+# boto3 has no asyncio API: Bedrock calls run here so they never block the event loop,
+# and the pool size bounds how many of them can be in flight per process
+_bedrock_executor = ThreadPoolExecutor(max_workers=config.bedrock_max_concurrency, thread_name_prefix="bedrock")
+
+# https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+# Set by ResilientLLMClient around each attempt, so tracked usage records how the call was served
+_call_outcome: contextvars.ContextVar[dict | None] = contextvars.ContextVar("llm_call_outcome", default=None)
+
+
+def _tracking_metadata(metadata: dict) -> dict:
+    outcome = _call_outcome.get()
+    if not outcome:
+        return metadata
+    outcome = dict(outcome)
+    started = outcome.pop("started", None)
+    if started is not None:
+        outcome["latency_ms"] = round((time.perf_counter() - started) * 1000)
+    return {**metadata, **outcome}
+
+
+def cached_system(system_prompt: str, enabled: bool) -> str | list[dict]:
+    """System prompt as a text block with a cache breakpoint (caches tools + system)"""
+    if not enabled:
+        return system_prompt
+    return [{"type": "text", "text": system_prompt, "cache_control": _CACHE_CONTROL}]
+
+
+def cached_tools(tools: list[dict] | None, enabled: bool) -> list[dict] | None:
+    """Copy of the tools with a cache breakpoint after the last tool definition"""
+    if not enabled or not tools:
+        return tools
+    return tools[:-1] + [{**tools[-1], "cache_control": _CACHE_CONTROL}]
+
+
+def cached_messages(messages: list[dict], enabled: bool) -> list[dict]:
+    """
+    Copy of the messages with a cache breakpoint on the history, i.e. before the final user message.
+
+    The final message carries ephemeral context (retrieved memory) and is stored differently,
+    so it is left out of the cached prefix. The next turn resends this history plus one exchange,
+    and its lookup hits the prefix written here; that prefix is then billed at the cache-read rate.
+    """
+    if not enabled or len(messages) < 2:
+        return messages
+    last_cached = messages[-2]
+    content = last_cached["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [{**content[-1], "cache_control": _CACHE_CONTROL}]
+    return messages[:-2] + [{**last_cached, "content": content}, messages[-1]]
+
+
+def cache_usage(usage) -> dict:
+    """Cache token counts from an SDK usage object or a Bedrock usage dict (absent/None -> 0)"""
+    if isinstance(usage, dict):
+        get = usage.get
+    else:
+        def get(name):
+            return getattr(usage, name, None)
+    return {
+        "cache_creation_input_tokens": get("cache_creation_input_tokens") or 0,
+        "cache_read_input_tokens": get("cache_read_input_tokens") or 0,
+    }
+
 
 class LLMClient(ABC):
+    """
+    Transport-level client, shared by every caller in the process (see get_client).
+    The system prompt is passed per call, so one instance serves all prompts.
+    Calls are awaited so concurrent turns overlap their network waits.
+    """
     def __init__(self):
-        self.token_tracker = DynamoDBTokenTracker()
+        self.token_tracker = get_token_tracker()
 
+    @property
     @abstractmethod
-    def ask(self, question: str) -> dict:
+    def model_name(self) -> str:
         pass
 
+    @property
+    def prompt_caching(self) -> bool:
+        """Whether requests of this client carry cache_control breakpoints"""
+        return False
+
+    def bind(self, model: str, max_tokens: int) -> 'LLMClient':
+        """A view of this transport client with another model, sharing its connection pool"""
+        raise NotImplementedError(f"{type(self).__name__} cannot be bound to a model")
+
     @abstractmethod
-    def send_messages(self, messages: list[dict], tools: list[dict] = None, tool_choice: dict = None) -> str:
+    async def ask(self, question: str, system_prompt: str) -> str:
         pass
 
+    @abstractmethod
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
+        pass
+
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        """
+        Yield growing snapshots of the forced tool call's input, the last one complete.
+
+        Providers without streaming support yield the complete input once.
+        """
+        yield json.loads(await self.send_messages(messages, system_prompt, tools=tools, tool_choice=tool_choice))
+
+
+class PartialToolInput:
+    """
+    Accumulates input_json deltas of a streamed tool call.
+
+    Unlike the SDK snapshot, unterminated strings are kept ("trailing-strings"),
+    so text fields can be forwarded while they are still being generated.
+    """
+    def __init__(self):
+        self.buffer = b""
+        self.snapshot: dict = {}
+
+    def feed(self, partial_json: str) -> dict:
+        self.buffer += partial_json.encode("utf-8")
+        try:
+            parsed = from_json(self.buffer, partial_mode="trailing-strings")
+        except ValueError:
+            # The buffer ends inside an escape sequence; the next delta completes it
+            return self.snapshot
+        if isinstance(parsed, dict):
+            self.snapshot = parsed
+        return self.snapshot
+
 
 class AnthropicClient(LLMClient):
     """
     https://github.com/anthropics/anthropic-sdk-python
     https://docs.anthropic.com/en/docs/build-with-claude/prompt-engineering/system-prompts
     """
-    def __init__(self, system_prompt: str):
+    def __init__(self):
         super().__init__()
-        self.client = anthropic.Anthropic(
+        # The SDK keeps an httpx connection pool, reused for as long as this instance lives.
+        # Pooled connections belong to the event loop that opened them (one per Lambda container).
+        self.client = anthropic.AsyncAnthropic(
             api_key=config.anthropic_api_key,
             max_retries=0,
             timeout=60.0,  # seconds
         )
         self.model = config.anthropic_model
         self.max_tokens = config.anthropic_max_tokens
-        self.system_prompt = system_prompt
 
-    def ask(self, question: str) -> str:
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    @property
+    def prompt_caching(self) -> bool:
+        return config.prompt_caching
+
+    def bind(self, model: str, max_tokens: int) -> 'AnthropicClient':
+        bound = copy.copy(self)
+        bound.model = model
+        bound.max_tokens = max_tokens
+        return bound
+
+    async def ask(self, question: str, system_prompt: str) -> str:
         try:
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 max_tokens=self.max_tokens,
                 messages=[
                     {
@@ -53,7 +199,7 @@ class AnthropicClient(LLMClient):
                     }
                 ],
                 model=self.model,
-                system=self.system_prompt,
+                system=cached_system(system_prompt, self.prompt_caching),
             )
 
             # Track token usage
@@ -63,41 +209,45 @@ class AnthropicClient(LLMClient):
                     model=self.model,
                     input_tokens=response.usage.input_tokens,
                     output_tokens=response.usage.output_tokens,
-                    metadata={
+                    **cache_usage(response.usage),
+                    metadata=_tracking_metadata({
                         "method": "ask",
                         "question_length": len(question),
-                        "system_prompt_length": len(self.system_prompt)
-                    }
+                        "system_prompt_length": len(system_prompt)
+                    })
                 )
 
             return response.content[0].text
 
         except anthropic.APIConnectionError as e:
-            logger.exception("The server could not be reached", e.__cause__)
+            logger.exception("The server could not be reached", exc_info=True)
             raise e
         except anthropic.RateLimitError as e:
-            logger.exception("The rate limit was exceeded", e.__cause__)
+            logger.exception("The rate limit was exceeded", exc_info=True)
             raise e
         except anthropic.APIStatusError as e:
-            logger.exception("The API returned an error", e.__cause__)
+            logger.exception("The API returned an error", exc_info=True)
             raise e
         except Exception as e:
-            logger.exception("An unexpected error occurred", e.__cause__)
+            logger.exception("An unexpected error occurred", exc_info=True)
             raise e
 
-    def send_messages(self, messages: list[dict], tools: list[dict] = None, tool_choice: dict = None) -> str:
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
         try:
             if tools is None:
                 tools = anthropic.NotGiven()
+            else:
+                tools = cached_tools(tools, self.prompt_caching)
             if tool_choice is None:
                 tool_choice = anthropic.NotGiven()
 
             # https://docs.anthropic.com/en/api/client-sdks
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 max_tokens=self.max_tokens,
-                messages=messages,
+                messages=cached_messages(messages, self.prompt_caching),
                 model=self.model,
-                system=self.system_prompt,
+                system=cached_system(system_prompt, self.prompt_caching),
                 tools=tools,
                 tool_choice=tool_choice
             )
@@ -109,12 +259,13 @@ class AnthropicClient(LLMClient):
                     model=self.model,
                     input_tokens=response.usage.input_tokens,
                     output_tokens=response.usage.output_tokens,
-                    metadata={
+                    **cache_usage(response.usage),
+                    metadata=_tracking_metadata({
                         "method": "send_messages",
                         "message_count": len(messages),
                         "has_tools": tools != anthropic.NotGiven(),
-                        "system_prompt_length": len(self.system_prompt)
-                    }
+                        "system_prompt_length": len(system_prompt)
+                    })
                 )
 
             # Extract the tool use response
@@ -137,23 +288,107 @@ class AnthropicClient(LLMClient):
             logger.exception("Error in Anthropic API call", exc_info=True)
             raise e
 
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        """Stream the tool call through the Messages streaming API"""
+        try:
+            partial_input = PartialToolInput()
+
+            async with self.client.messages.stream(
+                max_tokens=self.max_tokens,
+                messages=cached_messages(messages, self.prompt_caching),
+                model=self.model,
+                system=cached_system(system_prompt, self.prompt_caching),
+                tools=cached_tools(tools, self.prompt_caching),
+                tool_choice=tool_choice
+            ) as stream:
+                async for event in stream:
+                    if event.type == "input_json":
+                        yield partial_input.feed(event.partial_json)
+
+                response = await stream.get_final_message()
+
+            # Track token usage
+            self.token_tracker.track_usage(
+                service="anthropic",
+                model=self.model,
+                input_tokens=response.usage.input_tokens,
+                output_tokens=response.usage.output_tokens,
+                **cache_usage(response.usage),
+                metadata=_tracking_metadata({
+                    "method": "stream_tool_input",
+                    "message_count": len(messages),
+                    "has_tools": True,
+                    "system_prompt_length": len(system_prompt)
+                })
+            )
+
+            for content in response.content:
+                if content.type == "tool_use":
+                    yield content.input
+                    return
+
+            raise ValueError("Streamed response contained no tool call")
+
+        except anthropic.APIConnectionError as e:
+            logger.exception("The server could not be reached", exc_info=True)
+            raise e
+        except anthropic.RateLimitError as e:
+            logger.exception("The rate limit was exceeded", exc_info=True)
+            raise e
+        except anthropic.APIStatusError as e:
+            logger.exception("The API returned an error", exc_info=True)
+            raise e
+
 
 class BedrockClaudeClient(LLMClient):
     """AWS Bedrock client for Claude models with token tracking"""
 
-    def __init__(self, system_prompt: str, model_id: str = None):
+    def __init__(self, model_id: str = None):
         super().__init__()
-        self.bedrock_client = boto3.client('bedrock-runtime')
+        # Keep-alive connections are pooled by botocore and reused across warm invocations
+        self.bedrock_client = boto3.client(
+            'bedrock-runtime',
+            # Retries are owned by ResilientLLMClient (backoff, circuit breaker, failover)
+            config=BotoConfig(max_pool_connections=config.bedrock_max_concurrency, tcp_keepalive=True,
+                              retries={"total_max_attempts": 1}),
+        )
         self.model_id = model_id or 'anthropic.claude-3-5-sonnet-20241022-v2:0'
-        self.system_prompt = system_prompt
         self.max_tokens = config.anthropic_max_tokens
 
-    def ask(self, question: str) -> str:
+    @property
+    def model_name(self) -> str:
+        return self.model_id
+
+    @property
+    def prompt_caching(self) -> bool:
+        # Bedrock rejects cache_control for models without prompt caching, such as the default failover model
+        return config.prompt_caching and self.model_id in config.bedrock_prompt_caching_models
+
+    def bind(self, model: str, max_tokens: int) -> 'BedrockClaudeClient':
+        bound = copy.copy(self)
+        bound.model_id = model
+        bound.max_tokens = max_tokens
+        return bound
+
+    def _invoke_model_sync(self, request_body: dict) -> dict:
+        response = self.bedrock_client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps(request_body)
+        )
+        return json.loads(response['body'].read())
+
+    async def _invoke_model(self, request_body: dict) -> dict:
+        """Run the blocking invoke_model (and body read) on the bounded Bedrock executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_bedrock_executor, self._invoke_model_sync, request_body)
+
+    async def ask(self, question: str, system_prompt: str) -> str:
         try:
             request_body = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "max_tokens": self.max_tokens,
-                "system": self.system_prompt,
+                "system": cached_system(system_prompt, self.prompt_caching),
                 "messages": [
                     {
                         "role": "user",
@@ -162,12 +397,7 @@ class BedrockClaudeClient(LLMClient):
                 ]
             }
 
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(request_body)
-            )
-
-            result = json.loads(response['body'].read())
+            result = await self._invoke_model(request_body)
 
             # Track token usage
             if 'usage' in result:
@@ -176,11 +406,12 @@ class BedrockClaudeClient(LLMClient):
                     model=self.model_id,
                     input_tokens=result['usage'].get('input_tokens', 0),
                     output_tokens=result['usage'].get('output_tokens', 0),
-                    metadata={
+                    **cache_usage(result['usage']),
+                    metadata=_tracking_metadata({
                         "method": "ask",
                         "question_length": len(question),
-                        "system_prompt_length": len(self.system_prompt)
-                    }
+                        "system_prompt_length": len(system_prompt)
+                    })
                 )
 
             return result['content'][0]['text']
@@ -189,34 +420,28 @@ class BedrockClaudeClient(LLMClient):
             logger.exception("Error in Bedrock API call", exc_info=True)
             raise e
 
-    def send_messages(self, messages: list[dict], tools: list[dict] = None,
-                      tool_choice: dict = None) -> str:
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
         """Send messages to Bedrock Claude with optional tool use"""
         try:
             # Build request body for Bedrock Claude
             request_body = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "max_tokens": self.max_tokens,
-                "system": self.system_prompt,
-                "messages": messages
+                "system": cached_system(system_prompt, self.prompt_caching),
+                "messages": cached_messages(messages, self.prompt_caching)
             }
 
             # Add tools if provided
             if tools:
-                request_body["tools"] = tools
+                request_body["tools"] = cached_tools(tools, self.prompt_caching)
 
             # Add tool choice if provided
             if tool_choice:
                 request_body["tool_choice"] = tool_choice
 
             # Make the Bedrock API call
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(request_body)
-            )
-
-            # Parse the response
-            result = json.loads(response['body'].read())
+            result = await self._invoke_model(request_body)
 
             # Track token usage
             if 'usage' in result:
@@ -225,13 +450,14 @@ class BedrockClaudeClient(LLMClient):
                     model=self.model_id,
                     input_tokens=result['usage'].get('input_tokens', 0),
                     output_tokens=result['usage'].get('output_tokens', 0),
-                    metadata={
+                    **cache_usage(result['usage']),
+                    metadata=_tracking_metadata({
                         "method": "send_messages",
                         "message_count": len(messages),
                         "has_tools": tools is not None,
                         "has_tool_choice": tool_choice is not None,
-                        "system_prompt_length": len(self.system_prompt)
-                    }
+                        "system_prompt_length": len(system_prompt)
+                    })
                 )
 
             # Extract tool use response if present
@@ -254,16 +480,256 @@ class BedrockClaudeClient(LLMClient):
             raise e
 
 
-def create_client(system_prompt: str, llm_family: str = Literal["anthropic", "bedrock"]) -> LLMClient:
+class ResilientLLMClient(LLMClient):
+    """
+    Retries transient failures with jittered exponential backoff (honoring retry-after),
+    skips providers whose circuit is open and fails over to the fallback provider when the
+    primary is throttled or exhausted its attempts.
+
+    The attempt number, serving provider and whether it was a failover are added to the
+    token tracking metadata of the successful call.
+    """
+    def __init__(self, primary_family: LLMFamily, primary: LLMClient,
+                 fallback_family: LLMFamily | None = None, fallback: LLMClient | None = None,
+                 route: str | None = None):
+        # Usage is tracked by the provider clients
+        self.token_tracker = primary.token_tracker
+        self.route = route
+        self.providers = [(primary_family, primary)]
+        if fallback is not None:
+            self.providers.append((fallback_family, fallback))
+
+    @property
+    def primary(self) -> LLMClient:
+        return self.providers[0][1]
+
+    @property
+    def model_name(self) -> str:
+        return self.primary.model_name
+
+    def ensure_available(self) -> None:
+        """Fail fast, before any other work is done, when every provider's circuit is open"""
+        breakers = [llm_resilience.get_breaker(family) for family, _ in self.providers]
+        if all(breaker.state == "open" for breaker in breakers):
+            raise llm_resilience.LLMUnavailableError(
+                "LLM providers unavailable: all circuits open",
+                retry_after=min(breaker.remaining_open_seconds() for breaker in breakers),
+            )
+
+    async def _call(self, method: str, *args, **kwargs):
+        # Consumed to the end, so the winning provider's breaker records the success
+        results = [result async for result in self._attempts(method, *args, stream=False, **kwargs)]
+        return results[0]
+
+    async def _attempts(self, method: str, *args, stream: bool, **kwargs):
+        """Yield the result of the first successful attempt (every chunk of it when streaming)"""
+        last_error: Exception | None = None
+        retry_after: float | None = None
+
+        for index, (family, client) in enumerate(self.providers):
+            breaker = llm_resilience.get_breaker(family)
+            is_last_provider = index == len(self.providers) - 1
+
+            for attempt in range(1, config.llm_max_attempts + 1):
+                if not breaker.allow():
+                    retry_after = breaker.remaining_open_seconds()
+                    logger.warning(f"Circuit for {family} is open, skipping it")
+                    break
+
+                _call_outcome.set({
+                    **({"route": self.route} if self.route else {}),
+                    "started": time.perf_counter(),
+                    "provider": family,
+                    "attempt": attempt,
+                    "failover": index > 0,
+                    **({"failover_reason": type(last_error).__name__} if index > 0 and last_error else {}),
+                })
+                yielded = False
+                recorded = False
+                try:
+                    if stream:
+                        async for chunk in getattr(client, method)(*args, **kwargs):
+                            yielded = True
+                            yield chunk
+                    else:
+                        yield await getattr(client, method)(*args, **kwargs)
+                    breaker.record_success()
+                    recorded = True
+                    return
+                except Exception as e:
+                    if not llm_resilience.is_retryable(e):
+                        raise
+                    breaker.record_failure()
+                    recorded = True
+                    # Once output reached the caller the call cannot be replayed transparently
+                    if yielded:
+                        raise
+                    last_error = e
+                    retry_after = llm_resilience.retry_after(e)
+                    # A throttled provider is better replaced than waited for
+                    if llm_resilience.is_throttled(e) and not is_last_provider:
+                        logger.warning(f"{family} is throttled, failing over")
+                        break
+                    if attempt < config.llm_max_attempts:
+                        delay = llm_resilience.backoff_delay(attempt, retry_after)
+                        logger.warning(f"{family} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+                finally:
+                    # Non-retryable errors, cancellation and an abandoned stream (GeneratorExit)
+                    # record no outcome; a half-open probe must not stay taken forever
+                    if not recorded:
+                        breaker.release_probe()
+                    _call_outcome.set(None)
+
+        raise llm_resilience.LLMUnavailableError(
+            f"LLM providers unavailable: {last_error or 'all circuits open'}", retry_after=retry_after
+        ) from last_error
+
+    async def ask(self, question: str, system_prompt: str) -> str:
+        return await self._call("ask", question, system_prompt)
+
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
+        return await self._call("send_messages", messages, system_prompt, tools=tools, tool_choice=tool_choice)
+
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        async for snapshot in self._attempts("stream_tool_input", messages, system_prompt, stream=True,
+                                             tools=tools, tool_choice=tool_choice):
+            yield snapshot
+
+
+class CachedLLMClient(LLMClient):
+    """
+    Serves repeated requests from the response cache, keyed on (model, system prompt, messages, tools).
+
+    Only for calls whose answer may be reused (summaries, /ask); streaming passes through.
+    """
+    def __init__(self, client: LLMClient, cache: response_cache.ResponseCache):
+        self.token_tracker = client.token_tracker
+        self.client = client
+        self.cache = cache
+
+    @property
+    def model_name(self) -> str:
+        return self.client.model_name
+
+    async def _cached(self, key: str, call) -> str:
+        # The persistent tier is a blocking network call
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+        response = await call()
+        await asyncio.to_thread(self.cache.put, key, response)
+        return response
+
+    async def ask(self, question: str, system_prompt: str) -> str:
+        key = response_cache.cache_key(self.model_name, system_prompt, [{"role": "user", "content": question}])
+        return await self._cached(key, lambda: self.client.ask(question, system_prompt))
+
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
+        key = response_cache.cache_key(self.model_name, system_prompt, messages, tools, tool_choice)
+        return await self._cached(
+            key, lambda: self.client.send_messages(messages, system_prompt, tools=tools, tool_choice=tool_choice)
+        )
+
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        async for snapshot in self.client.stream_tool_input(messages, system_prompt, tools, tool_choice):
+            yield snapshot
+
+
+_providers: dict[str, LLMClient] = {}
+_clients: dict[str, LLMClient] = {}
+_routed_clients: dict[str, LLMClient] = {}
+_cached_clients: dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def create_client(llm_family: LLMFamily) -> LLMClient:
     """Factory function to create appropriate LLM client
 
     Args:
-        system_prompt: System prompt for the model
-        llm_family: "anthropic" or "bedrock"
+        llm_family: "anthropic", "bedrock" or "replay" (recorded responses, see replay)
     """
+    # Imported here: replay builds on this module
+    from app.clients import replay
+
     if llm_family == "anthropic":
-        return AnthropicClient(system_prompt)
+        client = AnthropicClient()
     elif llm_family == "bedrock":
-        return BedrockClaudeClient(system_prompt)
+        client = BedrockClaudeClient()
+    elif llm_family == "replay":
+        return replay.ReplayLLMClient()
     else:
-        raise ValueError(f"Unsupported LLM client type: {config.llm_client_type}")
+        raise ValueError(f"Unsupported LLM client type: {llm_family}")
+
+    if config.llm_record_path:
+        return replay.RecordingLLMClient(client, replay.get_recording(config.llm_record_path))
+    return client
+
+
+def _fallback_family(llm_family: LLMFamily) -> LLMFamily | None:
+    # Replayed runs never reach a provider
+    if llm_family == "replay":
+        return None
+    fallback = config.llm_fallback_type or ("bedrock" if llm_family == "anthropic" else "anthropic")
+    return None if fallback in ("none", llm_family) else fallback
+
+
+def _get_provider(llm_family: LLMFamily) -> LLMClient:
+    """Transport client of a family; the caller holds _clients_lock"""
+    if llm_family not in _providers:
+        _providers[llm_family] = create_client(llm_family)
+    return _providers[llm_family]
+
+
+def get_client(llm_family: LLMFamily = None) -> LLMClient:
+    """Process-level registry: one client (and connection pool) per family, reused across requests
+
+    The returned client retries and fails over to the other family (see ResilientLLMClient).
+
+    Args:
+        llm_family: "anthropic" or "bedrock", defaults to LLM_CLIENT_TYPE
+    """
+    llm_family = llm_family or config.llm_client_type
+
+    if llm_family not in _clients:
+        with _clients_lock:
+            if llm_family not in _clients:
+                fallback_family = _fallback_family(llm_family)
+                _clients[llm_family] = ResilientLLMClient(
+                    llm_family, _get_provider(llm_family),
+                    fallback_family, _get_provider(fallback_family) if fallback_family else None,
+                )
+    return _clients[llm_family]
+
+
+def get_routed_client(route_name: model_routing.RouteName) -> LLMClient:
+    """Client for a call site: the route's provider, model and max_tokens, failing over like get_client()"""
+    if route_name not in _routed_clients:
+        route = model_routing.get_route(route_name)
+        with _clients_lock:
+            if route_name not in _routed_clients:
+                fallback_family = _fallback_family(route.provider)
+                fallback = None
+                if fallback_family:
+                    fallback = _get_provider(fallback_family).bind(route.model_for(fallback_family), route.max_tokens)
+                _routed_clients[route_name] = ResilientLLMClient(
+                    route.provider,
+                    _get_provider(route.provider).bind(route.model_for(route.provider), route.max_tokens),
+                    fallback_family, fallback,
+                    route=route_name,
+                )
+    return _routed_clients[route_name]
+
+
+def get_cached_client(route_name: model_routing.RouteName) -> LLMClient:
+    """get_routed_client() behind the shared response cache, for calls whose answers may be reused"""
+    if route_name not in _cached_clients:
+        client = get_routed_client(route_name)
+        with _clients_lock:
+            if route_name not in _cached_clients:
+                _cached_clients[route_name] = CachedLLMClient(client, response_cache.get_response_cache())
+    return _cached_clients[route_name]
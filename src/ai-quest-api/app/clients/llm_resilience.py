@@ -0,0 +1,156 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import anthropic
+from botocore.exceptions import ClientError, ConnectionClosedError, EndpointConnectionError, ReadTimeoutError
+
+from app.clients import config
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+# https://docs.aws.amazon.com/bedrock/latest/APIReference/API_runtime_InvokeModel.html#API_runtime_InvokeModel_Errors
+_BEDROCK_THROTTLING_CODES = {"ThrottlingException", "ServiceQuotaExceededException"}
+_BEDROCK_TRANSIENT_CODES = {"ServiceUnavailableException", "ModelNotReadyException", "InternalServerException",
+                            "ModelTimeoutException"}
+# https://docs.anthropic.com/en/api/errors: 529 is "overloaded"
+_ANTHROPIC_THROTTLING_STATUSES = {429, 529}
+
+
+class LLMUnavailableError(Exception):
+    """Every provider failed or has its circuit open; the request may be retried later"""
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_throttled(e: Exception) -> bool:
+    """The provider is shedding load: better served by another provider than by waiting"""
+    if isinstance(e, anthropic.APIStatusError):
+        return e.status_code in _ANTHROPIC_THROTTLING_STATUSES
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code") in _BEDROCK_THROTTLING_CODES
+    return False
+
+
+def is_retryable(e: Exception) -> bool:
+    """Throttling, timeouts, connection failures and 5xx; client errors (4xx) are not"""
+    if is_throttled(e):
+        return True
+    if isinstance(e, anthropic.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(e, anthropic.APIStatusError):
+        return e.status_code in (408, 409) or e.status_code >= 500
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code") in _BEDROCK_TRANSIENT_CODES
+    return isinstance(e, (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError))
+
+
+def retry_after(e: Exception) -> float | None:
+    """Seconds the provider asked us to wait (retry-after-ms / retry-after headers), if any"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None and isinstance(e, ClientError):
+        headers = e.response.get("ResponseMetadata", {}).get("HTTPHeaders")
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP-date form
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after_seconds: float | None = None) -> float:
+    """
+    Full-jitter exponential backoff for the given (1-based) failed attempt.
+
+    A retry-after from the provider is a lower bound; everything is capped at LLM_BACKOFF_MAX_SECONDS.
+    """
+    delay = random.uniform(0, config.llm_backoff_base_seconds * 2 ** (attempt - 1))
+    if retry_after_seconds is not None:
+        delay = max(delay, retry_after_seconds)
+    return min(delay, config.llm_backoff_max_seconds)
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker: opens after `failure_threshold` consecutive retryable failures,
+    lets one probe call through after `reset_seconds` (half-open), closes on success.
+    """
+    def __init__(self, name: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.llm_circuit_failure_threshold
+        self.reset_seconds = reset_seconds or config.llm_circuit_reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def remaining_open_seconds(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """End a probe without an outcome (non-retryable error, cancelled or abandoned call)"""
+        with self._lock:
+            self._probing = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-level breaker per provider, shared by every client using it"""
+    if name not in _breakers:
+        with _breakers_lock:
+            if name not in _breakers:
+                _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
@@ -0,0 +1,81 @@
+"""
+Per-call-site model routing
+
+Each call site picks its provider, model (per provider, for failover) and max_tokens here instead
+of sharing one global model. Every field can be overridden per environment, e.g.
+
+    LLM_ROUTE_SUMMARIZE_CHAPTER_ANTHROPIC_MODEL=claude-haiku-4-5-20251001
+    LLM_ROUTE_DM_TURN_MAX_TOKENS=1500
+    LLM_ROUTE_ASK_PROVIDER=bedrock
+"""
+from dataclasses import dataclass, replace
+import os
+from typing import Literal
+
+from app.clients import config
+
+config = config.Config()
+
+RouteName = Literal["dm.turn", "dm.intro", "summarize.chapter", "ask"]
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    anthropic_model: str
+    bedrock_model: str
+    max_tokens: int
+
+    def model_for(self, llm_family: str) -> str:
+        return self.bedrock_model if llm_family == "bedrock" else self.anthropic_model
+
+
+# The DM keeps ANTHROPIC_MODEL / ANTHROPIC_MAX_TOKENS as its defaults; summaries are short and
+# formulaic, so they run on the cheapest, fastest model
+ROUTES: dict[str, Route] = {
+    "dm.turn": Route(
+        provider=config.llm_client_type,
+        anthropic_model=config.anthropic_model,
+        bedrock_model="anthropic.claude-3-5-sonnet-20241022-v2:0",
+        max_tokens=config.anthropic_max_tokens,
+    ),
+    "dm.intro": Route(
+        provider=config.llm_client_type,
+        anthropic_model=config.anthropic_model,
+        bedrock_model="anthropic.claude-3-5-sonnet-20241022-v2:0",
+        max_tokens=config.anthropic_max_tokens,
+    ),
+    "summarize.chapter": Route(
+        provider=config.llm_client_type,
+        anthropic_model="claude-3-5-haiku-20241022",
+        bedrock_model="anthropic.claude-3-5-haiku-20241022-v1:0",
+        max_tokens=512,
+    ),
+    "ask": Route(
+        provider=config.llm_client_type,
+        anthropic_model="claude-sonnet-4-20250514",
+        bedrock_model="anthropic.claude-3-5-sonnet-20241022-v2:0",
+        max_tokens=config.anthropic_max_tokens,
+    ),
+}
+
+
+def _env_prefix(route_name: str) -> str:
+    return "LLM_ROUTE_" + route_name.upper().replace(".", "_") + "_"
+
+
+def get_route(route_name: RouteName) -> Route:
+    """The route's defaults with LLM_ROUTE_<NAME>_<FIELD> environment overrides applied"""
+    if route_name not in ROUTES:
+        raise ValueError(f"Unknown LLM route: {route_name}")
+
+    prefix = _env_prefix(route_name)
+    overrides = {}
+    for field in ("provider", "anthropic_model", "bedrock_model"):
+        value = os.environ.get(prefix + field.upper())
+        if value:
+            overrides[field] = value
+    max_tokens = os.environ.get(prefix + "MAX_TOKENS")
+    if max_tokens:
+        overrides["max_tokens"] = int(max_tokens)
+    return replace(ROUTES[route_name], **overrides)
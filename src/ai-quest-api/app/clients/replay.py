@@ -0,0 +1,261 @@
+"""
+Record/replay LLM backend for deterministic local runs and load tests
+
+LLM_CLIENT_TYPE=replay serves DM turns, summaries and /ask from a recording instead of a provider,
+after a latency drawn from REPLAY_LLM_LATENCY; the memory store then replays embeddings too
+(see ReplayMemoryStore). Nothing leaves the process, so what is measured is the API's own overhead.
+
+Recordings are JSON lines, written while running against live providers with
+LLM_RECORD_PATH=recording.jsonl and replayed with LLM_REPLAY_PATH=recording.jsonl:
+
+    {"kind": "send_messages", "key": "<request hash>", "value": "{\"narration\": ...}"}
+    {"kind": "ask", "key": "<request hash>", "value": "..."}
+    {"kind": "embedding", "key": "<text hash>", "value": [0.01, ...]}
+
+A request recorded verbatim replays its own response; any other request gets the recorded
+responses of its kind in turn, so a short recording drives any number of turns. Without a
+recording, responses are synthesized from the tool schema.
+
+Latencies are given in milliseconds: "fixed:800", "uniform:200,1200" or "lognormal:1500,0.4"
+(median and sigma). REPLAY_SEED makes the drawn latencies repeatable.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator
+
+from app.clients import config
+from app.clients import response_cache
+from app.clients.llm_client import LLMClient
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+REPLAY_MODEL = "replay"
+# Snapshots yielded by a replayed stream, spread over the drawn latency
+STREAM_CHUNKS = 8
+
+_rng = random.Random(config.replay_seed)
+_rng_lock = threading.Lock()
+
+
+class Latency:
+    """A latency distribution, sampled in seconds"""
+    KINDS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, kind: str, params: tuple[float, ...]):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unsupported latency distribution: {kind}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Latency':
+        kind, _, params = spec.partition(":")
+        try:
+            return cls(kind.strip(), tuple(float(param) for param in params.split(",") if param.strip()))
+        except ValueError:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+
+    def sample(self) -> float:
+        with _rng_lock:
+            if self.kind == "fixed":
+                milliseconds = self.params[0]
+            elif self.kind == "uniform":
+                milliseconds = _rng.uniform(self.params[0], self.params[1])
+            else:
+                milliseconds = _rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        return max(0.0, milliseconds) / 1000
+
+
+def request_key(system_prompt: str, messages: list[dict], tools: list[dict] = None,
+                tool_choice: dict = None) -> str:
+    """Model-independent request hash, so a recording replays under any route"""
+    return response_cache.cache_key(REPLAY_MODEL, system_prompt, messages, tools, tool_choice)
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Recording:
+    """Recorded responses by kind and request hash, appended to a JSON lines file"""
+    def __init__(self, path: str = None):
+        self.path = path
+        self._by_key: dict[tuple[str, str], Any] = {}
+        self._by_kind: dict[str, list] = defaultdict(list)
+        self._cursors: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._index(entry["kind"], entry["key"], entry["value"])
+            logger.info(f"Loaded {len(self._by_key)} recorded responses from {path}")
+
+    def _index(self, kind: str, key: str, value) -> None:
+        if (kind, key) not in self._by_key:
+            self._by_kind[kind].append(value)
+        self._by_key[(kind, key)] = value
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def add(self, kind: str, key: str, value) -> None:
+        with self._lock:
+            self._index(kind, key, value)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"kind": kind, "key": key, "value": value}, ensure_ascii=False) + "\n")
+
+    def get(self, kind: str, key: str):
+        """The response recorded for exactly this request, or None"""
+        return self._by_key.get((kind, key))
+
+    def next(self, kind: str):
+        """Recorded responses of a kind in turn (round robin), None when there are none"""
+        with self._lock:
+            values = self._by_kind.get(kind)
+            if not values:
+                return None
+            value = values[self._cursors[kind] % len(values)]
+            self._cursors[kind] += 1
+            return value
+
+
+_recordings: dict[str | None, Recording] = {}
+_recordings_lock = threading.Lock()
+
+
+def get_recording(path: str = None) -> Recording:
+    """One recording per file per process (None: in memory only)"""
+    if path not in _recordings:
+        with _recordings_lock:
+            if path not in _recordings:
+                _recordings[path] = Recording(path)
+    return _recordings[path]
+
+
+def synthesize(schema: dict, hint: str) -> Any:
+    """A value satisfying a tool input schema, derived from the last user message"""
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: synthesize(prop, f"{name} ({hint})") for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        count = max(schema.get("minItems", 3), 1)
+        return [synthesize(schema.get("items", {}), f"{hint} #{i + 1}") for i in range(count)]
+    if schema_type in ("integer", "number"):
+        return 0
+    if schema_type == "boolean":
+        return False
+    return f"Replayed {hint}"
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    content = messages[-1]["content"] if messages else ""
+    if isinstance(content, list):
+        content = " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content[:80]
+
+
+class ReplayLLMClient(LLMClient):
+    """
+    Serves recorded responses after a sampled latency. Usage is not tracked: nothing is billed,
+    and token tracking must not reach DynamoDB from a laptop.
+    """
+    def __init__(self, recording: Recording = None, latency: Latency = None):
+        self.token_tracker = None
+        self.recording = recording or get_recording(config.llm_replay_path)
+        self.latency = latency or Latency.parse(config.replay_llm_latency)
+        self.model = REPLAY_MODEL
+        self.max_tokens = config.anthropic_max_tokens
+
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    def bind(self, model: str, max_tokens: int) -> 'ReplayLLMClient':
+        bound = copy.copy(self)
+        bound.model = model
+        bound.max_tokens = max_tokens
+        return bound
+
+    def _replay(self, kind: str, key: str):
+        return self.recording.get(kind, key) or self.recording.next(kind)
+
+    async def ask(self, question: str, system_prompt: str) -> str:
+        await asyncio.sleep(self.latency.sample())
+        response = self._replay("ask", request_key(system_prompt, [{"role": "user", "content": question}]))
+        return response if response is not None else f"Replayed answer to: {question[:80]}"
+
+    def _tool_response(self, messages: list[dict], system_prompt: str, tools: list[dict] | None,
+                       tool_choice: dict | None) -> str:
+        response = self._replay("send_messages", request_key(system_prompt, messages, tools, tool_choice))
+        if response is not None:
+            return response
+        if tools:
+            return json.dumps(synthesize(tools[-1]["input_schema"], _last_user_text(messages)))
+        return f"Replayed response to: {_last_user_text(messages)}"
+
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
+        await asyncio.sleep(self.latency.sample())
+        return self._tool_response(messages, system_prompt, tools, tool_choice)
+
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        """Growing snapshots of the replayed input: string fields are revealed in STREAM_CHUNKS steps"""
+        tool_input = json.loads(self._tool_response(messages, system_prompt, tools, tool_choice))
+        step_seconds = self.latency.sample() / STREAM_CHUNKS
+        for chunk in range(1, STREAM_CHUNKS):
+            await asyncio.sleep(step_seconds)
+            yield {
+                name: value[:len(value) * chunk // STREAM_CHUNKS] if isinstance(value, str) else value
+                for name, value in tool_input.items()
+            }
+        await asyncio.sleep(step_seconds)
+        yield tool_input
+
+
+class RecordingLLMClient(LLMClient):
+    """Passes calls to a live client and records its responses for later replay"""
+    def __init__(self, client: LLMClient, recording: Recording):
+        self.client = client
+        self.recording = recording
+        self.token_tracker = client.token_tracker
+
+    @property
+    def model_name(self) -> str:
+        return self.client.model_name
+
+    def bind(self, model: str, max_tokens: int) -> 'RecordingLLMClient':
+        return RecordingLLMClient(self.client.bind(model, max_tokens), self.recording)
+
+    async def ask(self, question: str, system_prompt: str) -> str:
+        response = await self.client.ask(question, system_prompt)
+        self.recording.add("ask", request_key(system_prompt, [{"role": "user", "content": question}]), response)
+        return response
+
+    async def send_messages(self, messages: list[dict], system_prompt: str, tools: list[dict] = None,
+                            tool_choice: dict = None) -> str:
+        response = await self.client.send_messages(messages, system_prompt, tools=tools, tool_choice=tool_choice)
+        self.recording.add("send_messages", request_key(system_prompt, messages, tools, tool_choice), response)
+        return response
+
+    async def stream_tool_input(self, messages: list[dict], system_prompt: str, tools: list[dict],
+                                tool_choice: dict) -> AsyncIterator[dict]:
+        snapshot = None
+        async for snapshot in self.client.stream_tool_input(messages, system_prompt, tools, tool_choice):
+            yield snapshot
+        # Streamed and non-streamed turns send the same request, so they share recordings
+        self.recording.add("send_messages", request_key(system_prompt, messages, tools, tool_choice),
+                           json.dumps(snapshot))
@@ -0,0 +1,227 @@
+"""
+Content-addressed cache for deterministic LLM calls
+
+Responses are keyed on a hash of everything that determines them (model, system prompt,
+messages, tools), looked up in an in-process LRU first and a shared persistent tier second.
+"""
+from abc import ABC, abstractmethod
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import boto3
+
+from app.clients import config
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+
+def cache_key(model: str, system_prompt: str, messages: list[dict], tools: list[dict] = None,
+              tool_choice: dict = None) -> str:
+    """sha256 of the canonical JSON of the request; dict key order does not matter"""
+    payload = json.dumps(
+        {"model": model, "system": system_prompt, "messages": messages, "tools": tools, "tool_choice": tool_choice},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseStore(ABC):
+    """One cache tier; failures must surface as misses, never as failed LLM calls"""
+    name: str
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, value: str, ttl_seconds: int) -> None:
+        pass
+
+
+class LRUResponseStore(ResponseStore):
+    """Per-process tier, bounded by entry count; expired entries are dropped on read"""
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: collections.OrderedDict[str, tuple[float, str]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, ttl_seconds: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DynamoDBResponseStore(ResponseStore):
+    """
+    Shared tier in DynamoDB
+
+    Table Schema:
+    - Partition Key: cache_key
+    - TTL attribute: ttl (DynamoDB deletes lazily, so expiry is also checked on read)
+    """
+    name = "dynamodb"
+
+    def __init__(self, table_name: str = None):
+        dynamodb = boto3.resource('dynamodb', endpoint_url=config.dynamodb_endpoint_url)
+        self.table_name = table_name or config.response_cache_table
+        self.table = dynamodb.Table(self.table_name)
+
+    def get(self, key: str) -> str | None:
+        try:
+            item = self.table.get_item(Key={"cache_key": key}).get("Item")
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+        if item is None or int(item["ttl"]) <= time.time():
+            return None
+        return item["response"]
+
+    def put(self, key: str, value: str, ttl_seconds: int) -> None:
+        try:
+            self.table.put_item(Item={
+                "cache_key": key,
+                "response": value,
+                "ttl": int(time.time() + ttl_seconds),
+            })
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+
+class SQLiteResponseStore(ResponseStore):
+    """Local stand-in for the shared tier (development, tests), bounded by entry count"""
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "cache_key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT response FROM response_cache WHERE cache_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE response_cache SET used_at = ? WHERE cache_key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str, ttl_seconds: int) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO response_cache (cache_key, response, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds, now),
+            )
+            # Evict expired entries first, then the least recently used beyond the bound
+            self._connection.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            self._connection.execute(
+                "DELETE FROM response_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM response_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class ResponseCache:
+    """Read-through tiers, fastest first: a hit in a slower tier is copied into the faster ones"""
+    def __init__(self, tiers: list[ResponseStore], ttl_seconds: int):
+        self.tiers = tiers
+        self.ttl_seconds = ttl_seconds
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> str | None:
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                self._count(f"hits_{tier.name}")
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.put(key, value, self.ttl_seconds)
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        self._count("puts")
+        for tier in self.tiers:
+            tier.put(key, value, self.ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        hits = sum(count for name, count in stats.items() if name.startswith("hits_"))
+        lookups = hits + stats.get("misses", 0)
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+_shared_cache: ResponseCache | None = None
+_shared_cache_lock = threading.Lock()
+
+
+def create_response_cache(backend: str = None) -> ResponseCache:
+    """
+    Args:
+        backend: persistent tier, "dynamodb", "sqlite" or "memory" (LRU only),
+            defaults to RESPONSE_CACHE_BACKEND
+    """
+    backend = backend or config.response_cache_backend
+    tiers: list[ResponseStore] = [LRUResponseStore(config.response_cache_max_entries)]
+
+    if backend == "dynamodb":
+        tiers.append(DynamoDBResponseStore())
+    elif backend == "sqlite":
+        path = config.response_cache_sqlite_path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tiers.append(SQLiteResponseStore(path, config.response_cache_sqlite_max_entries))
+    elif backend != "memory":
+        raise ValueError(f"Unsupported response cache backend: {backend}")
+
+    return ResponseCache(tiers, config.response_cache_ttl_seconds)
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache, so the LRU tier and counters are shared by every caller"""
+    global _shared_cache
+
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = create_response_cache()
+    return _shared_cache
@@ -1,10 +1,25 @@
 """
 Token Tracking for Anthropic and AWS Bedrock
 Includes DynamoDB tracking, and accurate pricing
+
+Usage items are written behind: track_usage only buffers the item, and a background thread
+writes the buffer with BatchWriteItem once a batch is full or every flush interval. Lambda
+freezes the process between invocations, so handlers call flush_token_tracker() before
+returning; it also runs at interpreter exit.
+
+Alongside the per-request items, the same table holds rollups maintained with atomic
+UpdateItem ADD counters, so summaries read one small item per day instead of every request:
+
+- per service, day and model: service_date "rollup#<service>", sort key "<date>#<model>"
+- per user and day: service_date "rollup#user#<user_id>", sort key "<date>"
 """
+import atexit
+import collections
+import contextvars
 import json
 import logging
 import datetime
+import threading
 from decimal import Decimal
 import uuid
 import os
@@ -15,6 +30,58 @@ from app.clients import config
 logger = logging.getLogger(__name__)
 config = config.Config()
 
+# Prompt caching: writes cost 25% more than base input tokens, reads 10% of it
+# https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching#pricing
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+# Message Batches API: every token is billed at half price
+# https://docs.anthropic.com/en/docs/build-with-claude/batch-processing#pricing
+BATCH_MULTIPLIER = 0.5
+# https://docs.aws.amazon.com/bedrock/latest/userguide/inference-profiles-support.html
+CROSS_REGION_PREFIXES = ('eu', 'us', 'apac', 'global')
+# BatchWriteItem limit
+BATCH_WRITE_MAX_ITEMS = 25
+ROLLUP_PREFIX = 'rollup#'
+# Counters added to rollup items; 'requests' counts the items rolled up
+ROLLUP_COUNTERS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens',
+                   'total_tokens', 'estimated_cost_usd', 'requests')
+
+_shared_tracker = None
+_shared_tracker_lock = threading.Lock()
+
+# Set per request by the rate limiter, so usage is attributed without threading the user through every client
+current_user_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("token_usage_user_id", default=None)
+
+
+def user_rollup_key(user_id: str, date: str) -> dict:
+    """Key of a user's daily usage rollup"""
+    return {'service_date': f"{ROLLUP_PREFIX}user#{user_id}", 'timestamp_request_id': date}
+
+
+def get_token_tracker() -> 'DynamoDBTokenTracker':
+    """Process-wide tracker, so every LLM client and memory store shares one boto3 resource"""
+    global _shared_tracker
+
+    if _shared_tracker is None:
+        with _shared_tracker_lock:
+            if _shared_tracker is None:
+                _shared_tracker = DynamoDBTokenTracker()
+    return _shared_tracker
+
+
+def flush_token_tracker(timeout: float = None) -> None:
+    """Write buffered usage now (end of a Lambda invocation, shutdown); no-op when nothing was tracked"""
+    if _shared_tracker is not None:
+        _shared_tracker.flush(timeout)
+
+
+atexit.register(flush_token_tracker)
+
+
+def get_tracking_stats() -> dict | None:
+    """Counters of the shared tracker, None before anything was tracked"""
+    return _shared_tracker.stats() if _shared_tracker is not None else None
+
 
 class DynamoDBTokenTracker:
     """
@@ -26,17 +93,139 @@ class DynamoDBTokenTracker:
     - GSI: model_index with model as partition key for model-specific queries
     """
 
-    def __init__(self, table_name: str = None):
+    def __init__(self, table_name: str = None, buffer_size: int = None, flush_interval_seconds: float = None):
         # Initialize AWS client
-        dynamodb = boto3.resource('dynamodb')
+        dynamodb = boto3.resource('dynamodb', endpoint_url=config.dynamodb_endpoint_url)
 
         self.table_name = table_name or os.environ.get('TOKEN_TRACKING_TABLE', 'llm-token-usage')
         self.table = dynamodb.Table(self.table_name)
 
+        self.buffer_size = buffer_size or config.token_tracking_buffer_size
+        self.flush_interval_seconds = flush_interval_seconds or config.token_tracking_flush_interval_seconds
+        self._buffer: collections.deque[dict] = collections.deque()
+        self._buffer_changed = threading.Condition()
+        # Held while a batch is written, so a flush() returns only once earlier batches are done
+        self._write_lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self._counters = {'tracked': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'rollups_failed': 0}
+
+    def stats(self) -> dict:
+        with self._buffer_changed:
+            return {**self._counters, 'buffered': len(self._buffer)}
+
+    def _enqueue(self, item: dict) -> None:
+        with self._buffer_changed:
+            self._counters['tracked'] += 1
+            # Tracking must never hold up a turn: when writes fall behind, new items are dropped
+            if len(self._buffer) >= self.buffer_size:
+                self._counters['dropped'] += 1
+                logger.warning(f"Token usage buffer full ({self.buffer_size}), dropped usage of {item['model']}")
+                return
+            self._buffer.append(item)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name="token-tracker", daemon=True)
+                self._worker.start()
+            if len(self._buffer) >= BATCH_WRITE_MAX_ITEMS:
+                self._buffer_changed.notify()
+
+    def _take(self, max_items: int) -> list[dict]:
+        """Pop up to max_items buffered items; the caller holds _buffer_changed"""
+        return [self._buffer.popleft() for _ in range(min(max_items, len(self._buffer)))]
+
+    def _run_worker(self) -> None:
+        while True:
+            with self._buffer_changed:
+                if len(self._buffer) < BATCH_WRITE_MAX_ITEMS:
+                    self._buffer_changed.wait(self.flush_interval_seconds)
+            self._write_pending()
+
+    def _write_pending(self, timeout: float = None) -> None:
+        if not self._write_lock.acquire(timeout=-1 if timeout is None else timeout):
+            logger.warning("Timed out waiting for token usage to be written")
+            return
+        try:
+            while True:
+                with self._buffer_changed:
+                    items = self._take(BATCH_WRITE_MAX_ITEMS)
+                if not items:
+                    return
+                # Rollups only count what the raw items record, so they never get ahead of them
+                if self._write_batch(items):
+                    self._update_rollups(items)
+        finally:
+            self._write_lock.release()
+
+    def _write_batch(self, items: list[dict]) -> bool:
+        """Write one batch; False when it failed (its items are counted as failed, not retried)"""
+        try:
+            # batch_writer resends unprocessed items
+            with self.table.batch_writer() as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+            written, failed = len(items), 0
+            logger.debug(f"Wrote {len(items)} token usage items")
+        except Exception as e:
+            # Don't let tracking failures break the main flow
+            written, failed = 0, len(items)
+            logger.error(f"Failed to write {len(items)} token usage items: {e}", exc_info=True)
+        with self._buffer_changed:
+            self._counters['written'] += written
+            self._counters['failed'] += failed
+        return not failed
+
+    @staticmethod
+    def _rollup_keys(item: dict) -> list[tuple[str, str, dict]]:
+        """(service_date, sort key, identifying attributes) of the rollups an item counts towards"""
+        keys = [(f"{ROLLUP_PREFIX}{item['service']}", f"{item['date']}#{item['model']}",
+                 {'date': item['date'], 'model': item['model']})]
+        if item.get('user_id'):
+            user_key = user_rollup_key(item['user_id'], item['date'])
+            keys.append((user_key['service_date'], user_key['timestamp_request_id'], {'date': item['date']}))
+        return keys
+
+    def _update_rollups(self, items: list[dict]) -> None:
+        """Add a batch to its rollups, one UpdateItem per rollup touched"""
+        rollups: dict[tuple[str, str], tuple[dict, dict]] = {}
+        for item in items:
+            for partition, sort_key, attributes in self._rollup_keys(item):
+                _, counters = rollups.setdefault((partition, sort_key), (attributes, dict.fromkeys(ROLLUP_COUNTERS, 0)))
+                for counter in ROLLUP_COUNTERS:
+                    counters[counter] += 1 if counter == 'requests' else item.get(counter, 0)
+
+        failed = 0
+        for (partition, sort_key), (attributes, counters) in rollups.items():
+            names = {f"#{name}": name for name in (*counters, *attributes)}
+            values = {f":{name}": value for name, value in (*counters.items(), *attributes.items())}
+            try:
+                # ADD is atomic and creates missing counters, so concurrent containers never lose updates
+                self.table.update_item(
+                    Key={'service_date': partition, 'timestamp_request_id': sort_key},
+                    UpdateExpression="ADD " + ", ".join(f"#{name} :{name}" for name in counters) +
+                                     " SET " + ", ".join(f"#{name} = :{name}" for name in attributes),
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values,
+                )
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to update usage rollup {partition}/{sort_key}: {e}", exc_info=True)
+        if failed:
+            with self._buffer_changed:
+                self._counters['rollups_failed'] += failed
+
+    def flush(self, timeout: float = None) -> None:
+        """Write everything buffered so far, in the calling thread"""
+        self._write_pending(timeout)
+
     def track_usage(self, service: str, model: str, input_tokens: int,
                     output_tokens: int, metadata: dict = None,
-                    request_id: str = None, user_id: str = None) -> dict:
-        """Store token usage in DynamoDB with enhanced metadata"""
+                    request_id: str = None, user_id: str = None,
+                    cache_creation_input_tokens: int = 0, cache_read_input_tokens: int = 0,
+                    batch: bool = False) -> dict:
+        """Buffer a token usage item for DynamoDB, with enhanced metadata
+
+        input_tokens excludes prompt tokens written to or read from the prompt cache,
+        which are counted (and priced) separately.
+        """
 
         now = datetime.datetime.now(datetime.UTC)
         date_str = now.strftime('%Y-%m-%d')
@@ -47,8 +236,9 @@ class DynamoDBTokenTracker:
             request_id = str(uuid.uuid4())[:8]
 
         # Calculate cost
-        estimated_cost = self._calculate_cost(service, model, input_tokens, output_tokens)
-        total_tokens = input_tokens + output_tokens
+        estimated_cost = self._calculate_cost(service, model, input_tokens, output_tokens,
+                                              cache_creation_input_tokens, cache_read_input_tokens, batch)
+        total_tokens = input_tokens + output_tokens + cache_creation_input_tokens + cache_read_input_tokens
 
         item = {
             'service_date': f"{service}#{date_str}",
@@ -57,6 +247,8 @@ class DynamoDBTokenTracker:
             'model': model,
             'input_tokens': input_tokens,
             'output_tokens': output_tokens,
+            'cache_creation_input_tokens': cache_creation_input_tokens,
+            'cache_read_input_tokens': cache_read_input_tokens,
             'total_tokens': total_tokens,
             'timestamp': timestamp,
             'date': date_str,
@@ -68,6 +260,7 @@ class DynamoDBTokenTracker:
         }
 
         # Add optional fields
+        user_id = user_id or current_user_id.get()
         if user_id:
             item['user_id'] = user_id
 
@@ -76,20 +269,23 @@ class DynamoDBTokenTracker:
             item['lambda_function'] = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
             item['lambda_request_id'] = os.environ.get('AWS_REQUEST_ID', 'unknown')
 
-        try:
-            self.table.put_item(Item=item)
-            logger.info(f"Tracked {total_tokens} tokens for {service}/{model}, cost: ${estimated_cost}")
-        except Exception as e:
-            # Don't let tracking failures break the main flow
-            logger.error(f"Failed to track token usage: {e}", exc_info=True)
+        self._enqueue(item)
+        logger.info(f"Tracked {total_tokens} tokens for {service}/{model}, cost: ${estimated_cost}")
 
         return item
 
-    def _calculate_cost(self, service: str, model: str, input_tokens: int, output_tokens: int) -> Decimal:
+    def estimate_cost(self, service: str, model: str, input_tokens: int, output_tokens: int) -> Decimal:
+        """Cost of a prospective call, e.g. to decide whether it is worth making"""
+        return self._calculate_cost(service, model, input_tokens, output_tokens)
+
+    def _calculate_cost(self, service: str, model: str, input_tokens: int, output_tokens: int,
+                        cache_creation_input_tokens: int = 0, cache_read_input_tokens: int = 0,
+                        batch: bool = False) -> Decimal:
         """Calculate estimated cost based on current pricing (January 2025)
 
         Pricing is identical for Anthropic models whether using direct API or AWS Bedrock.
-        All prices are in USD per million tokens.
+        All prices are in USD per million tokens; cache writes and reads are priced
+        relative to the model's input rate.
         AWS Bedrock Frankfurt (eu-central-1) pricing.
         https://aws.amazon.com/bedrock/pricing/
         """
@@ -97,15 +293,21 @@ class DynamoDBTokenTracker:
         # Current pricing as of January 2025 - Frankfurt region
         pricing = {
             'anthropic': {
+                # Claude 4.5 family
+                'claude-opus-4-5-20251101': {'input': 5.00, 'output': 25.00},
+                'claude-sonnet-4-5-20250929': {'input': 3.00, 'output': 15.00},
+                'claude-haiku-4-5-20251001': {'input': 1.00, 'output': 5.00},
+
                 # Claude 4 family
                 'claude-opus-4-1-20250805': {'input': 15.00, 'output': 75.00},
-                'claude-opus-4-20241029': {'input': 15.00, 'output': 75.00},
-                'claude-sonnet-4-20250104': {'input': 3.00, 'output': 15.00},
+                'claude-opus-4-20250514': {'input': 15.00, 'output': 75.00},
+                'claude-sonnet-4-20250514': {'input': 3.00, 'output': 15.00},
 
-                # Claude 3.5 family
-                'claude-3.5-sonnet-20241022': {'input': 3.00, 'output': 15.00},
-                'claude-3.5-sonnet-20240620': {'input': 3.00, 'output': 15.00},
-                'claude-3.5-haiku-20241022': {'input': 0.80, 'output': 4.00},
+                # Claude 3.7 / 3.5 family
+                'claude-3-7-sonnet-20250219': {'input': 3.00, 'output': 15.00},
+                'claude-3-5-sonnet-20241022': {'input': 3.00, 'output': 15.00},
+                'claude-3-5-sonnet-20240620': {'input': 3.00, 'output': 15.00},
+                'claude-3-5-haiku-20241022': {'input': 0.80, 'output': 4.00},
 
                 # Claude 3 family
                 'claude-3-opus-20240229': {'input': 15.00, 'output': 75.00},
@@ -125,10 +327,15 @@ class DynamoDBTokenTracker:
                 'amazon.titan-text-express-v1': {'input': 1.30, 'output': 1.70},
 
                 # Anthropic models via Bedrock (same pricing)
+                'anthropic.claude-opus-4-5-20251101-v1:0': {'input': 5.00, 'output': 25.00},
+                'anthropic.claude-sonnet-4-5-20250929-v1:0': {'input': 3.00, 'output': 15.00},
+                'anthropic.claude-haiku-4-5-20251001-v1:0': {'input': 1.00, 'output': 5.00},
                 'anthropic.claude-opus-4-1-20250805-v1:0': {'input': 15.00, 'output': 75.00},
-                'anthropic.claude-opus-4-20241029-v1:0': {'input': 15.00, 'output': 75.00},
-                'anthropic.claude-sonnet-4-20250104-v1:0': {'input': 3.00, 'output': 15.00},
+                'anthropic.claude-opus-4-20250514-v1:0': {'input': 15.00, 'output': 75.00},
+                'anthropic.claude-sonnet-4-20250514-v1:0': {'input': 3.00, 'output': 15.00},
+                'anthropic.claude-3-7-sonnet-20250219-v1:0': {'input': 3.00, 'output': 15.00},
                 'anthropic.claude-3-5-sonnet-20241022-v2:0': {'input': 3.00, 'output': 15.00},
+                'anthropic.claude-3-5-sonnet-20240620-v1:0': {'input': 3.00, 'output': 15.00},
                 'anthropic.claude-3-5-haiku-20241022-v1:0': {'input': 0.80, 'output': 4.00},
                 'anthropic.claude-3-opus-20240229-v1:0': {'input': 15.00, 'output': 75.00},
                 'anthropic.claude-3-sonnet-20240229-v1:0': {'input': 3.00, 'output': 15.00},
@@ -136,33 +343,49 @@ class DynamoDBTokenTracker:
             }
         }
 
+        # Cross-region inference profiles (eu.anthropic..., us.anthropic...) bill as the base model
+        if service == 'bedrock' and model.split('.', 1)[0] in CROSS_REGION_PREFIXES:
+            model = model.split('.', 1)[1]
+
         if service in pricing and model in pricing[service]:
             rates = pricing[service][model]
             cost = (input_tokens * rates['input'] / 1_000_000) + \
+                   (cache_creation_input_tokens * rates['input'] * CACHE_WRITE_MULTIPLIER / 1_000_000) + \
+                   (cache_read_input_tokens * rates['input'] * CACHE_READ_MULTIPLIER / 1_000_000) + \
                    (output_tokens * rates['output'] / 1_000_000)
+            if batch:
+                cost *= BATCH_MULTIPLIER
             return Decimal(str(round(cost, 6)))
 
         # Log unknown model for debugging
         logger.warning(f"Unknown model for pricing: {service}/{model}")
         return Decimal('0')
 
+    def _query_all(self, **kwargs) -> list[dict]:
+        """All pages of a query (a page stops at 1 MB)"""
+        items = []
+        while True:
+            response = self.table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
     def get_daily_usage(self, service: str, date: str) -> list[dict]:
         """Query usage for a specific service and date"""
 
-        response = self.table.query(
+        return self._query_all(
             KeyConditionExpression='service_date = :service_date',
             ExpressionAttributeValues={
                 ':service_date': f"{service}#{date}"
             }
         )
 
-        return response.get('Items', [])
-
     def get_usage_by_model(self, model: str, start_date: str, end_date: str) -> list[dict]:
         """Query usage for a specific model across date range (requires GSI)"""
 
         try:
-            response = self.table.query(
+            return self._query_all(
                 IndexName='model_index',
                 KeyConditionExpression='model = :model AND #ts BETWEEN :start AND :end',
                 ExpressionAttributeNames={
@@ -174,69 +397,77 @@ class DynamoDBTokenTracker:
                     ':end': end_date
                 }
             )
-            return response.get('Items', [])
         except Exception as e:
             logger.error(f"Error querying by model (GSI might not exist): {e}")
             return []
 
+    def _get_rollups(self, partition: str, start_date: str, end_date: str) -> list[dict]:
+        """Rollup items of a partition whose sort key starts with a date in [start_date, end_date]"""
+        return self._query_all(
+            KeyConditionExpression='service_date = :partition AND timestamp_request_id BETWEEN :start AND :end',
+            ExpressionAttributeValues={
+                ':partition': partition,
+                ':start': start_date,
+                # '~' sorts after '#<model>', so the whole end day is included
+                ':end': f"{end_date}~",
+            }
+        )
+
+    def get_user_usage(self, user_id: str, start_date: str, end_date: str) -> list[dict]:
+        """Daily usage rollups of a user across a date range"""
+        return [
+            {'date': item['date'], **{counter: item.get(counter, 0) for counter in ROLLUP_COUNTERS}}
+            for item in self._get_rollups(f"{ROLLUP_PREFIX}user#{user_id}", start_date, end_date)
+        ]
+
     def get_usage_summary(self, service: str, start_date: str, end_date: str) -> dict:
-        """Get aggregated usage summary for a date range"""
+        """Get aggregated usage summary for a date range, from one query of the daily rollups"""
 
-        total_input = 0
-        total_output = 0
-        total_cost = Decimal('0')
-        request_count = 0
+        totals = dict.fromkeys(ROLLUP_COUNTERS, 0)
         model_breakdown = {}
 
-        # Query each day in the range
-        current = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.datetime.strptime(end_date, '%Y-%m-%d')
-
-        while current <= end:
-            date_str = current.strftime('%Y-%m-%d')
-            daily_usage = self.get_daily_usage(service, date_str)
-
-            for item in daily_usage:
-                input_tokens = item.get('input_tokens', 0)
-                output_tokens = item.get('output_tokens', 0)
-                cost = item.get('estimated_cost_usd', Decimal('0'))
-                model = item.get('model', 'unknown')
-
-                total_input += input_tokens
-                total_output += output_tokens
-                total_cost += cost
-                request_count += 1
-
-                # Track per-model breakdown
-                if model not in model_breakdown:
-                    model_breakdown[model] = {
-                        'input_tokens': 0,
-                        'output_tokens': 0,
-                        'cost': Decimal('0'),
-                        'requests': 0
-                    }
-
-                model_breakdown[model]['input_tokens'] += input_tokens
-                model_breakdown[model]['output_tokens'] += output_tokens
-                model_breakdown[model]['cost'] += cost
-                model_breakdown[model]['requests'] += 1
-
-            current += datetime.timedelta(days=1)
+        for item in self._get_rollups(f"{ROLLUP_PREFIX}{service}", start_date, end_date):
+            model = item.get('model', 'unknown')
+            if model not in model_breakdown:
+                model_breakdown[model] = {
+                    'input_tokens': 0,
+                    'output_tokens': 0,
+                    'cost': Decimal('0'),
+                    'requests': 0
+                }
+            model_breakdown[model]['input_tokens'] += item.get('input_tokens', 0)
+            model_breakdown[model]['output_tokens'] += item.get('output_tokens', 0)
+            model_breakdown[model]['cost'] += item.get('estimated_cost_usd', Decimal('0'))
+            model_breakdown[model]['requests'] += item.get('requests', 0)
+            for counter in ROLLUP_COUNTERS:
+                totals[counter] += item.get(counter, 0)
 
         # Convert Decimal to float for JSON serialization
         for model in model_breakdown:
+            model_breakdown[model]['input_tokens'] = int(model_breakdown[model]['input_tokens'])
+            model_breakdown[model]['output_tokens'] = int(model_breakdown[model]['output_tokens'])
+            model_breakdown[model]['requests'] = int(model_breakdown[model]['requests'])
             model_breakdown[model]['cost'] = float(model_breakdown[model]['cost'])
 
+        total_input = int(totals['input_tokens'])
+        total_output = int(totals['output_tokens'])
+        # As on every usage item: cache writes and reads are tokens of the request too
+        total_tokens = int(totals['total_tokens'])
+        total_cost = Decimal(totals['estimated_cost_usd'])
+        request_count = int(totals['requests'])
+
         return {
             'service': service,
             'start_date': start_date,
             'end_date': end_date,
             'total_input_tokens': total_input,
             'total_output_tokens': total_output,
-            'total_tokens': total_input + total_output,
+            'total_cache_creation_input_tokens': int(totals['cache_creation_input_tokens']),
+            'total_cache_read_input_tokens': int(totals['cache_read_input_tokens']),
+            'total_tokens': total_tokens,
             'estimated_cost_usd': float(total_cost),
             'request_count': request_count,
-            'avg_tokens_per_request': (total_input + total_output) / request_count if request_count > 0 else 0,
+            'avg_tokens_per_request': total_tokens / request_count if request_count > 0 else 0,
             'avg_cost_per_request': float(total_cost / request_count) if request_count > 0 else 0,
             'model_breakdown': model_breakdown
         }
@@ -1,7 +1,7 @@
 import json
 import uuid
 
-from sqlalchemy import Column, BINARY, JSON, Integer, Text
+from sqlalchemy import Column, BINARY, Index, JSON, Integer, Text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -18,7 +18,12 @@ class Chapter(Base):
     outcome = Column(Text, nullable=False)
     summary = Column(Text, nullable=True)
     number = Column(Integer, nullable=False)
-    story_id = Column(BINARY(16), nullable=False, index=True)
+    story_id = Column(BINARY(16), nullable=False)
+
+    __table_args__ = (
+        # Serves keyset pagination over (story_id, number) and guards against duplicate numbers
+        Index('idx_story_id_number', 'story_id', 'number', unique=True),
+    )
 
     @property
     def id_uuid(self) -> uuid.UUID:
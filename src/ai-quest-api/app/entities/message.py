@@ -1,7 +1,7 @@
 import datetime
 import uuid
 
-from sqlalchemy import Column, BINARY, DATETIME, JSON, String, Text
+from sqlalchemy import Column, BINARY, DATETIME, Index, Integer, JSON, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -13,10 +13,21 @@ class Message(Base):
     id = Column(BINARY(16), primary_key=True, default=lambda: uuid.uuid4().bytes)
     role = Column(String(50), nullable=False)
     content = Column(Text, nullable=False)
-    story_id = Column(BINARY(16), nullable=False, index=True)
+    story_id = Column(BINARY(16), nullable=False)
+    # Position within the story: chapter N is played by messages 2N-1 (user) and 2N (assistant)
+    seq = Column(Integer, nullable=False)
     created_at = Column(
         DATETIME,
-        default=datetime.datetime.now(datetime.UTC),
+        default=lambda: datetime.datetime.now(datetime.UTC),
         nullable=False
     )
     tags = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        Index('idx_story_id_seq', 'story_id', 'seq', unique=True),
+    )
+
+    @staticmethod
+    def seq_for(chapter_number: int, role: str) -> int:
+        """Sequence number of the user/assistant message that produced a chapter"""
+        return chapter_number * 2 - (1 if role == "user" else 0)
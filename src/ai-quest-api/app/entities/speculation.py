@@ -0,0 +1,36 @@
+import datetime
+import hashlib
+import uuid
+
+from sqlalchemy import Column, BINARY, DATETIME, Index, Integer, JSON, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class Speculation(Base):
+    """A DM response generated ahead of time for one of the choices offered by the story head"""
+    __tablename__ = 'speculations'
+
+    id = Column(BINARY(16), primary_key=True, default=lambda: uuid.uuid4().bytes)
+    story_id = Column(BINARY(16), nullable=False)
+    # The chapter this response would become
+    chapter_number = Column(Integer, nullable=False)
+    choice_key = Column(String(64), nullable=False)
+    choice = Column(Text, nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(
+        DATETIME,
+        default=lambda: datetime.datetime.now(datetime.UTC),
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index('idx_story_id_chapter_number_choice_key', 'story_id', 'chapter_number', 'choice_key', unique=True),
+    )
+
+    @staticmethod
+    def key_for(choice: str) -> str:
+        """Decisions match a choice regardless of case and whitespace"""
+        normalized = " ".join(choice.split()).casefold()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
@@ -1,4 +1,7 @@
-from sqlalchemy import BINARY, Column, String
+import datetime
+import json
+
+from sqlalchemy import BINARY, Column, DATETIME, Index, Integer, JSON, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
 
@@ -11,8 +14,39 @@ class Story(Base):
     user_id = Column(BINARY(16), nullable=False)
     title = Column(String(256), nullable=True)
 
+    # Story head: denormalized copy of the latest chapter, advanced together with every append
+    last_chapter_number = Column(Integer, nullable=False, default=0)
+    chapter_count = Column(Integer, nullable=False, default=0)
+    current_situation = Column(Text, nullable=True)
+    current_choices = Column(JSON, nullable=True)
+    # Bumped whenever chapter summaries are written, which happens without a new chapter
+    summaries_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        DATETIME,
+        default=lambda: datetime.datetime.now(datetime.UTC),
+        nullable=False
+    )
+
+    __table_args__ = (
+        # Serves the per-user story list ordered by last activity
+        Index('idx_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     def get_id(self) -> uuid.UUID:
         """Returns the UUID of the user."""
         if not self.id:
             raise ValueError("Story ID is not set.")
         return uuid.UUID(bytes=self.id)
+
+    @property
+    def current_choices_list(self) -> list[str]:
+        """Convert current choices to proper list format"""
+        if isinstance(self.current_choices, str):
+            try:
+                return json.loads(self.current_choices)
+            except (json.JSONDecodeError, TypeError):
+                return []
+        elif isinstance(self.current_choices, list):
+            return self.current_choices
+        else:
+            return []
@@ -0,0 +1,20 @@
+import datetime
+
+from sqlalchemy import Column, DATETIME, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class SummaryBatch(Base):
+    """A Message Batch submitted by the chapter summarization job, until its results are written back"""
+    __tablename__ = 'summary_batches'
+
+    id = Column(String(64), primary_key=True)
+    chapter_count = Column(Integer, nullable=False)
+    created_at = Column(
+        DATETIME,
+        default=lambda: datetime.datetime.now(datetime.UTC),
+        nullable=False
+    )
+    collected_at = Column(DATETIME, nullable=True)
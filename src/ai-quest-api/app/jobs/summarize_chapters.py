@@ -0,0 +1,208 @@
+"""
+Offline chapter summarization through the Anthropic Message Batches API
+
+Summaries missing from `chapters` are generated in bulk, off the turn path, at batch pricing
+and without competing with live play for rate limits. Runs as a CLI:
+
+    python -m app.jobs.summarize_chapters --limit 1000 --wait 600
+
+or as a scheduled Lambda (`app.jobs.summarize_chapters.handler`).
+
+Each run first waits for and collects the batches earlier runs submitted and left uncollected
+(recorded in `summary_batches`, so other batches in the account are never touched), and only
+submits a new batch when none is in flight. Each batch is collected once; writing results back
+is idempotent anyway: chapters that already have a summary are skipped.
+"""
+import argparse
+import json
+import logging
+import time
+
+import anthropic
+
+from app.clients import config, db_client, model_routing
+from app.clients.llm_client import cached_system
+from app.clients.token_tracker import flush_token_tracker, get_token_tracker
+from app.entities.chapter import Chapter
+from app.repositories.chapter import ChapterRepository
+from app.repositories.summary_batch import SummaryBatchRepository
+from app.services.chapter_summarization import build_summary_prompt
+from app.services.translator import Translator
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+DEFAULT_LIMIT = 1000
+DEFAULT_WAIT_SECONDS = 600
+DEFAULT_POLL_SECONDS = 30
+MAX_BATCH_REQUESTS = 100_000  # API limit per batch
+
+
+def _custom_id(chapter: Chapter) -> str:
+    return chapter.id.hex()
+
+
+def build_requests(chapters: list[tuple[Chapter, str]], model: str, max_tokens: int) -> list[dict]:
+    """One batch request per chapter, in the same shape ChapterSummarizationService sends live"""
+    requests = []
+    for chapter, locale in chapters:
+        translator = Translator.get_instance(locale)
+        requests.append({
+            "custom_id": _custom_id(chapter),
+            "params": {
+                "model": model,
+                "max_tokens": max_tokens,
+                "system": cached_system(translator.translate("prompts.dm_summarize"), config.prompt_caching),
+                "messages": [{"role": "user", "content": build_summary_prompt(translator, chapter)}],
+            },
+        })
+    return requests
+
+
+class ChapterSummaryBatchJob:
+    def __init__(self, client: anthropic.Anthropic = None, model: str = None, max_tokens: int = None,
+                 poll_seconds: float = DEFAULT_POLL_SECONDS):
+        # The SDK honors ANTHROPIC_BASE_URL, so the job can be pointed at a local fake batch server
+        self.client = client or anthropic.Anthropic(api_key=config.anthropic_api_key)
+        route = model_routing.get_route("summarize.chapter")
+        self.model = model or route.anthropic_model
+        self.max_tokens = max_tokens or route.max_tokens
+        self.poll_seconds = poll_seconds
+        self.token_tracker = get_token_tracker()
+
+    def run(self, limit: int = DEFAULT_LIMIT, wait_seconds: float = DEFAULT_WAIT_SECONDS) -> dict:
+        deadline = time.monotonic() + wait_seconds
+        report = {"collected_batches": [], "summaries_written": 0, "submitted_batch": None, "pending_batches": []}
+
+        for batch_id in self._uncollected_batch_ids():
+            batch = self._wait(self.client.messages.batches.retrieve(batch_id), deadline)
+            if batch.processing_status == "ended":
+                report["summaries_written"] += self.collect(batch.id)
+                report["collected_batches"].append(batch.id)
+            else:
+                report["pending_batches"].append(batch.id)
+
+        # Chapters of an in-flight batch are still unsummarized: submitting now would duplicate them
+        if report["pending_batches"]:
+            logger.info(f"Batches still in progress, not submitting: {report['pending_batches']}")
+            return report
+
+        batch = self.submit(limit)
+        if batch is None:
+            return report
+        report["submitted_batch"] = batch.id
+
+        batch = self._wait(batch, deadline)
+        if batch.processing_status == "ended":
+            report["summaries_written"] += self.collect(batch.id)
+            report["collected_batches"].append(batch.id)
+        else:
+            logger.info(f"Batch {batch.id} still in progress, the next run collects it")
+            report["pending_batches"].append(batch.id)
+        return report
+
+    def _uncollected_batch_ids(self) -> list[str]:
+        """Batches submitted by earlier runs whose results were not written back yet"""
+        with db_client.session() as db:
+            return SummaryBatchRepository(db).get_uncollected_ids()
+
+    def _wait(self, batch, deadline: float):
+        while batch.processing_status != "ended" and time.monotonic() < deadline:
+            time.sleep(min(self.poll_seconds, max(0.0, deadline - time.monotonic())))
+            batch = self.client.messages.batches.retrieve(batch.id)
+        return batch
+
+    def submit(self, limit: int = DEFAULT_LIMIT):
+        """Submit one batch for up to `limit` unsummarized chapters; None when there are none"""
+        with db_client.session() as db:
+            chapters = ChapterRepository(db).get_unsummarized(min(limit, MAX_BATCH_REQUESTS))
+        if not chapters:
+            logger.info("No chapters to summarize")
+            return None
+
+        batch = self.client.messages.batches.create(
+            requests=build_requests(chapters, self.model, self.max_tokens)
+        )
+        with db_client.session() as db:
+            SummaryBatchRepository(db).add(batch.id, len(chapters))
+        logger.info(f"Submitted batch {batch.id} with {len(chapters)} chapters")
+        return batch
+
+    def collect(self, batch_id: str) -> int:
+        """Write the succeeded results of an ended batch back in bulk; returns the rows updated"""
+        summaries: dict[bytes, str] = {}
+        failed = 0
+        input_tokens = output_tokens = cache_creation_input_tokens = cache_read_input_tokens = 0
+
+        for response in self.client.messages.batches.results(batch_id):
+            if response.result.type != "succeeded":
+                failed += 1
+                continue
+            message = response.result.message
+            try:
+                summaries[bytes.fromhex(response.custom_id)] = message.content[0].text
+            except (ValueError, IndexError, AttributeError):
+                failed += 1
+                continue
+            input_tokens += message.usage.input_tokens
+            output_tokens += message.usage.output_tokens
+            cache_creation_input_tokens += message.usage.cache_creation_input_tokens or 0
+            cache_read_input_tokens += message.usage.cache_read_input_tokens or 0
+
+        with db_client.session() as db:
+            # Committed together with the summaries, so no later run collects this batch again
+            SummaryBatchRepository(db).mark_collected(batch_id)
+            updated = ChapterRepository(db).update_summaries(summaries)
+
+        logger.info(f"Batch {batch_id}: {len(summaries)} summaries ({updated} written), {failed} failed")
+        if not updated:
+            return 0
+
+        # One tracking item per batch keeps DynamoDB writes independent of batch size
+        self.token_tracker.track_usage(
+            service="anthropic",
+            model=self.model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cache_creation_input_tokens=cache_creation_input_tokens,
+            cache_read_input_tokens=cache_read_input_tokens,
+            batch=True,
+            metadata={
+                "method": "batch_summarize_chapters",
+                "route": "summarize.chapter",
+                "batch_id": batch_id,
+                "succeeded": len(summaries),
+                "failed": failed,
+                "updated": updated,
+            }
+        )
+        return updated
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point; `limit` and `wait_seconds` may be set in the event"""
+    event = event or {}
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000 if context else DEFAULT_WAIT_SECONDS
+    # Leave time to write the results back before Lambda times out
+    wait_seconds = min(float(event.get("wait_seconds", DEFAULT_WAIT_SECONDS)), max(0.0, remaining_seconds - 60))
+    try:
+        return ChapterSummaryBatchJob().run(limit=int(event.get("limit", DEFAULT_LIMIT)), wait_seconds=wait_seconds)
+    finally:
+        flush_token_tracker()
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize chapters without a summary through the Batches API")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="max chapters per batch")
+    parser.add_argument("--wait", type=float, default=DEFAULT_WAIT_SECONDS,
+                        help="seconds to wait for batches to end before leaving them to the next run")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="seconds between status polls")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = ChapterSummaryBatchJob(poll_seconds=args.poll).run(limit=args.limit, wait_seconds=args.wait)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,35 @@
+import asyncio
+import datetime
+import json
 import logging
+import math
 import uuid
 
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.clients import llm_client, db_client
+from app.clients import config, llm_client, db_client, response_cache, token_tracker
+from app.clients.llm_resilience import LLMUnavailableError
+from app.repositories.story import StoryConflictError
+from app.services import rate_limit
 from app.services import security
+from app.services import speculation
+from app.services import story_export
+from app.services import usage
 from app.services import user
+from app.clients import replay
 from app.services.memory.aws_memory_store import AWSS3MemoryStore, S3VectorConfig
+from app.services.memory.replay_memory_store import ReplayMemoryStore
 from app.services.translator import Translator
-from app.services.story import StoryService
-from app.schemas.story import Story, FullStory
+from app.services.story import StoryService, DEFAULT_STORIES_PAGE_SIZE
+from app.schemas.story import FullStory, StoryPage
 from app.schemas.user_decision import UserDecision
 
 API_GATEWAY_BASE_PATH = "/quest"
+MAX_CHAPTERS_PAGE_SIZE = 100
+MAX_STORIES_PAGE_SIZE = 100
 
 app = fastapi.FastAPI()
 app.add_middleware(
@@ -24,16 +38,58 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", story_export.NEXT_PART_HEADER],
 )
 
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
+config = config.Config()
 
 # Configure memory client
 memory_store_config = S3VectorConfig(
     bucket_name="ai-quest-memory",
 )
-memory_store = AWSS3MemoryStore(memory_store_config)
+if config.llm_client_type == "replay":
+    memory_store = ReplayMemoryStore()
+else:
+    memory_store = AWSS3MemoryStore(
+        memory_store_config,
+        recording=replay.get_recording(config.llm_record_path) if config.llm_record_path else None,
+    )
+
+
+def _etag_headers(etag: str) -> dict:
+    # no-cache: the browser may store the response but must revalidate it with If-None-Match
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _not_modified(etag: str) -> fastapi.Response:
+    return fastapi.Response(status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def _speculate(story_id: uuid.UUID, user_info: user.UserInfo) -> None:
+    token_tracker.current_user_id.set(str(user_info.user_id))
+    # Runs after the response, so it needs its own session
+    async with db_client.async_session() as db:
+        try:
+            await StoryService(db, user_info, memory_store).speculate(story_id)
+        except Exception:
+            logger.exception(f"Speculation failed for Story {story_id}")
+
+
+def _schedule_speculation(background_tasks: fastapi.BackgroundTasks, story_id: uuid.UUID,
+                          user_info: user.UserInfo) -> None:
+    """Pre-generate the next turn for the offered choices, if enabled"""
+    if not config.speculation_enabled:
+        return
+    if config.speculation_dispatch == "lambda":
+        background_tasks.add_task(speculation.invoke_lambda, story_id, user_info)
+    else:
+        background_tasks.add_task(_speculate, story_id, user_info)
 
 
 @app.get("/health")
@@ -41,64 +97,189 @@ def health_check():
     return {"status": "healthy"}
 
 
-@app.post("/ask", dependencies=[fastapi.Depends(security.verify_api_key)])
-def ask(question: str, user_info: user.UserInfo = fastapi.Depends(user.get_user_info)):
-    # Configure LLM client
+@app.get("/health/db", dependencies=[fastapi.Depends(security.verify_api_key)])
+def db_health_check():
+    return {"status": "healthy", "pool": db_client.pool_stats()}
+
+
+@app.get("/health/llm", dependencies=[fastapi.Depends(security.verify_api_key)])
+def llm_health_check():
+    return {
+        "status": "healthy",
+        "response_cache": response_cache.get_response_cache().stats(),
+        "token_tracking": token_tracker.get_tracking_stats(),
+    }
+
+
+@app.get("/admin/usage", dependencies=[fastapi.Depends(security.verify_admin_api_key)])
+def admin_usage(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    service: str = "anthropic",
+):
+    """Token usage and estimated cost of a service per day and model, from the raw usage items."""
+    try:
+        return usage.get_usage_query_engine().usage_report(service, start_date, end_date)
+    except ValueError as e:
+        raise fastapi.HTTPException(status_code=fastapi.status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@app.post("/ask", dependencies=[fastapi.Depends(security.verify_api_key),
+                                fastapi.Depends(rate_limit.enforce_rate_limit)])
+async def ask(question: str, user_info: user.UserInfo = fastapi.Depends(user.get_user_info)):
     translator = Translator.get_instance(user_info.locale)
     system_prompt = translator.translate("prompts.default")
-    client = llm_client.create_client(system_prompt, "anthropic")
-    response = client.ask(question)
+    client = llm_client.get_cached_client("ask")
+    response = await client.ask(question, system_prompt)
     return {"response": response}
 
 
 @app.get("/stories", dependencies=[fastapi.Depends(security.verify_api_key)])
-def stories(
+async def stories(
+    response: fastapi.Response,
+    limit: int = fastapi.Query(DEFAULT_STORIES_PAGE_SIZE, ge=1, le=MAX_STORIES_PAGE_SIZE),
+    cursor: str | None = None,
+    if_none_match: str | None = fastapi.Header(None),
     user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
-    db: Session = fastapi.Depends(db_client.get_db)
-) -> list[Story]:
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db)
+) -> StoryPage:
+    """Stories ordered by last activity; pass next_cursor back as cursor for the next page."""
     logger.debug(f"User {user_info.email} requesting stories.")
-    stories = StoryService(db, user_info).list(user_info)
+    page_etag, stories = await StoryService(db, user_info).list_if_modified(user_info, limit, cursor, if_none_match)
+    if stories is None:
+        return _not_modified(page_etag)
+    response.headers.update(_etag_headers(page_etag))
     return stories
 
 
-@app.post("/stories/init", response_model=FullStory, dependencies=[fastapi.Depends(security.verify_api_key)])
+@app.post("/stories/init", response_model=FullStory, dependencies=[fastapi.Depends(security.verify_api_key),
+                                                                   fastapi.Depends(rate_limit.enforce_rate_limit)])
 async def init(
+    background_tasks: fastapi.BackgroundTasks,
     user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
-    db: Session = fastapi.Depends(db_client.get_db)
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db)
 ) -> FullStory:
     story_service = StoryService(db, user_info, memory_store)
     new_story = await story_service.init(user_info)
     logger.debug(f"New Story {new_story.id} created")
+    _schedule_speculation(background_tasks, uuid.UUID(new_story.id), user_info)
     return new_story
 
 
 @app.get("/stories/{story_id}", response_model=FullStory, dependencies=[fastapi.Depends(security.verify_api_key)])
-def get(
+async def get(
     story_id: uuid.UUID,
-    db: Session = fastapi.Depends(db_client.get_db),
+    response: fastapi.Response,
+    since_chapter: int = fastapi.Query(0, ge=0),
+    limit: int | None = fastapi.Query(None, ge=1, le=MAX_CHAPTERS_PAGE_SIZE),
+    if_none_match: str | None = fastapi.Header(None),
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db),
     user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
 ) -> FullStory:
     logger.debug(f"Retrieving Story {story_id}")
     story_service = StoryService(db, user_info)
-    return story_service.get(story_id)
+    story_etag, full_story = await story_service.get_if_modified(story_id, since_chapter, limit, if_none_match)
+    if full_story is None:
+        return _not_modified(story_etag)
+    response.headers.update(_etag_headers(story_etag))
+    return full_story
 
 
-@app.post("/stories/{story_id}/act", response_model=FullStory, dependencies=[fastapi.Depends(security.verify_api_key)])
+@app.get("/stories/{story_id}/export", dependencies=[fastapi.Depends(security.verify_api_key)])
+async def export(
+    story_id: uuid.UUID,
+    format: story_export.ExportFormat = "ndjson",
+    since_chapter: int = fastapi.Query(0, ge=0),
+    limit: int = fastapi.Query(story_export.MAX_EXPORT_CHAPTERS, ge=1, le=story_export.MAX_EXPORT_CHAPTERS),
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db),
+    user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
+) -> fastapi.responses.StreamingResponse:
+    """
+    Export the story as NDJSON (one chapter per line) or Markdown, up to limit chapters after since_chapter.
+
+    Behind API Gateway, Mangum buffers the response, so a part is capped at MAX_EXPORT_CHAPTERS to stay
+    under Lambda's 6 MB response limit. When more chapters follow, the X-Export-Next-Since-Chapter header
+    holds the since_chapter of the next part.
+    """
+    logger.debug(f"Exporting Story {story_id}")
+    story_entity = await StoryService(db, user_info).get_entity(story_id)
+    headers = {
+        "Content-Disposition": f'attachment; filename="story-{story_id}.{story_export.FILE_EXTENSIONS[format]}"'
+    }
+    next_part = story_export.next_part(story_entity, since_chapter, limit)
+    if next_part is not None:
+        headers[story_export.NEXT_PART_HEADER] = str(next_part)
+    return fastapi.responses.StreamingResponse(
+        story_export.export_story(story_entity, format, since_chapter, limit),
+        media_type=story_export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+@app.post("/stories/{story_id}/act", response_model=FullStory,
+          dependencies=[fastapi.Depends(security.verify_api_key), fastapi.Depends(rate_limit.enforce_rate_limit)])
 async def act(
     story_id: uuid.UUID,
     user_decision: UserDecision,
-    db: Session = fastapi.Depends(db_client.get_db),
+    background_tasks: fastapi.BackgroundTasks,
+    since_chapter: int | None = fastapi.Query(None, ge=0),
+    delta: bool = False,
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db),
     user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
 ) -> FullStory:
+    """delta=true returns only the newly appended chapter; since_chapter returns everything after it."""
     logger.debug(f"Acting inside Story {story_id}")
     story_service = StoryService(db, user_info, memory_store)
-    return await story_service.act(story_id, user_decision.message)
+    full_story = await story_service.act(story_id, user_decision.message, since_chapter, delta)
+    _schedule_speculation(background_tasks, story_id, user_info)
+    return full_story
+
+
+@app.post("/stories/{story_id}/act/stream",
+          dependencies=[fastapi.Depends(security.verify_api_key), fastapi.Depends(rate_limit.enforce_rate_limit)])
+async def act_stream(
+    story_id: uuid.UUID,
+    user_decision: UserDecision,
+    background_tasks: fastapi.BackgroundTasks,
+    user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
+) -> fastapi.responses.StreamingResponse:
+    """
+    Server-sent events: `narration` and `outcome` events carry text deltas as the DM writes them,
+    then a `chapter` event carries the persisted story delta (or an `error` event).
+
+    Deployed behind API Gateway through Mangum, the whole response is buffered and the events
+    arrive at once; incremental delivery needs uvicorn, or Lambda response streaming
+    (a Function URL with invoke mode RESPONSE_STREAM, i.e. InvokeWithResponseStream).
+    """
+    logger.debug(f"Streaming act inside Story {story_id}")
+
+    async def events():
+        # The stream outlives the request dependencies, so it runs on its own session
+        async with db_client.async_session() as db:
+            story_service = StoryService(db, user_info, memory_store)
+            try:
+                async for event in story_service.act_stream(story_id, user_decision.message):
+                    if isinstance(event, FullStory):
+                        _schedule_speculation(background_tasks, story_id, user_info)
+                        yield _sse("chapter", event.model_dump_json())
+                    else:
+                        yield _sse(event.field, json.dumps({"delta": event.text}))
+            except Exception as e:
+                logger.exception(f"Streaming act failed for Story {story_id}")
+                yield _sse("error", json.dumps({"message": str(e)}))
+
+    return fastapi.responses.StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
 
 
 @app.delete("/stories/{story_id}", dependencies=[fastapi.Depends(security.verify_api_key)])
 async def delete(
     story_id: uuid.UUID,
-    db: Session = fastapi.Depends(db_client.get_db),
+    db: AsyncSession = fastapi.Depends(db_client.get_async_db),
     user_info: user.UserInfo = fastapi.Depends(user.get_user_info),
 ):
     logger.debug(f"Deleting Story {story_id}")
@@ -108,18 +289,63 @@ async def delete(
 
 
 # Handlers
+_ERROR_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Credentials": "true",
+    "Access-Control-Allow-Methods": "GET, POST, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization",
+}
+
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_exception_handler(request: fastapi.Request, e: LLMUnavailableError):
+    headers = dict(_ERROR_HEADERS)
+    if e.retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return fastapi.responses.JSONResponse(
+        status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"message": str(e)},
+        headers=headers,
+    )
+
+
+@app.exception_handler(StoryConflictError)
+async def story_conflict_exception_handler(request: fastapi.Request, e: StoryConflictError):
+    return fastapi.responses.JSONResponse(
+        status_code=fastapi.status.HTTP_409_CONFLICT,
+        content={"message": str(e)},
+        headers=_ERROR_HEADERS,
+    )
+
+
+@app.exception_handler(rate_limit.RateLimitExceeded)
+async def rate_limit_exception_handler(request: fastapi.Request, e: rate_limit.RateLimitExceeded):
+    return fastapi.responses.JSONResponse(
+        status_code=fastapi.status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"message": str(e)},
+        headers={**_ERROR_HEADERS, "Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: fastapi.Request, e: Exception):
     return fastapi.responses.JSONResponse(
         status_code=fastapi.status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"message": str(e)},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "GET, POST, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-        },
+        headers=_ERROR_HEADERS,
     )
 
 # for AWS Lambda compatibility:
-handler = Mangum(app, api_gateway_base_path=API_GATEWAY_BASE_PATH)
+_mangum = Mangum(app, api_gateway_base_path=API_GATEWAY_BASE_PATH)
+
+
+def handler(event, context):
+    try:
+        # Speculation self-invocations (SPECULATION_DISPATCH=lambda) bypass the HTTP app
+        if isinstance(event, dict) and speculation.LAMBDA_EVENT_KEY in event:
+            asyncio.get_event_loop().run_until_complete(_speculate(*speculation.parse_lambda_event(event)))
+            return {"status": "ok"}
+        return _mangum(event, context)
+    finally:
+        # The container is frozen once the invocation returns: buffered usage would wait for the next one
+        token_tracker.flush_token_tracker()
@@ -1,6 +1,9 @@
-from sqlalchemy import asc
+from sqlalchemy import asc, bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.entities.chapter import Chapter
+from app.entities.story import Story
+from app.entities.user import User
 
 
 class ChapterRepository:
@@ -33,3 +36,95 @@ class ChapterRepository:
         self.db_session.merge(chapter)
         self.db_session.commit()
         return chapter
+
+    def get_unsummarized(self, limit: int, after_id: bytes | None = None) -> list[tuple[Chapter, str]]:
+        """Chapters without a summary with their owner's locale, in id order (keyset on after_id)"""
+        query = (
+            self.db_session.query(Chapter, func.coalesce(User.locale, 'en'))
+            .outerjoin(Story, Story.id == Chapter.story_id)
+            .outerjoin(User, User.id == Story.user_id)
+            .filter(Chapter.summary.is_(None))
+        )
+        if after_id is not None:
+            query = query.filter(Chapter.id > after_id)
+        return [(chapter, locale) for chapter, locale in query.order_by(asc(Chapter.id)).limit(limit).all()]
+
+    def update_summaries(self, summaries: dict[bytes, str]) -> int:
+        """
+        Write many summaries in one executemany UPDATE.
+
+        Chapters summarized in the meantime (live, on the turn path) are left untouched.
+        The stories of the chapters written get their summaries_version bumped in the same commit,
+        so cached copies revalidate; nothing is bumped when no chapter changes.
+        """
+        if not summaries:
+            return 0
+        pending = self.db_session.query(Chapter.id, Chapter.story_id).filter(
+            Chapter.id.in_(list(summaries)), Chapter.summary.is_(None)).all()
+        if not pending:
+            return 0
+        table = Chapter.__table__
+        result = self.db_session.execute(
+            update(table)
+            .where(table.c.id == bindparam("chapter_id"))
+            .where(table.c.summary.is_(None))
+            .values(summary=bindparam("chapter_summary")),
+            [{"chapter_id": chapter_id, "chapter_summary": summaries[chapter_id]} for chapter_id, _ in pending],
+        )
+        self.db_session.execute(
+            update(Story)
+            .where(Story.id.in_({story_id for _, story_id in pending}))
+            .values(summaries_version=Story.summaries_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        self.db_session.commit()
+        return result.rowcount
+
+
+class AsyncChapterRepository:
+    """Writes are only staged on the session; AsyncUnitOfWork commits them."""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    def add(self, chapter: Chapter):
+        self.db_session.add(chapter)
+        return chapter.id
+
+    async def get_chapter(self, story_id_bytes: bytes, chapter_number: int) -> Chapter:
+        result = await self.db_session.execute(
+            select(Chapter).filter(Chapter.story_id == story_id_bytes).filter(Chapter.number == chapter_number)
+        )
+        return result.scalars().first()
+
+    async def get_chapters_by_story_id(self, story_id_bytes: bytes) -> list[Chapter]:
+        result = await self.db_session.execute(
+            select(Chapter).filter(Chapter.story_id == story_id_bytes).order_by(asc(Chapter.number))
+        )
+        return list(result.scalars().all())
+
+    async def get_chapters_page(self, story_id_bytes: bytes, since_chapter: int = 0,
+                                limit: int | None = None) -> list[Chapter]:
+        """Chapters numbered after since_chapter, in order (keyset over the (story_id, number) index)"""
+        query = (
+            select(Chapter)
+            .filter(Chapter.story_id == story_id_bytes)
+            .filter(Chapter.number > since_chapter)
+            .order_by(asc(Chapter.number))
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self.db_session.execute(query)
+        return list(result.scalars().all())
+
+    async def get_last_chapter(self, story_id_bytes: bytes) -> Chapter:
+        result = await self.db_session.execute(
+            select(Chapter).filter(Chapter.story_id == story_id_bytes).order_by(Chapter.number.desc()).limit(1)
+        )
+        return result.scalars().first()
+
+    async def get_max_chapter_number(self, story_id_bytes: bytes) -> int:
+        last_chapter = await self.get_last_chapter(story_id_bytes)
+        return last_chapter.number if last_chapter else 0
+
+    async def update(self, chapter: Chapter) -> Chapter:
+        return await self.db_session.merge(chapter)
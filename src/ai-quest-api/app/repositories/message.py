@@ -1,8 +1,23 @@
-from sqlalchemy import asc
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.entities.message import Message
 
 DEFAULT_MAX_MESSAGE_PAIRS = 6  # Sufficient amount of chapters for immediate continuity of the dialogue
+# The history window start only moves every HISTORY_WINDOW_STRIDE chapters, so consecutive turns
+# share a message prefix the LLM provider can serve from its prompt cache
+HISTORY_WINDOW_STRIDE = 4
+
+
+def history_window_start(last_chapter_number: int, min_pairs: int = DEFAULT_MAX_MESSAGE_PAIRS,
+                         stride: int = HISTORY_WINDOW_STRIDE) -> int:
+    """
+    First chapter of the history sent with the next turn.
+
+    The window holds between `min_pairs` and `min_pairs + stride - 1` chapters.
+    """
+    return max(1, (last_chapter_number - min_pairs) // stride * stride + 1)
+
 
 class MessageRepository:
     def __init__(self, db_session):
@@ -16,7 +31,43 @@ class MessageRepository:
     def get_message(self, message_id: str) -> Message:
         return self.db_session.query(Message).filter(Message.id == message_id).first()
 
-    def get_messages_by_story_id(self, story_id_bytes: bytes, max: int = DEFAULT_MAX_MESSAGE_PAIRS) -> list[Message]:
+    def get_recent_messages(self, story_id_bytes: bytes, max: int = DEFAULT_MAX_MESSAGE_PAIRS) -> list[Message]:
+        """The last `max` message pairs of a story, oldest first"""
+        limit = max * 2
+        newest_first = self.db_session.query(Message).filter(Message.story_id == story_id_bytes).order_by(
+            desc(Message.seq)).limit(limit).all()
+        return list(reversed(newest_first))
+
+
+class AsyncMessageRepository:
+    """Writes are only staged on the session; AsyncUnitOfWork commits them."""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    def add(self, message: Message):
+        self.db_session.add(message)
+        return message.id
+
+    def add_all(self, messages: list[Message]) -> None:
+        """Stage several messages so the flush emits a single multi-row INSERT"""
+        self.db_session.add_all(messages)
+
+    async def get_message(self, message_id: str) -> Message:
+        result = await self.db_session.execute(select(Message).filter(Message.id == message_id))
+        return result.scalars().first()
+
+    async def get_recent_messages(self, story_id_bytes: bytes, max: int = DEFAULT_MAX_MESSAGE_PAIRS) -> list[Message]:
+        """The last `max` message pairs of a story, oldest first (backward scan of the (story_id, seq) index)"""
         limit = max * 2
-        return self.db_session.query(Message).filter(Message.story_id == story_id_bytes).order_by(
-            asc(Message.created_at)).limit(limit).all()
+        result = await self.db_session.execute(
+            select(Message).filter(Message.story_id == story_id_bytes).order_by(desc(Message.seq)).limit(limit)
+        )
+        return list(reversed(result.scalars().all()))
+
+    async def get_history_window(self, story_id_bytes: bytes, last_chapter_number: int) -> list[Message]:
+        """Messages from history_window_start() on, oldest first (range scan of the (story_id, seq) index)"""
+        from_seq = Message.seq_for(history_window_start(last_chapter_number), "user")
+        result = await self.db_session.execute(
+            select(Message).filter(Message.story_id == story_id_bytes, Message.seq >= from_seq).order_by(Message.seq)
+        )
+        return list(result.scalars().all())
@@ -0,0 +1,43 @@
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.entities.speculation import Speculation
+
+
+class AsyncSpeculationRepository:
+    """Writes are only staged on the session; AsyncUnitOfWork commits them."""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    def add(self, speculation: Speculation):
+        speculation.choice_key = Speculation.key_for(speculation.choice)
+        self.db_session.add(speculation)
+        return speculation.id
+
+    async def get(self, story_id_bytes: bytes, chapter_number: int, choice: str) -> Speculation | None:
+        result = await self.db_session.execute(
+            select(Speculation).filter(
+                Speculation.story_id == story_id_bytes,
+                Speculation.chapter_number == chapter_number,
+                Speculation.choice_key == Speculation.key_for(choice),
+            )
+        )
+        return result.scalars().first()
+
+    async def get_choice_keys(self, story_id_bytes: bytes, chapter_number: int) -> set[str]:
+        result = await self.db_session.execute(
+            select(Speculation.choice_key).filter(
+                Speculation.story_id == story_id_bytes,
+                Speculation.chapter_number == chapter_number,
+            )
+        )
+        return set(result.scalars().all())
+
+    async def delete_up_to(self, story_id_bytes: bytes, chapter_number: int) -> None:
+        """Discard speculations made obsolete by the story reaching chapter_number"""
+        await self.db_session.execute(
+            delete(Speculation).where(
+                Speculation.story_id == story_id_bytes,
+                Speculation.chapter_number <= chapter_number,
+            )
+        )
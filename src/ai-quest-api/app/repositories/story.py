@@ -1,9 +1,20 @@
+import datetime
 import logging
 import uuid
 
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.entities.chapter import Chapter
 from app.entities.story import Story
 
 _LOGGER = logging.getLogger(__name__)
+SITUATION_PREVIEW_LENGTH = 200
+
+
+class StoryConflictError(Exception):
+    """The story was advanced by a concurrent turn; the client may reload it and retry"""
 
 
 class StoryRepository:
@@ -55,3 +66,130 @@ class StoryRepository:
         self.db_session.commit()
 
         _LOGGER.info(f"Deleted story: {story_id_str}")
+
+
+class AsyncStoryRepository:
+    """Writes are only staged on the session; AsyncUnitOfWork commits them."""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    def add(self, story: Story) -> Story:
+        if story.id is None:
+            story.id = uuid.uuid4().bytes
+        self.db_session.add(story)
+        _LOGGER.info(f"Staged a new story: {uuid.UUID(bytes=story.id)}")
+        return story
+
+    async def get(self, story_id_bytes: bytes) -> Story | None:
+        result = await self.db_session.execute(select(Story).filter(Story.id == story_id_bytes))
+        return result.scalars().first()
+
+    async def update_title(self, story_id_bytes: bytes, title: str) -> Story:
+        story_id_str = str(uuid.UUID(bytes=story_id_bytes))
+
+        existing_story = await self.get(story_id_bytes)
+        if not existing_story:
+            raise ValueError(f"Story with ID {story_id_str} not found")
+
+        existing_story.title = title
+
+        _LOGGER.info(f"Updated story title for: {story_id_str}")
+
+        return existing_story
+
+    async def list_by_user_id(self, user_id_bytes: bytes) -> list[Story]:
+        result = await self.db_session.execute(select(Story).filter(Story.user_id == user_id_bytes))
+        return list(result.scalars().all())
+
+    async def list_page_by_user_id(self, user_id_bytes: bytes, limit: int,
+                                   after: tuple[datetime.datetime, bytes] | None = None) -> list:
+        """
+        One page of a user's stories, most recently played first.
+
+        Keyset pagination over (updated_at, id), served by the (user_id, updated_at) index;
+        `after` is the (updated_at, id) of the last row of the previous page. Only the head
+        columns and a situation preview are selected, never the full situation text.
+        """
+        query = (
+            select(
+                Story.id,
+                Story.user_id,
+                Story.title,
+                Story.chapter_count,
+                Story.last_chapter_number,
+                Story.updated_at,
+                func.substr(Story.current_situation, 1, SITUATION_PREVIEW_LENGTH).label('situation_preview'),
+            )
+            .filter(Story.user_id == user_id_bytes)
+            .order_by(Story.updated_at.desc(), Story.id.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            updated_at, story_id_bytes = after
+            query = query.filter(or_(
+                Story.updated_at < updated_at,
+                and_(Story.updated_at == updated_at, Story.id < story_id_bytes),
+            ))
+
+        result = await self.db_session.execute(query)
+        return list(result.all())
+
+    async def get_last_chapter_number(self, story_id_bytes: bytes) -> int | None:
+        """The head as stored now; a loaded Story may be stale, the identity map keeps it as first read"""
+        result = await self.db_session.execute(
+            select(Story.last_chapter_number).where(Story.id == story_id_bytes)
+        )
+        return result.scalar_one_or_none()
+
+    async def bump_summaries_version(self, story_id_bytes: bytes) -> None:
+        """Mark the story's chapter summaries as changed (see Story.summaries_version)"""
+        await self.db_session.execute(
+            update(Story)
+            .where(Story.id == story_id_bytes)
+            .values(summaries_version=Story.summaries_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def advance_head(self, story: Story, chapter: Chapter) -> Story:
+        """
+        Move the story head onto a newly appended chapter.
+
+        The UPDATE only matches while the head still points at the previous chapter,
+        so two turns racing on the same story cannot both claim the same number.
+        """
+        story_id_str = str(uuid.UUID(bytes=story.id))
+        head = {
+            'last_chapter_number': chapter.number,
+            'chapter_count': story.chapter_count + 1,
+            'current_situation': chapter.situation,
+            'current_choices': chapter.choices,
+            'updated_at': datetime.datetime.now(datetime.UTC),
+        }
+
+        result = await self.db_session.execute(
+            update(Story)
+            .where(Story.id == story.id, Story.last_chapter_number == chapter.number - 1)
+            .values(**head)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise StoryConflictError(
+                f"Story {story_id_str} was advanced concurrently, chapter {chapter.number} is taken"
+            )
+
+        # Reflect the new head on the loaded entity without scheduling another UPDATE
+        for key, value in head.items():
+            set_committed_value(story, key, value)
+
+        return story
+
+    async def delete(self, story_id_bytes: bytes) -> None:
+        story_id_str = str(uuid.UUID(bytes=story_id_bytes))
+
+        existing_story = await self.get(story_id_bytes)
+        if not existing_story:
+            raise ValueError(f"Story with ID {story_id_str} not found")
+
+        await self.db_session.delete(existing_story)
+
+        _LOGGER.info(f"Deleted story: {story_id_str}")
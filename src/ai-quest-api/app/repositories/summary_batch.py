@@ -0,0 +1,24 @@
+import datetime
+
+from sqlalchemy import asc
+
+from app.entities.summary_batch import SummaryBatch
+
+
+class SummaryBatchRepository:
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    def add(self, batch_id: str, chapter_count: int) -> str:
+        self.db_session.add(SummaryBatch(id=batch_id, chapter_count=chapter_count))
+        self.db_session.commit()
+        return batch_id
+
+    def get_uncollected_ids(self) -> list[str]:
+        return [batch_id for batch_id, in self.db_session.query(SummaryBatch.id).filter(
+            SummaryBatch.collected_at.is_(None)).order_by(asc(SummaryBatch.created_at)).all()]
+
+    def mark_collected(self, batch_id: str) -> None:
+        """Only staged: commits with the summaries written back from the batch"""
+        self.db_session.query(SummaryBatch).filter(SummaryBatch.id == batch_id).update(
+            {SummaryBatch.collected_at: datetime.datetime.now(datetime.UTC)}, synchronize_session=False)
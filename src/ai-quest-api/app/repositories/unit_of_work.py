@@ -0,0 +1,56 @@
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repositories.chapter import AsyncChapterRepository
+from app.repositories.message import AsyncMessageRepository
+from app.repositories.speculation import AsyncSpeculationRepository
+from app.repositories.story import AsyncStoryRepository
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncUnitOfWork:
+    """
+    Collects the writes of one story turn and commits them in a single transaction.
+
+    Repositories only stage changes on the shared session; nothing reaches the
+    database until commit(), which flushes every pending INSERT/UPDATE at once.
+    Used as an async context manager it commits on success and rolls back on error.
+    """
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+        self.stories = AsyncStoryRepository(db_session)
+        self.chapters = AsyncChapterRepository(db_session)
+        self.messages = AsyncMessageRepository(db_session)
+        self.speculations = AsyncSpeculationRepository(db_session)
+
+    async def __aenter__(self) -> 'AsyncUnitOfWork':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+    async def commit(self) -> None:
+        await self.db_session.commit()
+
+    async def release(self) -> None:
+        """
+        End the current (read) transaction and return its connection to the pool, writing nothing.
+
+        Changes staged so far stay staged for the next commit. Call it before a long await,
+        such as an LLM call, so neither the connection nor the transaction's snapshot is held through it.
+        """
+        staged = [*self.db_session.new, *self.db_session.dirty]
+        for entity in staged:
+            self.db_session.expunge(entity)
+        await self.db_session.commit()
+        self.db_session.add_all(staged)
+
+    async def rollback(self) -> None:
+        _LOGGER.warning("Rolling back unit of work")
+        await self.db_session.rollback()
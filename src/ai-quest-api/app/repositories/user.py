@@ -1,4 +1,8 @@
 import logging
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.entities.user import User
 
@@ -23,3 +27,26 @@ class UserRepository:
 
     def get_by_email(self, email: str) -> User | None:
         return self.db_session.query(User).filter(User.email == email).first()
+
+
+class AsyncUserRepository:
+    """Writes are only staged on the session; AsyncUnitOfWork commits them."""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    def add(self, user: User) -> User:
+        if user.id is None:
+            user.id = uuid.uuid4().bytes
+        self.db_session.add(user)
+
+        _LOGGER.info(f"Staged a new user: {user.get_id()}")
+
+        return user
+
+    async def get(self, user_id_bytes: bytes) -> User:
+        result = await self.db_session.execute(select(User).filter(User.id == user_id_bytes))
+        return result.scalars().first()
+
+    async def get_by_email(self, email: str) -> User | None:
+        result = await self.db_session.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
@@ -1,3 +1,4 @@
+import datetime
 from pydantic import BaseModel, Field, field_validator
 from typing import Union
 import uuid
@@ -30,6 +31,10 @@ class Story(BaseModel):
     id: Union[str, bytes, uuid.UUID] = Field(alias='id')
     user_id: Union[str, bytes, uuid.UUID] = Field(alias='user_id')
     title: str | None = None
+    # Progress metadata, read from the story head
+    chapter_count: int = 0
+    last_played_at: datetime.datetime | None = None
+    situation_preview: str | None = None
 
     @field_validator('id', 'user_id', mode='before')
     def convert_id(cls, v: Union[bytes, uuid.UUID, str]) -> str:
@@ -43,6 +48,16 @@ class Story(BaseModel):
         from_attributes = True
 
 
+class StoryPage(BaseModel):
+    data: list[Story]
+    # Pass as cursor to fetch the next page, None on the last page
+    next_cursor: str | None = None
+
+
 class FullStory(Story):
     chapters: list[Chapter]
     current_choices: list[str]
+    # Number of the newest chapter; chapters may hold only a page or delta of the story
+    last_chapter_number: int = 0
+    # Pass as since_chapter to fetch the next page, None when the page reaches the end
+    next_since_chapter: int | None = None
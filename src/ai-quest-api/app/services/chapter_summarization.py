@@ -1,10 +1,10 @@
 import logging
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.clients import llm_client
 from app.entities.chapter import Chapter
-from app.repositories.chapter import ChapterRepository
+from app.repositories.chapter import AsyncChapterRepository
 from app.services.translator import Translator
 from app.services.user import UserInfo
 
@@ -12,25 +12,35 @@ logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
 
+def build_summary_prompt(translator: Translator, chapter: Chapter) -> str:
+    """Localized summarization prompt for a chapter (shared with the offline batch job)"""
+    return f"""{translator.translate('chapter_summarization.instruction')}
+
+{translator.translate('chapter_summarization.narration_label')}: {chapter.narration}
+{translator.translate('chapter_summarization.situation_label')}: {chapter.situation}
+{translator.translate('chapter_summarization.action_label')}: {chapter.action}
+{translator.translate('chapter_summarization.outcome_label')}: {chapter.outcome}
+
+{translator.translate('chapter_summarization.summary_instruction')}"""
+
+
 class ChapterSummarizationService:
-    def __init__(self, db: Session, user_info: UserInfo):
+    def __init__(self, db: AsyncSession, user_info: UserInfo):
         self.translator = Translator.get_instance(user_info.locale)
-        self.llm_client = llm_client.create_client(self.translator.translate("prompts.dm_summarize"), "anthropic")
-        self.chapter_repository = ChapterRepository(db)
+        # Same locale and chapter text give the same summary
+        self.llm_client = llm_client.get_cached_client("summarize.chapter")
+        self.system_prompt = self.translator.translate("prompts.dm_summarize")
+        self.chapter_repository = AsyncChapterRepository(db)
+        # Stories whose summaries were written on this session; the caller bumps their
+        # summaries_version when it commits, so the stories row is not locked while the turn runs
+        self.summarized_story_ids: set[bytes] = set()
         self.user_info = user_info
 
     def _get_localized_prompt(self, chapter: Chapter) -> str:
         """Generate localized prompt based on user language."""
-        return f"""{self.translator.translate('chapter_summarization.instruction')}
-
-{self.translator.translate('chapter_summarization.narration_label')}: {chapter.narration}
-{self.translator.translate('chapter_summarization.situation_label')}: {chapter.situation}
-{self.translator.translate('chapter_summarization.action_label')}: {chapter.action}
-{self.translator.translate('chapter_summarization.outcome_label')}: {chapter.outcome}
-
-{self.translator.translate('chapter_summarization.summary_instruction')}"""
+        return build_summary_prompt(self.translator, chapter)
 
-    def summarize_chapter(self, chapter: Chapter) -> str:
+    async def summarize_chapter(self, chapter: Chapter) -> str:
         """Summarize a chapter using the LLM client."""
         logger.debug("Starting chapter summarization")
 
@@ -42,7 +52,7 @@ class ChapterSummarizationService:
             prompt = self._get_localized_prompt(chapter)
 
             # Use the LLM client to generate the summary
-            response = self.llm_client.ask(prompt)
+            response = await self.llm_client.ask(prompt, self.system_prompt)
 
             # Extract text from the response
             summary = response.text if hasattr(response, 'text') else str(response)
@@ -50,7 +60,8 @@ class ChapterSummarizationService:
             logger.debug(f"Chapter summary: {summary}")
             chapter.summary = summary
             # Save the summary back to the chapter entity
-            self.chapter_repository.update(chapter)
+            await self.chapter_repository.update(chapter)
+            self.summarized_story_ids.add(chapter.story_id)
 
             return summary
 
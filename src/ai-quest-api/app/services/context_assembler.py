@@ -0,0 +1,129 @@
+"""
+Token-budgeted assembly of the DM request
+
+Every component of the prompt (system prompt, tool schema, history, memory context, current
+action) is measured, and memory and history are trimmed until the request fits the configured
+input budget. Retrieved memory is added to the request only; it is never persisted.
+"""
+import json
+import logging
+import math
+import re
+
+from app.clients import config
+from app.entities.message import Message
+from app.repositories.message import HISTORY_WINDOW_STRIDE
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+# Characters per token by script, on the low side for Claude tokenizers: ASCII covers English
+# (~3.5-4) and German (long compounds, ~3); accented Latin letters mostly split off a token of
+# their own, Cyrillic (the ua locale) runs ~2, CJK about one per character.
+# An API count_tokens round trip per turn would cost more latency than it saves.
+CHARS_PER_TOKEN = 3.0
+ACCENTED_LATIN_CHARS_PER_TOKEN = 1.5
+ALPHABETIC_CHARS_PER_TOKEN = 2.0  # Cyrillic, Greek, Armenian, Hebrew, Arabic, ...
+OTHER_CHARS_PER_TOKEN = 1.0
+_ACCENTED_LATIN = re.compile("[\u0080-\u024f\u1e00-\u1eff]")
+_ALPHABETIC = re.compile("[\u0370-\u07ff]")
+# Role and content wrapping added by the Messages API per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if text.isascii():
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    accented = len(_ACCENTED_LATIN.findall(text))
+    alphabetic = len(_ALPHABETIC.findall(text))
+    other = len(text) - ascii_chars - accented - alphabetic
+    return math.ceil(
+        ascii_chars / CHARS_PER_TOKEN
+        + accented / ACCENTED_LATIN_CHARS_PER_TOKEN
+        + alphabetic / ALPHABETIC_CHARS_PER_TOKEN
+        + other / OTHER_CHARS_PER_TOKEN
+    )
+
+
+def _message_tokens(message: dict) -> int:
+    content = message["content"]
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _truncate_lines(text: str, max_tokens: int) -> str:
+    """Keep whole lines from the start of text while they fit max_tokens"""
+    kept, used = [], 0
+    for line in text.split("\n"):
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept)
+
+
+class AssembledContext:
+    """Messages for the DM request and the estimated token count of each component"""
+    def __init__(self, messages: list[dict], tokens: dict[str, int], dropped_pairs: int):
+        self.messages = messages
+        self.tokens = tokens
+        self.dropped_pairs = dropped_pairs
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+
+class ContextAssembler:
+    def __init__(self, system_prompt: str, tools: list[dict], input_budget: int = None,
+                 memory_budget: int = None):
+        self.input_budget = input_budget or config.dm_input_token_budget
+        self.memory_budget = memory_budget or config.dm_memory_token_budget
+        self.fixed_tokens = {
+            "system": estimate_tokens(system_prompt),
+            "tools": estimate_tokens(json.dumps(tools, ensure_ascii=False)),
+        }
+
+    @staticmethod
+    def format_action(user_decision: str, memory_context: str) -> str:
+        if not memory_context:
+            return user_decision
+        return f"Relevant past events for context:\n{memory_context}\n\nCurrent action: {user_decision}"
+
+    def assemble(self, history: list[Message], user_decision: str, memory_context: str = "") -> AssembledContext:
+        """
+        Fit history + memory + action into the budget left by the system prompt and tools.
+
+        Memory is capped first (lines dropped from the end); then the oldest history pairs are dropped
+        in multiples of HISTORY_WINDOW_STRIDE, so consecutive turns keep sharing a cacheable prefix.
+        The most recent pair is always kept.
+        """
+        tokens = dict(self.fixed_tokens)
+        tokens["action"] = estimate_tokens(user_decision) + MESSAGE_OVERHEAD_TOKENS
+        available = self.input_budget - tokens["system"] - tokens["tools"] - tokens["action"]
+
+        memory_allowance = max(0, min(self.memory_budget, available))
+        if estimate_tokens(memory_context) > memory_allowance:
+            memory_context = _truncate_lines(memory_context, memory_allowance)
+        action = self.format_action(user_decision, memory_context)
+        tokens["memory"] = estimate_tokens(action) + MESSAGE_OVERHEAD_TOKENS - tokens["action"]
+        available -= tokens["memory"]
+
+        history_messages = [{"role": message.role, "content": message.content} for message in history]
+        message_tokens = [_message_tokens(message) for message in history_messages]
+        pairs = len(history_messages) // 2
+
+        dropped_pairs = 0
+        while dropped_pairs < pairs - 1 and sum(message_tokens[dropped_pairs * 2:]) > available:
+            dropped_pairs = min(pairs - 1, dropped_pairs + HISTORY_WINDOW_STRIDE)
+        history_messages = history_messages[dropped_pairs * 2:]
+        tokens["history"] = sum(message_tokens[dropped_pairs * 2:])
+
+        if dropped_pairs:
+            logger.debug(f"Dropped {dropped_pairs} history pairs to fit the {self.input_budget} token budget")
+
+        return AssembledContext(history_messages + [{"role": "user", "content": action}], tokens, dropped_pairs)
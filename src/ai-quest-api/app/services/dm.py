@@ -1,5 +1,6 @@
 import json
 import logging
+from typing import AsyncIterator
 
 from app.clients import llm_client
 from app.services.translator import Translator
@@ -8,6 +9,9 @@ from app.services.user import UserInfo
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+# Free-text fields of story_response forwarded to the player while they are generated
+STREAMED_FIELDS = ("narration", "outcome")
+
 
 class DMResponse:
     def __init__(self, narration: str, outcome: str, situation: str, choices: list[str]):
@@ -28,11 +32,19 @@ class DMResponse:
         return json.dumps(self.to_dict())
 
 
+class DMStreamDelta:
+    def __init__(self, field: str, text: str):
+        self.field = field
+        self.text = text
+
+
 class DungeonMaster:
     def __init__(self, user_info: UserInfo):
         self.user_info = user_info
         self.translator = Translator.get_instance(user_info.locale)
-        self.llm_client = llm_client.create_client(self.translator.translate("prompts.dungeon_master"), "anthropic")
+        self.llm_client = llm_client.get_routed_client("dm.turn")
+        self.intro_llm_client = llm_client.get_routed_client("dm.intro")
+        self.system_prompt = self.translator.translate("prompts.dungeon_master")
         self.story_response_tool = self._create_localized_tool()
         self.tool_choice = {"type": "tool", "name": "story_response"}
 
@@ -68,23 +80,55 @@ class DungeonMaster:
             }
         }
 
-    def send_messages(self, messages: list[dict]) -> DMResponse:
-        try:
-            response_str = self.llm_client.send_messages(messages, tools=[self.story_response_tool], tool_choice=self.tool_choice)
-            response_dict = json.loads(response_str)
+    def ensure_available(self) -> None:
+        """Raises LLMUnavailableError while no provider can take the turn"""
+        self.llm_client.ensure_available()
 
+    @staticmethod
+    def _to_response(response_dict: dict) -> DMResponse:
+        try:
             return DMResponse(
                 narration=response_dict["narration"],
                 outcome=response_dict["outcome"],
                 situation=response_dict["situation"],
                 choices=response_dict["choices"]
             )
-        except json.JSONDecodeError as e:
-            logger.error("Failed to decode JSON DMResponse", exc_info=True)
-            raise ValueError("Invalid JSON DMResponse") from e
         except KeyError as e:
             logger.error(f"Missing expected key in DMResponse: {e}", exc_info=True)
             raise ValueError(f"Missing key in DMResponse: {e}") from e
+
+    async def send_messages(self, messages: list[dict], intro: bool = False) -> DMResponse:
+        client = self.intro_llm_client if intro else self.llm_client
+        try:
+            response_str = await client.send_messages(
+                messages, self.system_prompt, tools=[self.story_response_tool], tool_choice=self.tool_choice
+            )
+            return self._to_response(json.loads(response_str))
+        except json.JSONDecodeError as e:
+            logger.error("Failed to decode JSON DMResponse", exc_info=True)
+            raise ValueError("Invalid JSON DMResponse") from e
+        except ValueError:
+            raise
         except Exception as e:
             logger.exception("An unexpected error happened to DM", exc_info=True)
             raise e
+
+    async def stream_messages(self, messages: list[dict]) -> AsyncIterator[DMStreamDelta | DMResponse]:
+        """
+        Yield narration and outcome text as it is generated, then the complete DMResponse.
+
+        Only the part of each field not sent before is yielded, so the client can append deltas.
+        """
+        sent_lengths = {field: 0 for field in STREAMED_FIELDS}
+        response_dict = {}
+
+        async for response_dict in self.llm_client.stream_tool_input(
+            messages, self.system_prompt, tools=[self.story_response_tool], tool_choice=self.tool_choice
+        ):
+            for field in STREAMED_FIELDS:
+                value = response_dict.get(field)
+                if isinstance(value, str) and len(value) > sent_lengths[field]:
+                    yield DMStreamDelta(field, value[sent_lengths[field]:])
+                    sent_lengths[field] = len(value)
+
+        yield self._to_response(response_dict)
@@ -0,0 +1,21 @@
+import hashlib
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the parts that determine a representation"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def story_version(last_chapter_number: int, title: str | None, summaries_version: int = 0) -> str:
+    """A story only changes when a chapter is appended, its title is set or chapter summaries are written"""
+    title_hash = hashlib.sha1((title or "").encode("utf-8")).hexdigest()[:12]
+    return f"{last_chapter_number}-{summaries_version or 0}-{title_hash}"
+
+
+def is_not_modified(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match uses weak comparison and may list several tags or '*'"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
@@ -10,7 +10,8 @@ import uuid
 import boto3
 from botocore.exceptions import ClientError
 
-from app.clients.token_tracker import DynamoDBTokenTracker
+from app.clients import replay
+from app.clients.token_tracker import get_token_tracker
 from app.services.memory.i_memory_store import MemoryStoreInterface, MemorySearchResult
 from app.entities.chapter import Chapter as ChapterEntity
 
@@ -34,15 +35,17 @@ class MemoryMetadata:
 class AWSS3MemoryStore(MemoryStoreInterface):
     """AWS S3 Vectors implementation of memory store"""
 
-    def __init__(self, config: S3VectorConfig):
+    def __init__(self, config: S3VectorConfig, recording: replay.Recording = None):
         self.config = config
+        # Embeddings are recorded for replayed runs (LLM_RECORD_PATH)
+        self.recording = recording
 
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3vectors.html
         self.s3vectors_client = boto3.client('s3vectors', region_name=config.region)
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-runtime.html
         self.bedrock_client = boto3.client('bedrock-runtime', region_name=config.region)
 
-        self.token_tracker = DynamoDBTokenTracker()
+        self.token_tracker = get_token_tracker()
 
     def _get_index_name(self, story_id: uuid.UUID) -> str:
         """Get index name for a specific story"""
@@ -118,6 +121,9 @@ class AWSS3MemoryStore(MemoryStoreInterface):
                 }
             )
 
+            if self.recording:
+                self.recording.add("embedding", replay.text_key(text), result['embedding'])
+
             return result['embedding']
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
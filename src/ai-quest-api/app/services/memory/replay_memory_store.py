@@ -0,0 +1,71 @@
+"""
+In-process memory store for replayed runs (LLM_CLIENT_TYPE=replay), see app.clients.replay
+"""
+import asyncio
+import logging
+import math
+import random
+import uuid
+
+from app.clients import config
+from app.clients import replay
+from app.services.memory.i_memory_store import MemoryStoreInterface, MemorySearchResult
+from app.entities.chapter import Chapter as ChapterEntity
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+DEFAULT_DIMENSION = 1024
+
+
+class ReplayMemoryStore(MemoryStoreInterface):
+    """
+    Embeddings are replayed from the recording when the text was recorded, and otherwise derived
+    from a hash of the text (so equal texts match); search is a brute-force cosine scan.
+    Scores are cosine distances like S3 Vectors returns, lower is closer.
+    """
+
+    def __init__(self, recording: replay.Recording = None, latency: replay.Latency = None,
+                 dimension: int = DEFAULT_DIMENSION):
+        self.recording = recording or replay.get_recording(config.llm_replay_path)
+        self.latency = latency or replay.Latency.parse(config.replay_embedding_latency)
+        self.dimension = dimension
+        self._indexes: dict[uuid.UUID, dict[int, list[float]]] = {}
+
+    def _derived_embedding(self, text: str) -> list[float]:
+        rng = random.Random(replay.text_key(text))
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector]
+
+    async def _generate_embedding(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency.sample())
+        return self.recording.get("embedding", replay.text_key(text)) or self._derived_embedding(text)
+
+    @staticmethod
+    def _cosine_distance(a: list[float], b: list[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return 1.0 - dot / norm if norm else 1.0
+
+    async def add_memory(self, story_id: uuid.UUID, chapter: ChapterEntity) -> None:
+        embedding = await self._generate_embedding(chapter.to_json())
+        self._indexes.setdefault(story_id, {})[chapter.number] = embedding
+
+    async def search_memories(self, story_id: uuid.UUID,
+                              query: str,
+                              max_results: int = 5) -> list[MemorySearchResult]:
+        index = self._indexes.get(story_id)
+        if not index:
+            return []
+        query_embedding = await self._generate_embedding(query)
+        results = [
+            MemorySearchResult(chapter_number=chapter_number,
+                               relevance_score=self._cosine_distance(query_embedding, embedding))
+            for chapter_number, embedding in index.items()
+        ]
+        results.sort(key=lambda result: result.relevance_score)
+        return results[:max_results]
+
+    async def delete_story_memories(self, story_id: uuid.UUID) -> None:
+        self._indexes.pop(story_id, None)
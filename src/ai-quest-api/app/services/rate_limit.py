@@ -0,0 +1,206 @@
+"""
+Per-user request and token limits, enforced before a story turn or /ask does any LLM work
+
+- requests per minute: a token bucket per user in process (absorbs bursts without I/O), and,
+  opt-in, a per-minute atomic counter in DynamoDB shared by every container (RATE_LIMIT_BACKEND=dynamodb).
+  Keyed on the authorizer's email, so requests over the rate are rejected before the user is looked up
+- tokens per day: the user's daily usage rollup (see token_tracker), cached briefly in process;
+  usage is written behind, so the cap may be overshot by the last few seconds of calls
+
+Limiter failures are logged and let the request through: availability beats exact quotas.
+"""
+import asyncio
+import collections
+import datetime
+import hashlib
+import logging
+import threading
+import time
+
+import fastapi
+from botocore.exceptions import ClientError
+
+from app.clients import config
+from app.clients import token_tracker
+from app.services import user
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+# Users with an in-process bucket or cached usage; least recently seen are evicted
+MAX_TRACKED_USERS = 10_000
+# Shared per-minute counters expire shortly after their window
+SHARED_COUNTER_TTL_SECONDS = 120
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """capacity tokens, refilled continuously at refill_per_second"""
+    def __init__(self, capacity: float, refill_per_second: float, now: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 when taken, otherwise the seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.refill_per_second
+
+
+def _seconds_until_midnight(now: datetime.datetime) -> float:
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), datetime.UTC)
+    return (midnight - now).total_seconds()
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int = None, tokens_per_day: int = None, backend: str = None,
+                 table=None, usage_cache_seconds: float = None):
+        self.requests_per_minute = requests_per_minute or config.rate_limit_requests_per_minute
+        self.tokens_per_day = tokens_per_day if tokens_per_day is not None else config.rate_limit_tokens_per_day
+        self.backend = backend or config.rate_limit_backend
+        if self.backend not in ("dynamodb", "memory"):
+            raise ValueError(f"Unsupported rate limit backend: {self.backend}")
+        self._table = table
+        self.usage_cache_seconds = usage_cache_seconds if usage_cache_seconds is not None \
+            else config.rate_limit_usage_cache_seconds
+        self._buckets: collections.OrderedDict[str, TokenBucket] = collections.OrderedDict()
+        # user_id -> (date, tokens used, read at)
+        self._daily_usage: collections.OrderedDict[str, tuple[str, int, float]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def table(self):
+        # The usage table holds the rollups and the shared counters
+        if self._table is None:
+            self._table = token_tracker.get_token_tracker().table
+        return self._table
+
+    def check(self, user_id: str) -> None:
+        """Count a request of the user; raises RateLimitExceeded when a limit is reached"""
+        self._take_local(user_id)
+        # Over-quota users do not spend a shared counter write
+        self.check_tokens(user_id)
+        if self.backend == "dynamodb":
+            self._take_shared(user_id, datetime.datetime.now(datetime.UTC))
+
+    def check_requests(self, key: str) -> None:
+        """Count a request against the per-minute rate of key (a user id or a hashed email)"""
+        self._take_local(key)
+        if self.backend == "dynamodb":
+            self._take_shared(key, datetime.datetime.now(datetime.UTC))
+
+    def check_tokens(self, user_id: str) -> None:
+        """Raises RateLimitExceeded once the user's token usage today reached the daily quota"""
+        now = datetime.datetime.now(datetime.UTC)
+        if self.tokens_per_day and self._daily_tokens(user_id, now) >= self.tokens_per_day:
+            raise RateLimitExceeded("Daily token quota exceeded", _seconds_until_midnight(now))
+
+    def _take_local(self, user_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.requests_per_minute, self.requests_per_minute / 60, now)
+                self._buckets[user_id] = bucket
+                if len(self._buckets) > MAX_TRACKED_USERS:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(user_id)
+            retry_after = bucket.take(now)
+        if retry_after:
+            raise RateLimitExceeded("Too many requests", retry_after)
+
+    def _daily_tokens(self, user_id: str, now: datetime.datetime) -> int:
+        date = now.strftime('%Y-%m-%d')
+        with self._lock:
+            cached = self._daily_usage.get(user_id)
+        if cached and cached[0] == date and time.monotonic() - cached[2] < self.usage_cache_seconds:
+            return cached[1]
+
+        try:
+            item = self.table.get_item(Key=token_tracker.user_rollup_key(user_id, date)).get('Item') or {}
+            used = int(item.get('total_tokens', 0))
+        except Exception as e:
+            logger.error(f"Could not read daily usage of user {user_id}: {e}")
+            return 0
+
+        with self._lock:
+            self._daily_usage[user_id] = (date, used, time.monotonic())
+            self._daily_usage.move_to_end(user_id)
+            if len(self._daily_usage) > MAX_TRACKED_USERS:
+                self._daily_usage.popitem(last=False)
+        return used
+
+    def _take_shared(self, user_id: str, now: datetime.datetime) -> None:
+        """Fixed one-minute window counted with a conditional atomic ADD"""
+        window = now.strftime('%Y-%m-%dT%H:%M')
+        try:
+            self.table.update_item(
+                Key={'service_date': f"ratelimit#user#{user_id}", 'timestamp_request_id': window},
+                UpdateExpression="ADD #requests :one SET #ttl = :ttl",
+                ConditionExpression="attribute_not_exists(#requests) OR #requests < :limit",
+                ExpressionAttributeNames={'#requests': 'requests', '#ttl': 'ttl'},
+                ExpressionAttributeValues={
+                    ':one': 1,
+                    ':limit': self.requests_per_minute,
+                    ':ttl': int(now.timestamp()) + SHARED_COUNTER_TTL_SECONDS,
+                },
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                raise RateLimitExceeded("Too many requests", 60 - now.second - now.microsecond / 1_000_000)
+            logger.error(f"Could not count request of user {user_id}: {e}")
+        except Exception as e:
+            logger.error(f"Could not count request of user {user_id}: {e}")
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter, so buckets persist across requests"""
+    global _limiter
+
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def _email_key(email: str) -> str:
+    # Shared counters are keyed by a digest, so no address is stored in the usage table
+    return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()[:32]
+
+
+async def limit_requests(request: fastapi.Request) -> None:
+    """Per-minute rate, checked on the authorizer's email before any database work"""
+    if config.rate_limit_enabled:
+        key = _email_key(user.get_user_email(request))
+        # The shared tier is a blocking DynamoDB call
+        await asyncio.to_thread(get_rate_limiter().check_requests, key)
+
+
+async def enforce_rate_limit(_: None = fastapi.Depends(limit_requests),
+                             user_info: user.UserInfo = fastapi.Depends(user.get_user_info)) -> user.UserInfo:
+    """
+    Dependency for endpoints that call an LLM. Also attributes the request's token usage to the user.
+
+    Async on purpose: the user id must be set in the request's own context, not a threadpool copy.
+    """
+    user_id = str(user_info.user_id)
+    token_tracker.current_user_id.set(user_id)
+    if config.rate_limit_enabled:
+        # Reads the cached daily rollup, which is keyed by user id
+        await asyncio.to_thread(get_rate_limiter().check_tokens, user_id)
+    return user_info
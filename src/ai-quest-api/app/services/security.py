@@ -1,3 +1,4 @@
+import hmac
 import logging
 import os
 
@@ -6,6 +7,9 @@ from fastapi import Request, HTTPException, status
 API_KEY_HEADER_NAME = os.environ.get("API_KEY_HEADER_NAME", "X-API-KEY")
 API_KEY = os.environ.get("API_KEY")
 IS_API_KEY_AUTH_DISABLED = os.environ.get("IS_API_KEY_AUTH_DISABLED", False)
+ADMIN_API_KEY_HEADER_NAME = os.environ.get("ADMIN_API_KEY_HEADER_NAME", "X-ADMIN-API-KEY")
+# Admin endpoints are disabled unless set; never bypassed by IS_API_KEY_AUTH_DISABLED
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -27,3 +31,13 @@ async def verify_api_key(request: Request):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+
+
+async def verify_admin_api_key(request: Request):
+    current_api_key = request.headers.get(ADMIN_API_KEY_HEADER_NAME)
+    if not ADMIN_API_KEY or not current_api_key or not hmac.compare_digest(current_api_key, ADMIN_API_KEY):
+        logger.warning("Could not validate admin credentials")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
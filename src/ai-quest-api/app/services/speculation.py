@@ -0,0 +1,101 @@
+"""
+Speculative pre-generation of the next turn
+
+After a turn, DM responses for the top-k offered choices are generated ahead of time and stored
+per (story, chapter number, choice); StoryService serves a matching decision from them instantly.
+Opt-in (SPECULATION_ENABLED) and capped by estimated cost per turn and per day.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+from decimal import Decimal
+
+import boto3
+
+from app.clients import config, model_routing
+from app.clients.token_tracker import get_token_tracker
+from app.services.user import UserInfo
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+LAMBDA_EVENT_KEY = "speculate"
+
+
+class SpeculationBudget:
+    """
+    Estimated spend on speculation per day, per process (each Lambda container has its own,
+    so the effective daily cap scales with concurrency).
+    """
+    def __init__(self, daily_budget_usd: float, max_cost_per_turn_usd: float):
+        self.daily_budget = Decimal(str(daily_budget_usd))
+        self.max_cost_per_turn = Decimal(str(max_cost_per_turn_usd))
+        self._day: datetime.date | None = None
+        self._spent = Decimal("0")
+        self._lock = threading.Lock()
+
+    def estimate(self, input_tokens: int) -> Decimal:
+        """Worst-case cost of one speculative DM call: estimated input plus the full output allowance"""
+        route = model_routing.get_route("dm.turn")
+        return get_token_tracker().estimate_cost(
+            route.provider, route.model_for(route.provider), input_tokens, route.max_tokens
+        )
+
+    def reserve(self, costs: list[Decimal]) -> int:
+        """Reserve budget for as many calls as fit, in order; returns how many may run"""
+        today = datetime.datetime.now(datetime.UTC).date()
+        with self._lock:
+            if self._day != today:
+                self._day, self._spent = today, Decimal("0")
+            allowed, turn_total = 0, Decimal("0")
+            for cost in costs:
+                if turn_total + cost > self.max_cost_per_turn or self._spent + turn_total + cost > self.daily_budget:
+                    break
+                turn_total += cost
+                allowed += 1
+            self._spent += turn_total
+        return allowed
+
+    def release(self, costs: list[Decimal]) -> None:
+        """Give back reserved budget of calls that failed (reserved today)"""
+        today = datetime.datetime.now(datetime.UTC).date()
+        with self._lock:
+            if self._day == today:
+                self._spent = max(Decimal("0"), self._spent - sum(costs, Decimal("0")))
+
+
+_budget = SpeculationBudget(config.speculation_daily_budget_usd, config.speculation_max_cost_per_turn_usd)
+
+
+def get_budget() -> SpeculationBudget:
+    return _budget
+
+
+def lambda_event(story_id: uuid.UUID, user_info: UserInfo) -> dict:
+    return {LAMBDA_EVENT_KEY: {
+        "story_id": str(story_id),
+        "user_id": str(user_info.user_id),
+        "email": user_info.email,
+        "locale": user_info.locale,
+    }}
+
+
+def parse_lambda_event(event: dict) -> tuple[uuid.UUID, UserInfo]:
+    payload = event[LAMBDA_EVENT_KEY]
+    user_info = UserInfo(user_id=uuid.UUID(payload["user_id"]), email=payload["email"], locale=payload["locale"])
+    return uuid.UUID(payload["story_id"]), user_info
+
+
+def invoke_lambda(story_id: uuid.UUID, user_info: UserInfo) -> None:
+    """
+    Hand speculation to an asynchronous invocation of this function: Mangum only returns
+    a response once background tasks are done, so they would delay the player's turn.
+    """
+    boto3.client('lambda').invoke(
+        FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+        InvocationType="Event",
+        Payload=json.dumps(lambda_event(story_id, user_info)).encode("utf-8"),
+    )
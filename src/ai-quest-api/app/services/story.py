@@ -1,78 +1,147 @@
+import asyncio
+import base64
 import datetime
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 import uuid
 
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.clients import config
 from app.entities.chapter import Chapter as ChapterEntity
 from app.entities.message import Message as MessageEntity
+from app.entities.speculation import Speculation as SpeculationEntity
 from app.entities.story import Story as StoryEntity
-from app.repositories.chapter import ChapterRepository
-from app.repositories.story import StoryRepository
-from app.repositories.message import MessageRepository
+from app.repositories.unit_of_work import AsyncUnitOfWork
 from app.services import dm
+from app.services import etag
+from app.services import speculation
+from app.services.context_assembler import ContextAssembler
 from app.services.memory.i_memory_store import MemoryStoreInterface
 from app.services.translator import Translator
 from app.services.story_context import StoryContext
 from app.services.user import UserInfo
-from app.schemas.story import Story as StoryResponse, FullStory as FullStoryResponse
+from app.schemas.story import Story as StoryResponse, FullStory as FullStoryResponse, StoryPage
 
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
+config = config.Config()
+
+DEFAULT_STORIES_PAGE_SIZE = 20
+
+
+def _encode_cursor(updated_at: datetime.datetime, story_id_bytes: bytes) -> str:
+    raw = f"{updated_at.isoformat()}|{story_id_bytes.hex()}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime.datetime, bytes]:
+    try:
+        updated_at, story_id_hex = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(updated_at), bytes.fromhex(story_id_hex)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid stories cursor: {cursor}") from e
+
+
+class PreparedTurn:
+    """State of a turn between reading the story and receiving the DM's answer"""
+    def __init__(self, story_entity: StoryEntity, user_decision: str, new_chapter_number: int,
+                 user_message_entity: MessageEntity, llm_messages: list[dict], estimated_input_tokens: int = 0,
+                 speculated_response: Optional['dm.DMResponse'] = None):
+        self.story_entity = story_entity
+        self.user_decision = user_decision
+        self.new_chapter_number = new_chapter_number
+        self.user_message_entity = user_message_entity
+        self.llm_messages = llm_messages
+        self.estimated_input_tokens = estimated_input_tokens
+        # Set when the decision matches a response generated ahead of time; no LLM call is needed
+        self.speculated_response = speculated_response
 
 
 class StoryService:
-    def __init__(self, db: Session, user_info: UserInfo, memory_service: Optional[MemoryStoreInterface] = None):
+    def __init__(self, db: AsyncSession, user_info: UserInfo, memory_service: Optional[MemoryStoreInterface] = None):
         self.db = db
         self.user_info = user_info
         self.dm = dm.DungeonMaster(user_info)
-        self.story_repository = StoryRepository(db)
-        self.message_repository = MessageRepository(db)
-        self.chapter_repository = ChapterRepository(db)
+        self.uow = AsyncUnitOfWork(db)
+        self.story_repository = self.uow.stories
+        self.message_repository = self.uow.messages
+        self.chapter_repository = self.uow.chapters
+        self.speculation_repository = self.uow.speculations
         self.memory_service = memory_service
+        self.context_assembler = ContextAssembler(self.dm.system_prompt, [self.dm.story_response_tool])
         self.story_context_service = StoryContext(db, user_info, memory_service)
         self.translator = Translator.get_instance(user_info.locale)
 
-    def get(self, story_id: uuid.UUID) -> FullStoryResponse:
-        # Get story by ID
-        story_entity = self.story_repository.get(story_id.bytes)
-        if not story_entity:
-            raise ValueError(f"Story with ID {story_id} not found")
+    @staticmethod
+    def _to_full_story(story_entity: StoryEntity, chapter_entities: list[ChapterEntity],
+                       limit: int | None = None) -> FullStoryResponse:
+        """Build the response for a page of chapters; the cursor is set only when more chapters follow"""
+        next_since_chapter = None
+        if limit is not None and len(chapter_entities) == limit and chapter_entities:
+            if chapter_entities[-1].number < story_entity.last_chapter_number:
+                next_since_chapter = chapter_entities[-1].number
 
-        # Get the last chapter to extract current choices
-        last_chapter = self.chapter_repository.get_last_chapter(story_id.bytes)
-        current_choices = last_chapter.choices_list if last_chapter else []
-
-        # Get chapters and convert them to proper format
-        chapter_entities = self.chapter_repository.get_chapters_by_story_id(story_id.bytes)
-
-        # Convert to response DTOs
-        full_story = FullStoryResponse(
+        return FullStoryResponse(
             id=story_entity.id,
             user_id=story_entity.user_id,
             title=story_entity.title,
+            chapter_count=story_entity.chapter_count,
+            last_played_at=story_entity.updated_at,
             chapters=chapter_entities,
-            current_choices=current_choices,
+            current_choices=story_entity.current_choices_list,
+            last_chapter_number=story_entity.last_chapter_number,
+            next_since_chapter=next_since_chapter,
         )
 
+    async def get(self, story_id: uuid.UUID, since_chapter: int = 0, limit: int | None = None) -> FullStoryResponse:
+        _, full_story = await self.get_if_modified(story_id, since_chapter, limit)
         return full_story
 
+    async def get_if_modified(self, story_id: uuid.UUID, since_chapter: int = 0, limit: int | None = None,
+                              if_none_match: str | None = None) -> tuple[str, FullStoryResponse | None]:
+        """
+        Return the story ETag and the story, or None instead of the story when the
+        client's If-None-Match still matches; then only the stories row has been read.
+        """
+        # Get story by ID
+        story_entity = await self.get_entity(story_id)
+
+        story_etag = etag.make_etag(
+            story_id, etag.story_version(story_entity.last_chapter_number, story_entity.title,
+                                         story_entity.summaries_version),
+            since_chapter, limit,
+        )
+        if etag.is_not_modified(if_none_match, story_etag):
+            return story_etag, None
+
+        return story_etag, await self._get_page(story_entity, since_chapter, limit)
+
+    async def _get_page(self, story_entity: StoryEntity, since_chapter: int, limit: int | None) -> FullStoryResponse:
+        # Nothing newer than what the client already has: skip the chapters query
+        if since_chapter >= story_entity.last_chapter_number:
+            return self._to_full_story(story_entity, [])
+
+        # Get the requested page of chapters
+        chapter_entities = await self.chapter_repository.get_chapters_page(story_entity.id, since_chapter, limit)
+
+        return self._to_full_story(story_entity, chapter_entities, limit)
+
     async def init(self, user_info: UserInfo) -> FullStoryResponse:
-        # Story init
-        story_entity = StoryEntity(user_id=user_info.user_id.bytes)
-        saved_story = self.story_repository.add(story_entity)
-        story_id_uuid = uuid.UUID(bytes=saved_story.id)
+        # Story init: the id is assigned up front so the whole story is written in one commit
+        story_id_uuid = uuid.uuid4()
         logger.debug(f"Story.id: {story_id_uuid}")
-        logger.info(f"Story created with ID: {story_id_uuid}")
 
         # Get intro message from the LLM
         initial_user_message = self.translator.translate('prompts.1st_user_message')
 
         messages = [{"role": "user", "content": initial_user_message}]
-        dm_intro_message = self.dm.send_messages(messages)
+        dm_intro_message = await self.dm.send_messages(messages, intro=True)
+        messages.append({"role": "assistant", "content": dm_intro_message.to_string()})
+        logger.debug(f"dm_intro_message.narration: {dm_intro_message.narration}")
 
-        # Record the 1st chapter
+        story_title = dm_intro_message.narration[:256]
         new_chapter = ChapterEntity(
             narration=dm_intro_message.narration,
             situation=dm_intro_message.situation,
@@ -80,9 +149,33 @@ class StoryService:
             action=initial_user_message,
             outcome=dm_intro_message.outcome,
             number=1,
-            story_id=saved_story.id
+            story_id=story_id_uuid.bytes
         )
-        self.chapter_repository.add(new_chapter)
+
+        # Story, 1st chapter and chat messages go out in a single transaction
+        async with self.uow:
+            self.story_repository.add(
+                StoryEntity(
+                    id=story_id_uuid.bytes,
+                    user_id=user_info.user_id.bytes,
+                    title=story_title,
+                    last_chapter_number=new_chapter.number,
+                    chapter_count=1,
+                    current_situation=new_chapter.situation,
+                    current_choices=new_chapter.choices,
+                )
+            )
+            self.chapter_repository.add(new_chapter)
+            self.message_repository.add_all([
+                MessageEntity(
+                    role=message.get("role"),
+                    content=message.get("content"),
+                    story_id=story_id_uuid.bytes,
+                    seq=MessageEntity.seq_for(new_chapter.number, message.get("role")),
+                )
+                for message in messages
+            ])
+        logger.info(f"Story created with ID: {story_id_uuid}")
 
         # Store in memory service if available
         if self.memory_service:
@@ -94,150 +187,298 @@ class StoryService:
             except Exception as e:
                 logger.warning(f"Failed to store memory: {e}")
 
-        # Save chat messages
-        logger.debug(f"dm_intro_message.narration: {dm_intro_message.narration}")
-        messages.append({"role": "assistant", "content": dm_intro_message.to_string()})
-
-        # Update story title
-        story_title = dm_intro_message.narration[:256]
-        self.story_repository.update_title(saved_story.id, story_title)
-
-        # Save new messages in the repository
-        message_entities = []
-        for message in messages:
-            message_entity = MessageEntity(
-                role=message.get("role"), content=message.get("content"), story_id=saved_story.id
-            )
-            self.message_repository.add(message_entity)
-            message_entities.append(message_entity)
-
-        # Get chapters and convert them to proper format
-        chapter_entities = self.chapter_repository.get_chapters_by_story_id(saved_story.id)
-
         # Convert to response DTOs
         full_story = FullStoryResponse(
-            id=saved_story.id,
+            id=story_id_uuid,
             user_id=user_info.user_id,
             title=story_title,
-            chapters=chapter_entities,
+            chapters=[new_chapter],
             current_choices=dm_intro_message.choices,
+            last_chapter_number=new_chapter.number,
         )
 
         return full_story
 
-    def list(self, user_info: UserInfo) -> list[StoryResponse]:
-        # Fetch stories for the user
-        story_entities = self.story_repository.list_by_user_id(user_info.user_id.bytes)
+    async def get_entity(self, story_id: uuid.UUID) -> StoryEntity:
+        """The stories row alone (head included), without chapters"""
+        story_entity = await self.story_repository.get(story_id.bytes)
+        if not story_entity:
+            raise ValueError(f"Story with ID {story_id} not found")
+        return story_entity
+
+    async def list(self, user_info: UserInfo, limit: int = DEFAULT_STORIES_PAGE_SIZE,
+                   cursor: str | None = None) -> StoryPage:
+        _, page = await self.list_if_modified(user_info, limit, cursor)
+        return page
+
+    async def list_if_modified(self, user_info: UserInfo, limit: int = DEFAULT_STORIES_PAGE_SIZE,
+                               cursor: str | None = None,
+                               if_none_match: str | None = None) -> tuple[str, StoryPage | None]:
+        """Return the page ETag and the page, or None instead of the page when If-None-Match matches"""
+        # Fetch one page of stories (plus one row to know whether another page follows)
+        after = _decode_cursor(cursor) if cursor else None
+        rows = await self.story_repository.list_page_by_user_id(user_info.user_id.bytes, limit + 1, after)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        page_etag = etag.make_etag(
+            limit, cursor, has_more,
+            *(f"{row.id.hex()}:{etag.story_version(row.last_chapter_number, row.title)}" for row in rows),
+        )
+        if etag.is_not_modified(if_none_match, page_etag):
+            return page_etag, None
+
         # Convert to schema DTOs
         stories = [
             StoryResponse(
-                id=story.id,
-                user_id=story.user_id,
-                title=story.title
+                id=row.id,
+                user_id=row.user_id,
+                title=row.title,
+                chapter_count=row.chapter_count,
+                last_played_at=row.updated_at,
+                situation_preview=row.situation_preview,
             )
-            for story in story_entities
+            for row in rows
         ]
-        return stories
-
-    async def act(self, story_id: uuid.UUID, user_decision: str) -> FullStoryResponse:
+        next_cursor = _encode_cursor(rows[-1].updated_at, rows[-1].id) if has_more else None
+        return page_etag, StoryPage(data=stories, next_cursor=next_cursor)
+
+    async def act(self, story_id: uuid.UUID, user_decision: str, since_chapter: int | None = None,
+                  delta: bool = False) -> FullStoryResponse:
+        """
+        Play one turn.
+
+        In delta mode only the new chapter is returned, with since_chapter only the chapters
+        after it; otherwise the whole story.
+        """
+        turn = await self._prepare_turn(story_id, user_decision)
+
+        # Get response from LLM, unless it was generated ahead of time
+        assistant_response = turn.speculated_response
+        if assistant_response is None:
+            await self.uow.release()
+            assistant_response = await self.dm.send_messages(turn.llm_messages)
+
+        return await self._complete_turn(turn, assistant_response, since_chapter, delta)
+
+    async def act_stream(self, story_id: uuid.UUID, user_decision: str) -> AsyncIterator[dm.DMStreamDelta | FullStoryResponse]:
+        """
+        Play one turn while streaming the DM's narration and outcome as they are generated.
+
+        Yields DMStreamDelta items, then the story delta (the new chapter) once it is persisted.
+        """
+        turn = await self._prepare_turn(story_id, user_decision)
+
+        if turn.speculated_response:
+            for field in dm.STREAMED_FIELDS:
+                yield dm.DMStreamDelta(field, getattr(turn.speculated_response, field))
+            yield await self._complete_turn(turn, turn.speculated_response, delta=True)
+            return
+
+        await self.uow.release()
+        async for event in self.dm.stream_messages(turn.llm_messages):
+            if isinstance(event, dm.DMResponse):
+                yield await self._complete_turn(turn, event, delta=True)
+            else:
+                yield event
+
+    async def _prepare_turn(self, story_id: uuid.UUID, user_decision: str,
+                            use_speculation: bool = True) -> 'PreparedTurn':
+        """Everything read before the LLM call: story head, recent messages and memory context"""
         # Get existing story
-        story_entity = self.story_repository.get(story_id.bytes)
+        story_entity = await self.story_repository.get(story_id.bytes)
         if not story_entity:
             raise ValueError(f"Story with ID {story_id} not found")
 
-        # Get existing messages
-        message_entities = self.message_repository.get_messages_by_story_id(story_id.bytes)
+        new_chapter_number = story_entity.last_chapter_number + 1
+
+        # Add user message to the story
+        user_message_entity = MessageEntity(
+            role="user",
+            content=user_decision,
+            story_id=story_id.bytes,
+            seq=MessageEntity.seq_for(new_chapter_number, "user"),
+            created_at=datetime.datetime.now(datetime.UTC),
+        )
+
+        if use_speculation and config.speculation_enabled:
+            speculation_entity = await self.speculation_repository.get(
+                story_id.bytes, new_chapter_number, user_decision
+            )
+            if speculation_entity:
+                logger.info(f"Serving chapter {new_chapter_number} of Story {story_id} from a speculation")
+                return PreparedTurn(story_entity, user_decision, new_chapter_number, user_message_entity, [],
+                                    speculated_response=dm.DMResponse(**speculation_entity.response))
+
+        # Don't spend DB and embedding work on a turn no provider can answer
+        self.dm.ensure_available()
+
+        # Get the most recent messages; the window start is stable across turns to keep the prompt cacheable
+        message_entities = await self.message_repository.get_history_window(
+            story_id.bytes, story_entity.last_chapter_number
+        )
 
         # Get memory context if memory service is available
         memory_context = ""
         if self.memory_service:
             try:
-                # Get last chapter for current situation
-                last_chapter = self.chapter_repository.get_last_chapter(story_id.bytes)
-                current_situation = last_chapter.situation if last_chapter else user_decision
+                # Current situation is read from the story head
+                current_situation = story_entity.current_situation or ""
 
                 # Get relevant memories
-                memory_context = await self.story_context_service.provide_context(story_id, current_situation)
+                memory_context = await self.story_context_service.provide_context(
+                    story_id, current_situation, user_decision
+                )
             except Exception as e:
                 logger.warning(f"Failed to get memory context: {e}")
 
-        user_decision_with_context = f"Relevant past events for context:\n{memory_context}\n\nCurrent action: {user_decision}" if memory_context else user_decision
+        # Fit history, memory and action into the input budget; memory is only sent, never stored
+        context = self.context_assembler.assemble(message_entities, user_decision, memory_context)
+        logger.debug(f"DM request tokens (estimated): {context.tokens}, total {context.total_tokens}")
 
-        # Add user message to the story
-        user_message_entity = MessageEntity(
-            role="user",
-            content=user_decision_with_context,
-            story_id=story_id.bytes,
-            created_at=datetime.datetime.now(datetime.UTC),
-        )
-        message_entities.append(user_message_entity)
+        return PreparedTurn(story_entity, user_decision, new_chapter_number, user_message_entity, context.messages,
+                            estimated_input_tokens=context.total_tokens)
 
-        # Format messages for LLM
-        llm_messages = [
-            {"role": message.role, "content": message.content}
-            for message in message_entities
-        ]
+    async def _bump_summaries_version(self, story_id: uuid.UUID) -> None:
+        """Within the committing unit of work: mark summaries written while preparing turns"""
+        summarized = self.story_context_service.chapter_summarization_service.summarized_story_ids
+        if story_id.bytes in summarized:
+            summarized.discard(story_id.bytes)
+            await self.story_repository.bump_summaries_version(story_id.bytes)
 
-        # Get response from LLM
-        assistant_response = self.dm.send_messages(llm_messages)
+    async def _complete_turn(self, turn: 'PreparedTurn', assistant_response: dm.DMResponse,
+                             since_chapter: int | None = None, delta: bool = False) -> FullStoryResponse:
+        """Persist the DM's answer as the next chapter and build the response"""
+        story_entity = turn.story_entity
+        story_id = story_entity.get_id()
+        new_chapter_number = turn.new_chapter_number
 
         # Record the new chapter
-        new_chapter_number = self.chapter_repository.get_max_chapter_number(story_id.bytes) + 1
         new_chapter = ChapterEntity(
             narration=assistant_response.narration,
             situation=assistant_response.situation,
             choices=assistant_response.choices,
-            action=user_decision,
+            action=turn.user_decision,
             outcome=assistant_response.outcome,
             number=new_chapter_number,
             story_id=story_id.bytes,
         )
-        self.chapter_repository.add(new_chapter)
-
-        # Store in memory service if available
-        if self.memory_service:
-            try:
-                await self.memory_service.add_memory(
-                    story_id,
-                    chapter=new_chapter,
-                )
-            except Exception as e:
-                logger.warning(f"Failed to store memory: {e}")
 
-        # Save chat messages
         logger.debug(f"last_message narration: {assistant_response.narration}")
-        llm_messages.append({"role": "assistant", "content": assistant_response.to_string()})
 
         # Add LLM response to the story
         assistant_message_entity = MessageEntity(
             role="assistant",
             content=assistant_response.to_string(),
             story_id=story_id.bytes,
+            seq=MessageEntity.seq_for(new_chapter_number, "assistant"),
             created_at=datetime.datetime.now(datetime.UTC),
         )
-        message_entities.append(assistant_message_entity)
 
-        # Save when we have both messages
-        self.message_repository.add(user_message_entity)
-        self.message_repository.add(assistant_message_entity)
+        # Chapter, story head, both messages and any summaries produced while building context commit together
+        async with self.uow:
+            await self.story_repository.advance_head(story_entity, new_chapter)
+            await self._bump_summaries_version(story_id)
+            self.chapter_repository.add(new_chapter)
+            self.message_repository.add_all([turn.user_message_entity, assistant_message_entity])
+            if config.speculation_enabled:
+                # Speculations for this chapter (the other choices) and earlier ones can no longer be served
+                await self.speculation_repository.delete_up_to(story_id.bytes, new_chapter_number)
 
-        # Convert to response DTOs with proper UUID conversion
-        chapter_entities = self.chapter_repository.get_chapters_by_story_id(story_id.bytes)
+        # Store in memory service if available
+        if self.memory_service:
+            try:
+                await self.memory_service.add_memory(
+                    story_id,
+                    chapter=new_chapter,
+                )
+            except Exception as e:
+                logger.warning(f"Failed to store memory: {e}")
 
-        # Convert to response DTOs
-        full_story = FullStoryResponse(
-            id=story_entity.id,
-            user_id=story_entity.user_id,
-            title=story_entity.title,
-            chapters=chapter_entities,
-            current_choices=assistant_response.choices,
-        )
+        # The delta is already in memory, older chapters are only read when asked for
+        if delta:
+            since_chapter = new_chapter_number - 1
+        if since_chapter is not None and since_chapter >= new_chapter_number - 1:
+            chapter_entities = [new_chapter] if since_chapter < new_chapter_number else []
+        else:
+            chapter_entities = await self.chapter_repository.get_chapters_page(story_id.bytes, since_chapter or 0)
 
-        return full_story
+        return self._to_full_story(story_entity, chapter_entities)
+
+    async def speculate(self, story_id: uuid.UUID) -> int:
+        """
+        Generate and store DM responses for the top-k choices of the story head, within the budget.
+
+        Returns how many speculations were stored.
+        """
+        story_entity = await self.story_repository.get(story_id.bytes)
+        if not story_entity:
+            raise ValueError(f"Story with ID {story_id} not found")
+        new_chapter_number = story_entity.last_chapter_number + 1
+
+        existing_keys = await self.speculation_repository.get_choice_keys(story_id.bytes, new_chapter_number)
+        choices = [
+            choice for choice in story_entity.current_choices_list
+            if SpeculationEntity.key_for(choice) not in existing_keys
+        ][:config.speculation_top_k]
+
+        # Context is built sequentially (one session), the LLM calls then run concurrently
+        turns = [await self._prepare_turn(story_id, choice, use_speculation=False) for choice in choices]
+        budget = speculation.get_budget()
+        costs = [budget.estimate(turn.estimated_input_tokens) for turn in turns]
+        allowed = budget.reserve(costs)
+        turns, costs = turns[:allowed], costs[:allowed]
+        if not turns:
+            return 0
+
+        # The final head check must see turns committed while the LLM calls run, not this snapshot
+        await self.uow.release()
+        try:
+            responses = await asyncio.gather(
+                *(self.dm.send_messages(turn.llm_messages) for turn in turns), return_exceptions=True
+            )
+        except BaseException:
+            # Cancelled: nothing to store, the reservation is given back
+            budget.release(costs)
+            raise
+
+        speculation_entities = []
+        failed_costs = []
+        for turn, cost, response in zip(turns, costs, responses):
+            if isinstance(response, BaseException):
+                logger.warning(f"Speculation for '{turn.user_decision}' failed: {response}")
+                failed_costs.append(cost)
+                continue
+            speculation_entities.append(SpeculationEntity(
+                story_id=story_id.bytes,
+                chapter_number=new_chapter_number,
+                choice=turn.user_decision,
+                response=response.to_dict(),
+            ))
+        if failed_costs:
+            budget.release(failed_costs)
+
+        try:
+            async with self.uow:
+                # Summaries produced while building the speculative contexts commit here
+                await self._bump_summaries_version(story_id)
+                # The player may have acted meanwhile; speculating for a past head is wasted
+                last_chapter_number = await self.story_repository.get_last_chapter_number(story_id.bytes)
+                if last_chapter_number is None or last_chapter_number + 1 != new_chapter_number:
+                    return 0
+                for speculation_entity in speculation_entities:
+                    self.speculation_repository.add(speculation_entity)
+        except IntegrityError:
+            # A concurrent speculation run stored the same choices first
+            return 0
+
+        logger.info(f"Stored {len(speculation_entities)} speculations for chapter {new_chapter_number} of Story {story_id}")
+        return len(speculation_entities)
 
     async def delete(self, story_id: uuid.UUID) -> None:
         """Delete story and associated memories"""
-        self.story_repository.delete(story_id.bytes)
+        async with self.uow:
+            await self.story_repository.delete(story_id.bytes)
 
         # Clean up memories if service is available
         if self.memory_service:
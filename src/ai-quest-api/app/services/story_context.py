@@ -1,10 +1,10 @@
 import logging
 import uuid
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.repositories.chapter import ChapterRepository
-from app.repositories.story import StoryRepository
+from app.repositories.chapter import AsyncChapterRepository
+from app.repositories.story import AsyncStoryRepository
 from app.services.chapter_summarization import ChapterSummarizationService
 from app.services.memory.i_memory_store import MemoryStoreInterface
 from app.services.user import UserInfo
@@ -17,27 +17,26 @@ logger.setLevel(logging.DEBUG)
 
 
 class StoryContext:
-    def __init__(self, db: Session, user_info: UserInfo, memory_store: MemoryStoreInterface):
+    def __init__(self, db: AsyncSession, user_info: UserInfo, memory_store: MemoryStoreInterface):
         self.user_info = user_info
-        self.story_repository = StoryRepository(db)
-        self.chapter_repository = ChapterRepository(db)
+        self.story_repository = AsyncStoryRepository(db)
+        self.chapter_repository = AsyncChapterRepository(db)
         self.memory_store = memory_store
         self.chapter_summarization_service = ChapterSummarizationService(db, user_info)
         self.translator = Translator.get_instance(user_info.locale)
 
-    async def provide_context(self, story_id: uuid.UUID, user_decision: str) -> str:
-        """Async version that can safely call memory store without blocking main thread"""
-        last_chapter = self.chapter_repository.get_last_chapter(story_id.bytes)
-        current_situation = f"""{last_chapter.situation}
-{user_decision}"""
+    async def provide_context(self, story_id: uuid.UUID, current_situation: str, user_decision: str) -> str:
+        """Async version that can safely call memory store without blocking main thread
 
-        if not last_chapter:
-            raise ValueError(f"Last chapter for story {story_id} not found")
+        current_situation comes from the story head, so no chapter lookup is needed here.
+        """
+        query = f"""{current_situation}
+{user_decision}"""
 
         # Search for relevant N chapters
         search_results = await self.memory_store.search_memories(
             story_id=story_id,
-            query=current_situation,
+            query=query,
             max_results=CONTEXT_CHAPTERS_NUM,
         )
 
@@ -51,8 +50,8 @@ class StoryContext:
 
         # Sort by chapter number to maintain chronological order
         for result in sorted(search_results, key=lambda search_result: search_result.chapter_number):
-            chapter = self.chapter_repository.get_chapter(story_id.bytes, result.chapter_number)
-            chapter_summary = self.chapter_summarization_service.summarize_chapter(chapter)
+            chapter = await self.chapter_repository.get_chapter(story_id.bytes, result.chapter_number)
+            chapter_summary = await self.chapter_summarization_service.summarize_chapter(chapter)
             context_parts.append(
                 f"\n[{self.translator.translate('story_context.chapter_label')} {chapter.number}] ({self.translator.translate('story_context.relevance_label')}: {result.relevance_score:.2f}): {chapter_summary}"
             )
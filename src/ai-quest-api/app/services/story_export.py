@@ -0,0 +1,86 @@
+import json
+import logging
+from typing import AsyncIterator, Literal
+import uuid
+
+from sqlalchemy import asc, select
+
+from app.clients import db_client
+from app.entities.chapter import Chapter as ChapterEntity
+from app.entities.story import Story as StoryEntity
+
+logger = logging.getLogger()
+logger.setLevel(logging.DEBUG)
+
+EXPORT_BATCH_SIZE = 100
+# Mangum buffers the whole response and Lambda caps it at 6 MB, so one export holds at most
+# this many chapters (a few KB each); longer stories are exported in parts
+MAX_EXPORT_CHAPTERS = 1000
+NEXT_PART_HEADER = "X-Export-Next-Since-Chapter"
+
+ExportFormat = Literal["ndjson", "markdown"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "markdown": "text/markdown; charset=utf-8",
+}
+FILE_EXTENSIONS = {
+    "ndjson": "ndjson",
+    "markdown": "md",
+}
+
+
+def _chapter_to_markdown(chapter: ChapterEntity) -> str:
+    choices = "\n".join(f"- {choice}" for choice in chapter.choices_list)
+    return f"""## Chapter {chapter.number}
+
+> {chapter.action}
+
+{chapter.outcome}
+
+{chapter.narration}
+
+*{chapter.situation}*
+
+{choices}
+
+"""
+
+
+def next_part(story: StoryEntity, since_chapter: int, limit: int) -> int | None:
+    """since_chapter of the part after this one, None when this part reaches the story head"""
+    last_exported = since_chapter + limit
+    return last_exported if last_exported < story.last_chapter_number else None
+
+
+async def export_story(story: StoryEntity, export_format: ExportFormat, since_chapter: int = 0,
+                       limit: int = MAX_EXPORT_CHAPTERS) -> AsyncIterator[str]:
+    """
+    Stream up to limit chapters of a story after since_chapter, chapter by chapter.
+
+    Runs on its own session because the response is consumed after the request's
+    session is gone. yield_per fetches rows in batches through a server-side cursor
+    (aiomysql SSCursor), so the database side stays flat; on Lambda the response itself
+    is buffered by Mangum, hence the chapter cap per part.
+    """
+    story_id = uuid.UUID(bytes=story.id)
+    logger.info(f"Exporting story {story_id} as {export_format}, {limit} chapters after {since_chapter}")
+
+    if export_format == "markdown" and since_chapter == 0:
+        yield f"# {story.title or 'Untitled'}\n\n"
+
+    query = (
+        select(ChapterEntity)
+        .filter(ChapterEntity.story_id == story.id, ChapterEntity.number > since_chapter)
+        .order_by(asc(ChapterEntity.number))
+        .limit(min(limit, MAX_EXPORT_CHAPTERS))
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    async with db_client.async_session() as db:
+        chapters = await db.stream_scalars(query)
+        async for chapter in chapters:
+            if export_format == "markdown":
+                yield _chapter_to_markdown(chapter)
+            else:
+                yield json.dumps(chapter.to_dict(), ensure_ascii=False) + "\n"
@@ -0,0 +1,176 @@
+"""
+Usage reports from the raw token usage items (see token_tracker)
+
+Each day of the range is one partition (service_date "<service>#<date>"); days are queried
+in parallel on a bounded thread pool, every page is followed, and items are folded into
+a per-day aggregate as pages arrive, so no day's items are held in memory at once.
+Aggregates of closed days cannot change any more and are cached in process.
+
+Queries go through the table's low-level client: boto3 resources are not thread-safe,
+and the table resource is shared with the token tracker's writer thread.
+"""
+import collections
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Iterator
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from app.clients import config
+from app.clients.token_tracker import get_token_tracker
+
+logger = logging.getLogger(__name__)
+config = config.Config()
+
+MAX_RANGE_DAYS = 366
+# Items are tracked write-behind, so a day is closed only once late flushes have landed
+CLOSED_DAY_GRACE = datetime.timedelta(hours=1)
+COUNTERS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens',
+            'total_tokens', 'estimated_cost_usd')
+
+
+class UsageAggregate:
+    """Running totals, overall and per model"""
+    def __init__(self):
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.requests = 0
+        self.models: dict[str, dict] = collections.defaultdict(lambda: {**dict.fromkeys(COUNTERS, 0), 'requests': 0})
+
+    def add(self, item: dict) -> None:
+        model = self.models[item.get('model', 'unknown')]
+        for counter in COUNTERS:
+            value = item.get(counter, 0)
+            self.totals[counter] += value
+            model[counter] += value
+        self.requests += 1
+        model['requests'] += 1
+
+    def merge(self, other: 'UsageAggregate') -> 'UsageAggregate':
+        for counter in COUNTERS:
+            self.totals[counter] += other.totals[counter]
+        self.requests += other.requests
+        for name, counters in other.models.items():
+            model = self.models[name]
+            for counter, value in counters.items():
+                model[counter] += value
+        return self
+
+    @staticmethod
+    def _plain(counters: dict) -> dict:
+        return {
+            counter: float(value) if counter == 'estimated_cost_usd' else int(value)
+            for counter, value in counters.items()
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            **self._plain(self.totals),
+            'requests': self.requests,
+            'models': {name: self._plain(counters) for name, counters in sorted(self.models.items())},
+        }
+
+
+class UsageQueryEngine:
+    def __init__(self, table=None, max_workers: int = None, cache_max_days: int = None):
+        self.table = table if table is not None else get_token_tracker().table
+        self.max_workers = max_workers or config.usage_query_max_workers
+        self.cache_max_days = cache_max_days or config.usage_query_cache_max_days
+        self._closed_days: collections.OrderedDict[tuple[str, datetime.date], UsageAggregate] = \
+            collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._counters = {'days_queried': 0, 'days_cached': 0}
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {**self._counters, 'cached_days': len(self._closed_days)}
+
+    def iter_items(self, **query) -> Iterator[dict]:
+        """Items of a query, page by page (a page stops at 1 MB)"""
+        serializer, deserializer = TypeSerializer(), TypeDeserializer()
+        query['TableName'] = self.table.name
+        query['ExpressionAttributeValues'] = {
+            name: serializer.serialize(value) for name, value in query['ExpressionAttributeValues'].items()
+        }
+        while True:
+            response = self.table.meta.client.query(**query)
+            for item in response.get('Items', []):
+                yield {name: deserializer.deserialize(value) for name, value in item.items()}
+            if 'LastEvaluatedKey' not in response:
+                return
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def _is_closed(day: datetime.date, now: datetime.datetime) -> bool:
+        day_end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(), datetime.UTC)
+        return day_end + CLOSED_DAY_GRACE <= now
+
+    def _query_day(self, service: str, day: datetime.date, now: datetime.datetime) -> UsageAggregate:
+        key = (service, day)
+        with self._cache_lock:
+            if key in self._closed_days:
+                self._closed_days.move_to_end(key)
+                self._counters['days_cached'] += 1
+                return self._closed_days[key]
+
+        aggregate = UsageAggregate()
+        for item in self.iter_items(
+            KeyConditionExpression='service_date = :service_date',
+            ExpressionAttributeValues={':service_date': f"{service}#{day.isoformat()}"},
+        ):
+            aggregate.add(item)
+
+        with self._cache_lock:
+            self._counters['days_queried'] += 1
+            if self._is_closed(day, now):
+                self._closed_days[key] = aggregate
+                while len(self._closed_days) > self.cache_max_days:
+                    self._closed_days.popitem(last=False)
+        return aggregate
+
+    def daily_usage(self, service: str, start_date: datetime.date,
+                    end_date: datetime.date) -> dict[datetime.date, UsageAggregate]:
+        """Per-day aggregates of a service, days queried concurrently"""
+        if end_date < start_date:
+            raise ValueError("end_date must not be before start_date")
+        days = [start_date + datetime.timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+        if len(days) > MAX_RANGE_DAYS:
+            raise ValueError(f"Date range exceeds {MAX_RANGE_DAYS} days")
+
+        now = datetime.datetime.now(datetime.UTC)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(days)),
+                                thread_name_prefix="usage-query") as executor:
+            return dict(zip(days, executor.map(lambda day: self._query_day(service, day, now), days)))
+
+    def usage_report(self, service: str, start_date: datetime.date, end_date: datetime.date) -> dict:
+        daily = self.daily_usage(service, start_date, end_date)
+        total = UsageAggregate()
+        for aggregate in daily.values():
+            total.merge(aggregate)
+        return {
+            'service': service,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            **total.to_dict(),
+            'days': [
+                {'date': day.isoformat(), **aggregate.to_dict()}
+                for day, aggregate in daily.items() if aggregate.requests
+            ],
+        }
+
+
+_engine: UsageQueryEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_usage_query_engine() -> UsageQueryEngine:
+    """Process-wide engine, so the closed-day cache outlives a request"""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = UsageQueryEngine()
+    return _engine
@@ -0,0 +1,224 @@
+"""
+Offline analytics over exported token usage items (see token_tracker)
+
+Items are exported once from DynamoDB into columns: numeric columns as typed arrays,
+model/user as dictionary-encoded codes. Reports then run as whole-column operations
+(bincount over codes, percentiles over token counts) instead of a Python loop over Decimals.
+
+numpy (and pyarrow for Parquet) are needed only here, so they are imported on use and
+are not dependencies of the API: pip install numpy pyarrow
+"""
+import array
+import datetime
+import logging
+import os
+from typing import Iterable
+
+from app.services.usage import UsageQueryEngine
+
+logger = logging.getLogger(__name__)
+
+# name -> array typecode
+NUMERIC_COLUMNS = {
+    'timestamp': 'q',  # epoch seconds
+    'input_tokens': 'q',
+    'output_tokens': 'q',
+    'cache_creation_input_tokens': 'q',
+    'cache_read_input_tokens': 'q',
+    'total_tokens': 'q',
+    'estimated_cost_usd': 'd',
+}
+CATEGORICAL_COLUMNS = ('model', 'user_id')
+UNKNOWN = ''
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Usage analytics need numpy: pip install numpy") from e
+    return numpy
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet files need pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+class UsageColumns:
+    """Usage items as columns, appended item by item without numpy"""
+    def __init__(self):
+        self.numeric = {name: array.array(typecode) for name, typecode in NUMERIC_COLUMNS.items()}
+        self.codes = {name: array.array('i') for name in CATEGORICAL_COLUMNS}
+        self.labels: dict[str, dict[str, int]] = {name: {} for name in CATEGORICAL_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.numeric['timestamp'])
+
+    def append(self, item: dict) -> None:
+        timestamp = datetime.datetime.fromisoformat(item['timestamp'])
+        self.numeric['timestamp'].append(int(timestamp.timestamp()))
+        for name, typecode in NUMERIC_COLUMNS.items():
+            if name != 'timestamp':
+                value = item.get(name, 0)
+                self.numeric[name].append(float(value) if typecode == 'd' else int(value))
+        for name in CATEGORICAL_COLUMNS:
+            labels = self.labels[name]
+            self.codes[name].append(labels.setdefault(str(item.get(name) or UNKNOWN), len(labels)))
+
+    def extend(self, items: Iterable[dict]) -> 'UsageColumns':
+        for item in items:
+            self.append(item)
+        return self
+
+    def to_arrays(self) -> dict:
+        """Column name -> numpy array; categoricals as <name> codes plus <name>_labels"""
+        np = _numpy()
+        arrays = {name: np.frombuffer(column, dtype=column.typecode) if len(column)
+                  else np.array([], dtype=column.typecode) for name, column in self.numeric.items()}
+        for name in CATEGORICAL_COLUMNS:
+            column = self.codes[name]
+            arrays[name] = np.frombuffer(column, dtype=column.typecode) if len(column) \
+                else np.array([], dtype='i')
+            arrays[f"{name}_labels"] = np.array(list(self.labels[name]), dtype=str)
+        return arrays
+
+
+def export_usage(service: str, start_date: datetime.date, end_date: datetime.date,
+                 engine: UsageQueryEngine = None) -> UsageColumns:
+    """Every usage item of a service in the date range, one partition query per day"""
+    engine = engine or UsageQueryEngine()
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+
+    columns = UsageColumns()
+    day = start_date
+    while day <= end_date:
+        columns.extend(engine.iter_items(
+            KeyConditionExpression='service_date = :service_date',
+            ExpressionAttributeValues={':service_date': f"{service}#{day.isoformat()}"},
+        ))
+        day += datetime.timedelta(days=1)
+    logger.info(f"Exported {len(columns)} usage items of {service} from {start_date} to {end_date}")
+    return columns
+
+
+def _check_format(path: str) -> None:
+    if not path.endswith(('.parquet', '.npz')):
+        raise ValueError(f"Unsupported export format: {os.path.splitext(path)[1] or path}")
+
+
+def save(arrays: dict, path: str) -> None:
+    """Write columns to .parquet (categoricals as dictionary columns) or .npz"""
+    _check_format(path)
+    if path.endswith('.parquet'):
+        pa = _pyarrow()
+        columns = {name: values for name, values in arrays.items() if not name.endswith('_labels')}
+        for name in CATEGORICAL_COLUMNS:
+            columns[name] = pa.DictionaryArray.from_arrays(arrays[name], arrays[f"{name}_labels"])
+        pa.parquet.write_table(pa.table(columns), path)
+    else:
+        _numpy().savez_compressed(path, **arrays)
+
+
+def load(path: str) -> dict:
+    """Columns written by save()"""
+    _check_format(path)
+    np = _numpy()
+    if path.endswith('.parquet'):
+        pa = _pyarrow()
+        table = pa.parquet.read_table(path)
+        arrays = {}
+        for name in table.column_names:
+            column = table.column(name).combine_chunks()
+            if name in CATEGORICAL_COLUMNS:
+                if not pa.types.is_dictionary(column.type):
+                    column = column.dictionary_encode()
+                arrays[name] = column.indices.to_numpy(zero_copy_only=False).astype('i')
+                arrays[f"{name}_labels"] = np.array(column.dictionary.to_pylist(), dtype=str)
+            else:
+                arrays[name] = column.to_numpy(zero_copy_only=False)
+        return arrays
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+class UsageAnalytics:
+    def __init__(self, arrays: dict):
+        self.np = _numpy()
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays['timestamp'])
+
+    def _sum_by(self, name: str, values) -> dict[str, float]:
+        """Sum of values per label of a categorical column"""
+        labels = self.arrays[f"{name}_labels"]
+        sums = self.np.bincount(self.arrays[name], weights=values, minlength=len(labels))
+        return {str(label): float(total) for label, total in zip(labels, sums)}
+
+    def cost_by(self, name: str) -> dict[str, dict]:
+        """Requests, tokens and cost per model or user_id"""
+        if name not in CATEGORICAL_COLUMNS:
+            raise ValueError(f"Cannot group by {name}")
+        requests = self._sum_by(name, None)
+        tokens = self._sum_by(name, self.arrays['total_tokens'])
+        cost = self._sum_by(name, self.arrays['estimated_cost_usd'])
+        return {
+            label: {'requests': int(requests[label]), 'total_tokens': int(tokens[label]),
+                    'estimated_cost_usd': cost[label]}
+            for label in requests if requests[label]
+        }
+
+    def cost_by_hour(self) -> dict[str, float]:
+        """Cost per UTC hour (ISO timestamp of the hour), hours without usage omitted"""
+        if not len(self):
+            return {}
+        hours = self.arrays['timestamp'] // 3600
+        first = int(hours.min())
+        cost = self.np.bincount(hours - first, weights=self.arrays['estimated_cost_usd'])
+        counts = self.np.bincount(hours - first)
+        return {
+            datetime.datetime.fromtimestamp((first + offset) * 3600, datetime.UTC).isoformat(): float(cost[offset])
+            for offset in self.np.flatnonzero(counts)
+        }
+
+    def token_percentiles(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> dict[str, dict]:
+        """Percentiles of input, output and total tokens per request"""
+        percentiles = list(percentiles)
+        result = {}
+        for name in ('input_tokens', 'output_tokens', 'total_tokens'):
+            values = self.np.percentile(self.arrays[name], percentiles) if len(self) else [0] * len(percentiles)
+            result[name] = {f"p{p:g}": float(value) for p, value in zip(percentiles, values)}
+        return result
+
+    def cache_hit_ratios(self) -> dict:
+        """Share of prompt tokens read from the prompt cache, overall and per model"""
+        read = self.arrays['cache_read_input_tokens']
+        prompt = self.arrays['input_tokens'] + read + self.arrays['cache_creation_input_tokens']
+        read_by_model = self._sum_by('model', read)
+        prompt_by_model = self._sum_by('model', prompt)
+        total_prompt = float(prompt.sum())
+        return {
+            'overall': float(read.sum()) / total_prompt if total_prompt else 0.0,
+            'models': {
+                label: read_by_model[label] / prompt_by_model[label]
+                for label in prompt_by_model if prompt_by_model[label]
+            },
+        }
+
+    def report(self) -> dict:
+        return {
+            'requests': len(self),
+            'estimated_cost_usd': float(self.arrays['estimated_cost_usd'].sum()),
+            'models': self.cost_by('model'),
+            'users': self.cost_by('user_id'),
+            'hours': self.cost_by_hour(),
+            'token_percentiles': self.token_percentiles(),
+            'cache_hit_ratios': self.cache_hit_ratios(),
+        }
@@ -25,18 +25,12 @@ class UserInfo:
         self.locale = locale or "en"
 
 
-def get_user_info(request: Request) -> UserInfo:
-    """
-    Dependency to extract user information from the authorizer context.
-    This works when the request comes through API Gateway with the Lambda authorizer.
-    """
-    try:
-        # In local development, we might not have the authorizer context
-        if APP_ENV == "local":
-            logger.debug("Running in local environment, skipping user info extraction")
-            test_uuid = uuid.UUID('00000000-0000-0000-0000-000000000000')
-            return UserInfo(user_id=test_uuid, email="test@test.com", name="Test User")
+LOCAL_USER_EMAIL = "test@test.com"
+
 
+def _get_authorizer_context(request: Request) -> dict:
+    """The Lambda authorizer's context of the API Gateway event; raises HTTPException 401 without one"""
+    try:
         # Access the Lambda event context through Mangum
         # The authorizer context is available in the event
         if hasattr(request.scope, 'aws_event'):
@@ -51,27 +45,52 @@ def get_user_info(request: Request) -> UserInfo:
 
         if aws_event and 'requestContext' in aws_event:
             authorizer_context = aws_event['requestContext'].get('authorizer', {})
+        else:
+            logger.error("No AWS event context found")
+            raise HTTPException(status_code=401, detail="Authentication context not found")
+
+        if not authorizer_context.get('email'):
+            logger.error("No email found in authorizer context")
+            raise HTTPException(status_code=401, detail="No user email found")
+        return authorizer_context
 
-            email = authorizer_context.get('email')
-            if not email:
-                logger.error("No email found in authorizer context")
-                raise HTTPException(status_code=401, detail="No user email found")
+    except Exception as e:
+        logger.error(f"Error extracting user info: {str(e)}")
+        raise HTTPException(status_code=401, detail="Failed to extract user information")
 
-            user = get_or_create_user_by_email(email)
 
-            name = authorizer_context.get('name', None)
-            picture = authorizer_context.get('picture', None)
+def get_user_email(request: Request) -> str:
+    """The authenticated email, read from the authorizer context without a database lookup"""
+    if APP_ENV == "local":
+        return LOCAL_USER_EMAIL
+    return _get_authorizer_context(request)['email']
 
-            logger.info(f"User authenticated: {email}")
-            return UserInfo(email=email, name=name, picture=picture, user_id=user.get_id(), locale="en")
-        else:
-            logger.error("No AWS event context found")
-            raise HTTPException(status_code=401, detail="Authentication context not found")
 
+def get_user_info(request: Request) -> UserInfo:
+    """
+    Dependency to extract user information from the authorizer context.
+    This works when the request comes through API Gateway with the Lambda authorizer.
+    """
+    # In local development, we might not have the authorizer context
+    if APP_ENV == "local":
+        logger.debug("Running in local environment, skipping user info extraction")
+        test_uuid = uuid.UUID('00000000-0000-0000-0000-000000000000')
+        return UserInfo(user_id=test_uuid, email=LOCAL_USER_EMAIL, name="Test User")
+
+    authorizer_context = _get_authorizer_context(request)
+    email = authorizer_context['email']
+    try:
+        user = get_or_create_user_by_email(email)
     except Exception as e:
         logger.error(f"Error extracting user info: {str(e)}")
         raise HTTPException(status_code=401, detail="Failed to extract user information")
 
+    name = authorizer_context.get('name', None)
+    picture = authorizer_context.get('picture', None)
+
+    logger.info(f"User authenticated: {email}")
+    return UserInfo(email=email, name=name, picture=picture, user_id=user.get_id(), locale="en")
+
 
 def get_or_create_user_by_email(email: str) -> User:
     """
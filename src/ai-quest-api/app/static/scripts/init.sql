@@ -13,7 +13,14 @@ CREATE INDEX idx_email ON users(email);
 CREATE TABLE stories (
     id BINARY(16) PRIMARY KEY,
     title VARCHAR(256) DEFAULT NULL,
-    user_id BINARY(16) NOT NULL
+    user_id BINARY(16) NOT NULL,
+    last_chapter_number INTEGER NOT NULL DEFAULT 0,
+    chapter_count INTEGER NOT NULL DEFAULT 0,
+    current_situation TEXT,
+    current_choices JSON,
+    summaries_version INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_user_id_updated_at (user_id, updated_at)
 );
 
 CREATE TABLE messages (
@@ -21,8 +28,10 @@ CREATE TABLE messages (
     role VARCHAR(50) NOT NULL,
     content TEXT NOT NULL,
     story_id BINARY(16) NOT NULL,
+    seq INTEGER NOT NULL,
     created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP,
     tags JSON,
+    UNIQUE INDEX idx_story_id_seq (story_id, seq),
     FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
 );
 
@@ -36,8 +45,28 @@ CREATE TABLE chapters (
     summary TEXT,
     number INTEGER NOT NULL,
     story_id BINARY(16) NOT NULL,
-    INDEX idx_story_id (story_id),
+    UNIQUE INDEX idx_story_id_number (story_id, number),
     FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
 );
 
+CREATE TABLE speculations (
+    id BINARY(16) PRIMARY KEY,
+    story_id BINARY(16) NOT NULL,
+    chapter_number INTEGER NOT NULL,
+    choice_key CHAR(64) NOT NULL,
+    choice TEXT NOT NULL,
+    response JSON NOT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    UNIQUE INDEX idx_story_id_chapter_number_choice_key (story_id, chapter_number, choice_key),
+    FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
+);
+
+CREATE TABLE summary_batches (
+    id VARCHAR(64) PRIMARY KEY,
+    chapter_count INTEGER NOT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    collected_at DATETIME(6) NULL,
+    INDEX idx_collected_at (collected_at)
+);
+
 COMMIT;
@@ -0,0 +1,25 @@
+-- Story head: stories carry a copy of their latest chapter so turns and reads
+-- no longer scan the chapters table.
+-- Not atomic: MySQL commits ALTER TABLE implicitly. The backfill is idempotent,
+-- so rerun this file from the UPDATE if it stops after the ALTER.
+USE ai_quest;
+
+ALTER TABLE stories
+    ADD COLUMN last_chapter_number INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN chapter_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN current_situation TEXT,
+    ADD COLUMN current_choices JSON,
+    ADD COLUMN updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6);
+
+-- Backfill the head from existing chapters
+UPDATE stories s
+JOIN (
+    SELECT story_id, MAX(number) AS last_number, COUNT(*) AS chapter_count
+    FROM chapters
+    GROUP BY story_id
+) agg ON agg.story_id = s.id
+JOIN chapters c ON c.story_id = s.id AND c.number = agg.last_number
+SET s.last_chapter_number = agg.last_number,
+    s.chapter_count = agg.chapter_count,
+    s.current_situation = c.situation,
+    s.current_choices = c.choices;
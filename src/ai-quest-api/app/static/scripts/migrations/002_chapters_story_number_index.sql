@@ -0,0 +1,6 @@
+-- Keyset pagination over (story_id, number); the composite index also backs the
+-- story_id foreign key, so the single-column index becomes redundant.
+USE ai_quest;
+
+CREATE UNIQUE INDEX idx_story_id_number ON chapters (story_id, number);
+DROP INDEX idx_story_id ON chapters;
@@ -0,0 +1,20 @@
+-- Per-story message sequence for recent-window loading: chapter N is played by
+-- messages 2N-1 (user) and 2N (assistant).
+-- Not atomic: MySQL commits ALTER TABLE and CREATE INDEX implicitly.
+USE ai_quest;
+
+ALTER TABLE messages ADD COLUMN seq INTEGER NOT NULL DEFAULT 0 AFTER story_id;
+
+-- Intro messages were stored with a shared import-time created_at, so user sorts before assistant on ties
+UPDATE messages m
+JOIN (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY story_id
+        ORDER BY created_at, role = 'assistant', id
+    ) AS seq
+    FROM messages
+) numbered ON numbered.id = m.id
+SET m.seq = numbered.seq;
+
+ALTER TABLE messages ALTER COLUMN seq DROP DEFAULT;
+CREATE UNIQUE INDEX idx_story_id_seq ON messages (story_id, seq);
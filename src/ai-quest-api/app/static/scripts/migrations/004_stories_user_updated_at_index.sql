@@ -0,0 +1,5 @@
+-- Per-user story list ordered by last activity (InnoDB appends the primary key,
+-- so the index also covers the (updated_at, id) keyset).
+USE ai_quest;
+
+CREATE INDEX idx_user_id_updated_at ON stories (user_id, updated_at);
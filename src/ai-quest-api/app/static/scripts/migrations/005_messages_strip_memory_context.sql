@@ -0,0 +1,13 @@
+-- Retrieved memory is now injected per request only. Strip it from stored user messages
+-- so it is no longer re-sent (and paid for) on every later turn.
+START TRANSACTION;
+
+USE ai_quest;
+
+UPDATE messages
+SET content = SUBSTRING_INDEX(content, '\n\nCurrent action: ', -1)
+WHERE role = 'user'
+  AND content LIKE 'Relevant past events for context:%'
+  AND content LIKE '%\n\nCurrent action: %';
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- DM responses generated ahead of time for the choices offered by a story's head
+USE ai_quest;
+
+CREATE TABLE speculations (
+    id BINARY(16) PRIMARY KEY,
+    story_id BINARY(16) NOT NULL,
+    chapter_number INTEGER NOT NULL,
+    choice_key CHAR(64) NOT NULL,
+    choice TEXT NOT NULL,
+    response JSON NOT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    UNIQUE INDEX idx_story_id_chapter_number_choice_key (story_id, chapter_number, choice_key),
+    FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
+);
@@ -0,0 +1,6 @@
+-- Chapter summaries are written after their chapter (live or by the batch job);
+-- the story ETag covers them through this counter.
+USE ai_quest;
+
+ALTER TABLE stories
+    ADD COLUMN summaries_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,10 @@
+-- Message Batches submitted by the chapter summarization job; each is collected exactly once
+USE ai_quest;
+
+CREATE TABLE summary_batches (
+    id VARCHAR(64) PRIMARY KEY,
+    chapter_count INTEGER NOT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    collected_at DATETIME(6) NULL,
+    INDEX idx_collected_at (collected_at)
+);
@@ -0,0 +1,166 @@
+"""
+Load test of the API's own overhead: concurrent players start stories and act through them.
+
+By default the app runs in-process on replayed LLM and memory backends (LLM_CLIENT_TYPE=replay)
+and a local SQLite database, so no AWS or Anthropic access is needed:
+
+    python -m scripts.load_test --players 200 --turns 5
+    LLM_REPLAY_PATH=recording.jsonl REPLAY_LLM_LATENCY=fixed:0 python -m scripts.load_test --stream
+
+With --base-url it drives a running server instead (start it with LLM_CLIENT_TYPE=replay to keep
+providers out of the measurement).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+DEFAULT_PLAYERS = 50
+DEFAULT_TURNS = 3
+
+
+def _configure_in_process(database_url: str | None) -> None:
+    """Environment for an in-process app; must run before app modules are imported"""
+    database_url = database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}"
+    defaults = {
+        "LLM_CLIENT_TYPE": "replay",
+        "RESPONSE_CACHE_BACKEND": "memory",
+        "APP_ENV": "local",
+        "IS_API_KEY_AUTH_DISABLED": "1",
+        # Every in-process player is the same local user
+        "RATE_LIMIT_ENABLED": "0",
+        "DATABASE_URL": database_url,
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def _create_schema() -> None:
+    from app.clients import db_client
+    from app.entities import chapter, message, speculation, story, summary_batch, user
+
+    engine = db_client.get_engine()
+    for base in (chapter.Base, message.Base, speculation.Base, story.Base, summary_batch.Base, user.Base):
+        base.metadata.create_all(engine)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed: float) -> dict:
+        report = {"elapsed_seconds": round(elapsed, 2), "endpoints": {}}
+        for endpoint, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            if len(ordered) > 1:
+                quantiles = statistics.quantiles(ordered, n=100, method="inclusive")
+            else:
+                quantiles = ordered * 99
+            report["endpoints"][endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors[endpoint],
+                "requests_per_second": round(len(ordered) / elapsed, 2) if elapsed else None,
+                "p50_ms": round(quantiles[49] * 1000, 1),
+                "p90_ms": round(quantiles[89] * 1000, 1),
+                "p99_ms": round(quantiles[98] * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return report
+
+
+async def _timed(stats: Stats, endpoint: str, request) -> httpx.Response | None:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except Exception:
+        # Transport errors and streams broken by the app count as failed requests
+        stats.record(endpoint, time.perf_counter() - started, ok=False)
+        return None
+    stats.record(endpoint, time.perf_counter() - started, ok=response.is_success)
+    return response if response.is_success else None
+
+
+async def _stream_act(client: httpx.AsyncClient, story_id: str, choice: str) -> httpx.Response:
+    """Consume the SSE stream; the returned response carries the final chapter event as JSON"""
+    async with client.stream("POST", f"/stories/{story_id}/act/stream", json={"message": choice}) as response:
+        event, chapter = None, None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "chapter":
+                chapter = line[len("data: "):]
+            elif line.startswith("data: ") and event == "error":
+                return httpx.Response(500, request=response.request)
+        return httpx.Response(response.status_code if chapter else 500, content=chapter or b"",
+                              request=response.request)
+
+
+async def _player(client: httpx.AsyncClient, stats: Stats, turns: int, stream: bool) -> None:
+    response = await _timed(stats, "init", client.post("/stories/init"))
+    if response is None:
+        return
+    story = response.json()
+    for _ in range(turns):
+        choice = story["current_choices"][0] if story["current_choices"] else "Look around"
+        if stream:
+            response = await _timed(stats, "act_stream", _stream_act(client, story["id"], choice))
+        else:
+            response = await _timed(stats, "act", client.post(
+                f"/stories/{story['id']}/act", params={"delta": "true"}, json={"message": choice}
+            ))
+        if response is None:
+            return
+        story = response.json()
+
+
+async def run(players: int, turns: int, stream: bool, base_url: str = None, api_key: str = None,
+              timeout: float = 120.0) -> dict:
+    headers = {"X-API-KEY": api_key} if api_key else {}
+    if base_url:
+        transport = None
+    else:
+        from app.main import app
+        # Unhandled app errors come back as 500s to be counted, as a server would send them
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        base_url = "http://load-test"
+
+    stats = Stats()
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, headers=headers, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(_player(client, stats, turns, stream) for _ in range(players)))
+        elapsed = time.perf_counter() - started
+    return stats.report(elapsed)
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Concurrent story turns against the API")
+    parser.add_argument("--players", type=int, default=DEFAULT_PLAYERS, help="concurrent players (one story each)")
+    parser.add_argument("--turns", type=int, default=DEFAULT_TURNS, help="turns per player after init")
+    parser.add_argument("--stream", action="store_true", help="act through the SSE endpoint")
+    parser.add_argument("--base-url", help="drive a running server instead of an in-process app")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"), help="X-API-KEY for --base-url")
+    parser.add_argument("--database-url", help="in-process database (default: a fresh SQLite file)")
+    args = parser.parse_args(argv)
+
+    if not args.base_url:
+        _configure_in_process(args.database_url)
+        _create_schema()
+
+    report = asyncio.run(run(args.players, args.turns, args.stream, args.base_url, args.api_key))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Export token usage from DynamoDB to a columnar file and report on it offline.
+
+    python -m scripts.usage_analytics export --start 2025-01-01 --end 2025-01-31 --output usage.parquet
+    python -m scripts.usage_analytics report usage.parquet
+
+The output format follows the extension: .parquet (needs pyarrow) or .npz. Reports need numpy.
+"""
+import argparse
+import datetime
+import json
+
+from app.services import usage_analytics
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline token usage analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="dump usage items of a date range to a file")
+    export.add_argument("--service", default="anthropic")
+    export.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="first day (YYYY-MM-DD)")
+    export.add_argument("--end", type=datetime.date.fromisoformat, required=True, help="last day (YYYY-MM-DD)")
+    export.add_argument("--output", required=True, help="usage.parquet or usage.npz")
+
+    report = commands.add_parser("report", help="costs, token percentiles and cache hit ratios of an export")
+    report.add_argument("path", help="file written by export")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        columns = usage_analytics.export_usage(args.service, args.start, args.end)
+        usage_analytics.save(columns.to_arrays(), args.output)
+        print(f"Exported {len(columns)} usage items to {args.output}")
+    else:
+        analytics = usage_analytics.UsageAnalytics(usage_analytics.load(args.path))
+        print(json.dumps(analytics.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from app.clients import db_client
+from app.entities import chapter, message, speculation, story, summary_batch, user
+
+ENTITY_BASES = [chapter.Base, message.Base, speculation.Base, story.Base, summary_batch.Base, user.Base]
+
+
+@pytest.fixture
+def sqlite_database(tmp_path, monkeypatch):
+    """Point both engines at a fresh SQLite file with the full schema."""
+    monkeypatch.setattr(db_client.config, "database_url", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(db_client.config, "async_database_url", None)
+    db_client.dispose_engine()
+
+    engine = db_client.get_engine()
+    for base in ENTITY_BASES:
+        base.metadata.create_all(engine)
+
+    yield engine
+    db_client.dispose_engine()
+
+
+@pytest.fixture
+def run_async(sqlite_database):
+    """Run a coroutine on a fresh loop and dispose the async engine on that same loop."""
+    def run(coro):
+        async def scenario():
+            try:
+                return await coro
+            finally:
+                await db_client.dispose_async_engine()
+
+        return asyncio.run(scenario())
+
+    return run
@@ -0,0 +1,161 @@
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from app.clients import db_client
+from app.entities.chapter import Chapter
+from app.entities.message import Message
+from app.entities.story import Story
+from app.repositories.message import history_window_start
+from app.repositories.story import StoryConflictError
+from app.repositories.unit_of_work import AsyncUnitOfWork
+
+
+def _chapter(story_id: bytes, number: int) -> Chapter:
+    return Chapter(
+        narration=f"narration {number}",
+        situation=f"situation {number}",
+        choices=["left", "right", "wait"],
+        action="look around",
+        outcome="nothing happens",
+        number=number,
+        story_id=story_id,
+    )
+
+
+def test_async_repositories_round_trip(run_async):
+    user_id = uuid.uuid4().bytes
+
+    async def scenario():
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db) as uow:
+                story = uow.stories.add(Story(user_id=user_id))
+                for number in (1, 2, 3):
+                    uow.chapters.add(_chapter(story.id, number))
+
+        async with db_client.async_session() as db:
+            uow = AsyncUnitOfWork(db)
+            stories = await uow.stories.list_by_user_id(user_id)
+            return (
+                len(stories),
+                [c.number for c in await uow.chapters.get_chapters_by_story_id(story.id)],
+                await uow.chapters.get_max_chapter_number(story.id),
+            )
+
+    story_count, numbers, max_number = run_async(scenario())
+
+    assert story_count == 1
+    assert numbers == [1, 2, 3]
+    assert max_number == 3
+
+
+def test_unit_of_work_commits_a_turn_once(run_async):
+    commits = []
+
+    async def scenario():
+        engine = db_client.get_async_engine()
+        event.listen(engine.sync_engine, "commit", lambda conn: commits.append(conn))
+
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db) as uow:
+                story = uow.stories.add(Story(user_id=uuid.uuid4().bytes, title="title"))
+                uow.chapters.add(_chapter(story.id, 1))
+                uow.messages.add_all([
+                    Message(role="user", content="start", story_id=story.id, seq=1),
+                    Message(role="assistant", content="{}", story_id=story.id, seq=2),
+                ])
+            commits_after_turn = len(commits)
+
+        return commits_after_turn
+
+    # the trailing commit of async_session() finds no open transaction
+    assert run_async(scenario()) == 1
+
+
+def test_unit_of_work_rolls_back_on_error(run_async):
+    story_id = uuid.uuid4().bytes
+
+    async def scenario():
+        async with db_client.async_session() as db:
+            with pytest.raises(RuntimeError):
+                async with AsyncUnitOfWork(db) as uow:
+                    uow.stories.add(Story(id=story_id, user_id=uuid.uuid4().bytes))
+                    await db.flush()
+                    raise RuntimeError("LLM call failed")
+
+        async with db_client.async_session() as db:
+            return await AsyncUnitOfWork(db).stories.get(story_id)
+
+    assert run_async(scenario()) is None
+
+
+def test_advance_head_rejects_concurrent_append(run_async):
+    async def scenario():
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db) as uow:
+                story = uow.stories.add(Story(user_id=uuid.uuid4().bytes, last_chapter_number=1, chapter_count=1))
+            story_id = story.id
+
+            async with AsyncUnitOfWork(db) as uow:
+                await uow.stories.advance_head(story, _chapter(story.id, 2))
+                uow.chapters.add(_chapter(story.id, 2))
+
+            with pytest.raises(StoryConflictError):
+                async with AsyncUnitOfWork(db) as uow:
+                    await uow.stories.advance_head(story, _chapter(story.id, 2))
+
+        async with db_client.async_session() as db:
+            return await AsyncUnitOfWork(db).stories.get(story_id)
+
+    story = run_async(scenario())
+
+    assert story.last_chapter_number == 2
+    assert story.chapter_count == 2
+    assert story.current_situation == "situation 2"
+    assert story.current_choices_list == ["left", "right", "wait"]
+
+
+def test_recent_messages_returns_last_pairs_in_order(run_async):
+    async def scenario():
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db) as uow:
+                story = uow.stories.add(Story(user_id=uuid.uuid4().bytes))
+                uow.messages.add_all([
+                    Message(role=role, content=f"{role} {number}", story_id=story.id,
+                            seq=Message.seq_for(number, role))
+                    for number in range(1, 11)
+                    for role in ("user", "assistant")
+                ])
+
+        async with db_client.async_session() as db:
+            messages = await AsyncUnitOfWork(db).messages.get_recent_messages(story.id, max=3)
+            return [message.content for message in messages]
+
+    assert run_async(scenario()) == [
+        "user 8", "assistant 8", "user 9", "assistant 9", "user 10", "assistant 10",
+    ]
+
+
+def test_history_window_start_is_stable_between_strides(run_async):
+    assert [history_window_start(n, min_pairs=6, stride=4) for n in (1, 6, 9, 10, 13, 14)] == [1, 1, 1, 5, 5, 9]
+
+    async def scenario():
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db) as uow:
+                story = uow.stories.add(Story(user_id=uuid.uuid4().bytes))
+                uow.messages.add_all([
+                    Message(role=role, content=f"{role} {number}", story_id=story.id,
+                            seq=Message.seq_for(number, role))
+                    for number in range(1, 12)
+                    for role in ("user", "assistant")
+                ])
+
+        async with db_client.async_session() as db:
+            messages = await AsyncUnitOfWork(db).messages.get_history_window(story.id, 11)
+            return [message.content for message in messages]
+
+    messages = run_async(scenario())
+    assert messages[0] == "user 5"
+    assert messages[-1] == "assistant 11"
+    assert len(messages) == 14
@@ -0,0 +1,66 @@
+from app.entities.message import Message
+from app.services.context_assembler import ContextAssembler, estimate_tokens
+
+
+def _history(pairs: int, words: int = 100) -> list[Message]:
+    return [
+        Message(role=role, content=f"{role} {number} " + "word " * words, seq=Message.seq_for(number, role))
+        for number in range(1, pairs + 1)
+        for role in ("user", "assistant")
+    ]
+
+
+def test_everything_is_kept_within_budget():
+    assembler = ContextAssembler("system", [{"name": "story_response"}], input_budget=100_000)
+
+    context = assembler.assemble(_history(3), "go north", "memory")
+
+    assert len(context.messages) == 7
+    assert context.messages[-1]["content"].endswith("Current action: go north")
+    assert context.dropped_pairs == 0
+    assert set(context.tokens) == {"system", "tools", "action", "memory", "history"}
+
+
+def test_oldest_history_is_dropped_in_stride_multiples():
+    pair_tokens = 2 * (estimate_tokens("assistant 1 " + "word " * 100) + 4)
+    assembler = ContextAssembler("system", [], input_budget=pair_tokens * 7, memory_budget=10)
+
+    context = assembler.assemble(_history(9), "go north")
+
+    assert context.dropped_pairs == 4
+    assert context.messages[0]["content"].startswith("user 5 ")
+    assert context.total_tokens <= assembler.input_budget
+
+
+def test_memory_is_capped_and_latest_pair_always_kept():
+    assembler = ContextAssembler("system", [], input_budget=50, memory_budget=20)
+    memory = "\n".join(f"[Chapter {number}] " + "event " * 10 for number in range(10))
+
+    context = assembler.assemble(_history(2), "go north", memory)
+
+    assert context.tokens["memory"] <= 20 + estimate_tokens("Relevant past events for context:\n\n\nCurrent action: ")
+    assert [message["content"].split()[0:2] for message in context.messages[:2]] == [["user", "2"], ["assistant", "2"]]
+
+
+def test_non_latin_text_is_estimated_at_its_own_rate():
+    ukrainian = "Ви входите до темної печери, де пахне вологою і старим камінням. " * 10
+    german = "Die Straßenbahnhaltestelle liegt hinter dem großen Brückenübergang. " * 10
+
+    # Cyrillic runs about two characters per token, far denser than English prose
+    assert estimate_tokens(ukrainian) >= len(ukrainian) / 2.2
+    assert estimate_tokens(german) >= len(german) / 3
+    assert estimate_tokens(ukrainian) > estimate_tokens("x" * len(ukrainian))
+
+
+def test_cyrillic_history_is_trimmed_to_the_budget():
+    history = [
+        Message(role=role, content=f"{role} {number} " + "слово " * 100, seq=Message.seq_for(number, role))
+        for number in range(1, 10)
+        for role in ("user", "assistant")
+    ]
+    assembler = ContextAssembler("system", [], input_budget=1500, memory_budget=10)
+
+    context = assembler.assemble(history, "йти на північ")
+
+    assert context.dropped_pairs > 0
+    assert context.total_tokens <= assembler.input_budget
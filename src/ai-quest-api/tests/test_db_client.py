@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import text
+
+from app.clients import db_client
+
+
+@pytest.fixture
+def sqlite_engine(sqlite_database):
+    return sqlite_database
+
+
+def test_engine_is_shared_across_sessions(sqlite_engine):
+    with db_client.session() as first:
+        first.execute(text("CREATE TABLE IF NOT EXISTS t (id INTEGER)"))
+    with db_client.session() as second:
+        second.execute(text("INSERT INTO t VALUES (1)"))
+
+    assert db_client.get_engine() is sqlite_engine
+    with db_client.session() as third:
+        assert third.execute(text("SELECT COUNT(*) FROM t")).scalar() == 1
+
+    stats = db_client.pool_stats()
+    assert stats["checkouts"] == 3
+    assert stats["checkins"] >= 3
+
+
+def test_get_db_rolls_back_on_error(sqlite_engine):
+    with db_client.session() as db:
+        db.execute(text("CREATE TABLE IF NOT EXISTS t (id INTEGER)"))
+
+    dependency = db_client.get_db()
+    db = next(dependency)
+    db.execute(text("INSERT INTO t VALUES (1)"))
+    with pytest.raises(RuntimeError):
+        dependency.throw(RuntimeError("handler failed"))
+
+    with db_client.session() as db:
+        assert db.execute(text("SELECT COUNT(*) FROM t")).scalar() == 0
@@ -0,0 +1,259 @@
+from unittest import mock
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+import anthropic
+import httpx
+
+from app.clients import llm_client, llm_resilience, model_routing, token_tracker
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch):
+    monkeypatch.setattr(llm_client, "_clients", {})
+    monkeypatch.setattr(llm_client, "_providers", {})
+    monkeypatch.setattr(llm_client, "_routed_clients", {})
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(token_tracker, "_shared_tracker", None)
+    with mock.patch("boto3.resource"), mock.patch("boto3.client"), mock.patch("anthropic.AsyncAnthropic"):
+        yield
+
+
+def test_registry_reuses_clients_per_family():
+    anthropic_client = llm_client.get_client("anthropic")
+
+    assert llm_client.get_client("anthropic") is anthropic_client
+    assert llm_client.get_client("bedrock") is not anthropic_client
+    assert llm_client.get_client("bedrock").token_tracker is anthropic_client.token_tracker
+    # the fallback of one family is the same transport client as the primary of the other
+    assert anthropic_client.providers[1][1] is llm_client.get_client("bedrock").primary
+
+
+def test_system_prompt_is_passed_per_call():
+    client = llm_client.get_client("anthropic").primary
+    response = mock.Mock(content=[mock.Mock(type="text", text="answer")], usage=mock.Mock(
+        input_tokens=10, output_tokens=5, cache_creation_input_tokens=0, cache_read_input_tokens=0))
+    client.client.messages.create = mock.AsyncMock(return_value=response)
+
+    asyncio.run(client.ask("question", "first prompt"))
+    asyncio.run(client.ask("question", "second prompt"))
+
+    systems = [call.kwargs["system"][0]["text"] for call in client.client.messages.create.call_args_list]
+    assert systems == ["first prompt", "second prompt"]
+
+
+def test_cache_breakpoints_and_cache_usage_are_tracked():
+    client = llm_client.get_client("anthropic").primary
+    usage = mock.Mock(input_tokens=10, output_tokens=5, cache_creation_input_tokens=None, cache_read_input_tokens=2000)
+    response = mock.Mock(content=[mock.Mock(type="tool_use", input={"narration": "n"})], usage=usage)
+    client.client.messages.create = mock.AsyncMock(return_value=response)
+    client.token_tracker.track_usage = mock.Mock()
+    messages = [
+        {"role": "user", "content": "start"},
+        {"role": "assistant", "content": "intro"},
+        {"role": "user", "content": "go left"},
+    ]
+    tools = [{"name": "first"}, {"name": "story_response"}]
+
+    asyncio.run(client.send_messages(messages, "prompt", tools=tools, tool_choice={"type": "any"}))
+
+    kwargs = client.client.messages.create.call_args.kwargs
+    assert kwargs["system"] == [{"type": "text", "text": "prompt", "cache_control": {"type": "ephemeral"}}]
+    assert [tool.get("cache_control") for tool in kwargs["tools"]] == [None, {"type": "ephemeral"}]
+    assert kwargs["messages"][0] == messages[0]
+    assert kwargs["messages"][1]["content"] == [
+        {"type": "text", "text": "intro", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert kwargs["messages"][-1] == messages[-1]
+    # the caller's history is left untouched
+    assert messages[1]["content"] == "intro" and "cache_control" not in tools[-1]
+
+    tracked = client.token_tracker.track_usage.call_args.kwargs
+    assert tracked["cache_creation_input_tokens"] == 0
+    assert tracked["cache_read_input_tokens"] == 2000
+
+
+def test_cache_tokens_are_priced_relative_to_input_rate():
+    tracker = token_tracker.get_token_tracker()
+    model = "claude-3-haiku-20240307"
+
+    base = tracker._calculate_cost("anthropic", model, 1_000_000, 0)
+    written = tracker._calculate_cost("anthropic", model, 0, 0, cache_creation_input_tokens=1_000_000)
+    read = tracker._calculate_cost("anthropic", model, 0, 0, cache_read_input_tokens=1_000_000)
+
+    assert written == base * token_tracker.Decimal("1.25")
+    assert read == base * token_tracker.Decimal("0.1")
+
+
+def test_bedrock_calls_run_off_the_event_loop():
+    client = llm_client.get_client("bedrock").primary
+    body = mock.Mock()
+    body.read.return_value = json.dumps({
+        "content": [{"type": "tool_use", "input": {"narration": "n"}}],
+        "usage": {"input_tokens": 10, "output_tokens": 5},
+    })
+    threads = []
+
+    def invoke_model(**kwargs):
+        threads.append(threading.current_thread().name)
+        return {"body": body}
+
+    client.bedrock_client.invoke_model.side_effect = invoke_model
+
+    result = asyncio.run(client.send_messages([{"role": "user", "content": "hi"}], "prompt", tools=[{}]))
+
+    assert json.loads(result) == {"narration": "n"}
+    assert threads[0].startswith("bedrock")
+
+
+def test_bedrock_gets_cache_breakpoints_only_for_opted_in_models(monkeypatch):
+    client = llm_client.get_client("bedrock").primary
+    body = mock.Mock()
+    body.read.return_value = json.dumps({"content": [{"type": "text", "text": "answer"}], "usage": {}})
+    client.bedrock_client.invoke_model.return_value = {"body": body}
+
+    def sent_system(bound) -> str | list:
+        asyncio.run(bound.ask("question", "prompt"))
+        return json.loads(client.bedrock_client.invoke_model.call_args.kwargs["body"])["system"]
+
+    # the default failover model does not support prompt caching
+    assert sent_system(client) == "prompt"
+    monkeypatch.setattr(llm_client.config, "bedrock_prompt_caching_models", {"anthropic.claude-3-5-haiku"})
+    assert sent_system(client) == "prompt"
+    assert sent_system(client.bind("anthropic.claude-3-5-haiku", 100))[0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_partial_tool_input_keeps_unterminated_strings():
+    partial_input = llm_client.PartialToolInput()
+
+    snapshots = [
+        dict(partial_input.feed(delta))
+        for delta in ['{"narr', 'ation": "Once up', 'on a time", "outc', 'ome": "It wo']
+    ]
+
+    assert snapshots[0] == {}
+    assert snapshots[1] == {"narration": "Once up"}
+    assert snapshots[-1] == {"narration": "Once upon a time", "outcome": "It wo"}
+
+
+def _rate_limit_error(retry_after: str = "2") -> anthropic.RateLimitError:
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.anthropic.com"),
+                              headers={"retry-after": retry_after})
+    return anthropic.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_throttled_provider_fails_over_and_records_outcome():
+    client = llm_client.get_client("anthropic")
+    anthropic_client, bedrock_client = client.providers[0][1], client.providers[1][1]
+    anthropic_client.client.messages.create = mock.AsyncMock(side_effect=_rate_limit_error())
+    body = mock.Mock()
+    body.read.return_value = json.dumps({
+        "content": [{"type": "text", "text": "answer"}],
+        "usage": {"input_tokens": 10, "output_tokens": 5},
+    })
+    bedrock_client.bedrock_client.invoke_model.return_value = {"body": body}
+    client.token_tracker.track_usage = mock.Mock()
+
+    assert asyncio.run(client.ask("question", "prompt")) == "answer"
+
+    # throttling is not waited out on the same provider
+    assert anthropic_client.client.messages.create.await_count == 1
+    metadata = client.token_tracker.track_usage.call_args.kwargs["metadata"]
+    assert metadata["provider"] == "bedrock"
+    assert metadata["failover"] is True
+    assert metadata["failover_reason"] == "RateLimitError"
+
+
+def test_transient_errors_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "_fallback_family", lambda llm_family: None)
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", sleep)
+    client = llm_client.get_client("anthropic")
+    response = mock.Mock(content=[mock.Mock(type="text", text="answer")], usage=mock.Mock(
+        input_tokens=10, output_tokens=5, cache_creation_input_tokens=0, cache_read_input_tokens=0))
+    client.primary.client.messages.create = mock.AsyncMock(side_effect=[
+        anthropic.APIConnectionError(request=httpx.Request("POST", "https://api.anthropic.com")),
+        _rate_limit_error("3"),
+        response,
+    ])
+    client.token_tracker.track_usage = mock.Mock()
+
+    assert asyncio.run(client.ask("question", "prompt")) == "answer"
+
+    assert len(sleeps) == 2
+    assert sleeps[1] >= 3  # retry-after is honored
+    assert client.token_tracker.track_usage.call_args.kwargs["metadata"]["attempt"] == 3
+
+
+def test_circuit_opens_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(llm_client, "_fallback_family", lambda llm_family: None)
+    monkeypatch.setattr(llm_client.config, "llm_max_attempts", 1)
+    client = llm_client.get_client("anthropic")
+    client.primary.client.messages.create = mock.AsyncMock(side_effect=_rate_limit_error())
+    breaker = llm_resilience.get_breaker("anthropic")
+
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(llm_resilience.LLMUnavailableError):
+            asyncio.run(client.ask("question", "prompt"))
+
+    assert breaker.state == "open"
+    with pytest.raises(llm_resilience.LLMUnavailableError):
+        client.ensure_available()
+    calls = client.primary.client.messages.create.await_count
+    with pytest.raises(llm_resilience.LLMUnavailableError):
+        asyncio.run(client.ask("question", "prompt"))
+    assert client.primary.client.messages.create.await_count == calls
+
+
+def test_half_open_probe_is_released_on_a_non_retryable_error(monkeypatch):
+    monkeypatch.setattr(llm_client, "_fallback_family", lambda llm_family: None)
+    client = llm_client.get_client("anthropic")
+    request = httpx.Request("POST", "https://api.anthropic.com")
+    client.primary.client.messages.create = mock.AsyncMock(side_effect=anthropic.BadRequestError(
+        "bad request", response=httpx.Response(400, request=request), body=None))
+    breaker = llm_resilience.get_breaker("anthropic")
+    # opened one reset window ago: half-open
+    breaker.opened_at = llm_resilience.time.monotonic() - breaker.reset_seconds
+
+    with pytest.raises(anthropic.BadRequestError):
+        asyncio.run(client.ask("question", "prompt"))
+
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_routes_bind_their_model_and_record_route(monkeypatch):
+    monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_CHAPTER_MAX_TOKENS", "200")
+    client = llm_client.get_routed_client("summarize.chapter")
+    response = mock.Mock(content=[mock.Mock(type="text", text="summary")], usage=mock.Mock(
+        input_tokens=10, output_tokens=5, cache_creation_input_tokens=0, cache_read_input_tokens=0))
+    client.primary.client.messages.create = mock.AsyncMock(return_value=response)
+    client.token_tracker.track_usage = mock.Mock()
+
+    asyncio.run(client.ask("chapter", "prompt"))
+
+    kwargs = client.primary.client.messages.create.call_args.kwargs
+    assert kwargs["model"] == model_routing.ROUTES["summarize.chapter"].anthropic_model
+    assert kwargs["max_tokens"] == 200
+    # routes share the family's transport (and connection pool)
+    assert client.primary.client is llm_client.get_routed_client("dm.turn").primary.client
+    metadata = client.token_tracker.track_usage.call_args.kwargs["metadata"]
+    assert metadata["route"] == "summarize.chapter"
+    assert metadata["latency_ms"] >= 0
+
+
+def test_every_routed_model_is_priced():
+    tracker = token_tracker.get_token_tracker()
+
+    for route in model_routing.ROUTES.values():
+        assert tracker._calculate_cost("anthropic", route.anthropic_model, 1000, 1000) > 0
+        assert tracker._calculate_cost("bedrock", route.bedrock_model, 1000, 1000) > 0
+    assert tracker._calculate_cost("bedrock", "eu.anthropic.claude-sonnet-4-20250514-v1:0", 1000, 0) > 0
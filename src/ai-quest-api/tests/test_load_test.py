@@ -0,0 +1,44 @@
+from unittest import mock
+
+import pytest
+
+from app.clients import llm_client, replay, response_cache
+from app.services import rate_limit, security, user
+from app.services.memory.replay_memory_store import ReplayMemoryStore
+from scripts import load_test
+
+with mock.patch("boto3.resource"):
+    from app import main
+
+
+@pytest.fixture
+def replayed_app(monkeypatch):
+    for route in ("DM_TURN", "DM_INTRO", "SUMMARIZE_CHAPTER"):
+        monkeypatch.setenv(f"LLM_ROUTE_{route}_PROVIDER", "replay")
+    monkeypatch.setattr(llm_client, "_providers", {})
+    monkeypatch.setattr(llm_client, "_routed_clients", {})
+    monkeypatch.setattr(llm_client, "_cached_clients", {})
+    monkeypatch.setattr(response_cache, "_shared_cache", response_cache.create_response_cache("memory"))
+    monkeypatch.setattr(replay.config, "replay_llm_latency", "fixed:0")
+    monkeypatch.setattr(main, "memory_store", ReplayMemoryStore(replay.Recording(), replay.Latency.parse("fixed:0"),
+                                                                dimension=8))
+    monkeypatch.setattr(user, "APP_ENV", "local")
+    monkeypatch.setattr(security, "IS_API_KEY_AUTH_DISABLED", True)
+    monkeypatch.setattr(rate_limit.config, "rate_limit_enabled", False)
+
+
+def test_players_start_stories_and_act(run_async, replayed_app):
+    report = run_async(load_test.run(players=3, turns=2, stream=False))
+
+    assert report["endpoints"]["init"]["requests"] == 3
+    assert report["endpoints"]["act"]["requests"] == 6
+    assert sum(endpoint["errors"] for endpoint in report["endpoints"].values()) == 0
+
+
+def test_server_errors_are_counted(run_async, replayed_app, monkeypatch):
+    monkeypatch.setattr(main.StoryService, "act", mock.AsyncMock(side_effect=RuntimeError("boom")))
+
+    report = run_async(load_test.run(players=2, turns=1, stream=False))
+
+    assert report["endpoints"]["init"]["errors"] == 0
+    assert (report["endpoints"]["act"]["requests"], report["endpoints"]["act"]["errors"]) == (2, 2)
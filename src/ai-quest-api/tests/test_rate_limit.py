@@ -0,0 +1,97 @@
+from unittest import mock
+
+import contextvars
+import uuid
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+
+from app.clients import token_tracker
+from app.services import rate_limit, security, user
+
+with mock.patch("boto3.resource"):
+    from app.main import app
+
+LOCAL_USER_ID = str(uuid.UUID(int=0))
+
+
+def test_token_bucket_allows_bursts_then_refills():
+    bucket = rate_limit.TokenBucket(capacity=2, refill_per_second=1, now=0)
+
+    assert bucket.take(0) == 0 and bucket.take(0) == 0
+    assert bucket.take(0) == pytest.approx(1.0)
+    assert bucket.take(1.5) == 0
+
+
+def test_requests_beyond_the_per_minute_rate_are_rejected():
+    limiter = rate_limit.RateLimiter(requests_per_minute=2, tokens_per_day=0, backend="memory")
+    limiter.check("user-1")
+    limiter.check("user-1")
+
+    with pytest.raises(rate_limit.RateLimitExceeded) as exceeded:
+        limiter.check("user-1")
+
+    assert 0 < exceeded.value.retry_after <= 30
+    # buckets are per user
+    limiter.check("user-2")
+
+
+def test_daily_token_quota_reads_the_user_rollup_once_per_cache_period():
+    table = mock.Mock()
+    table.get_item.return_value = {"Item": {"total_tokens": 1500}}
+    limiter = rate_limit.RateLimiter(requests_per_minute=100, tokens_per_day=1000, backend="dynamodb", table=table)
+
+    for _ in range(2):
+        with pytest.raises(rate_limit.RateLimitExceeded) as exceeded:
+            limiter.check("user-1")
+
+    assert exceeded.value.retry_after <= 24 * 3600
+    assert table.get_item.call_count == 1
+    assert table.get_item.call_args.kwargs["Key"]["service_date"] == "rollup#user#user-1"
+    table.update_item.assert_not_called()
+
+
+def test_shared_counter_rejects_over_limit_and_fails_open_on_errors():
+    table = mock.Mock()
+    table.get_item.return_value = {}
+    limiter = rate_limit.RateLimiter(requests_per_minute=100, tokens_per_day=1000, backend="dynamodb", table=table)
+
+    table.update_item.side_effect = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        limiter.check("user-1")
+
+    table.update_item.side_effect = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                                                "UpdateItem")
+    limiter.check("user-1")
+
+
+def test_limited_endpoint_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(user, "APP_ENV", "local")
+    monkeypatch.setattr(security, "IS_API_KEY_AUTH_DISABLED", True)
+    limiter = rate_limit.RateLimiter(requests_per_minute=1, tokens_per_day=0, backend="memory")
+    monkeypatch.setattr(rate_limit, "_limiter", limiter)
+    monkeypatch.setattr(rate_limit.config, "rate_limit_enabled", True)
+    limiter.check_requests(rate_limit._email_key(user.LOCAL_USER_EMAIL))
+    get_user_info = mock.Mock(side_effect=user.get_user_info)
+    monkeypatch.setitem(app.dependency_overrides, user.get_user_info, get_user_info)
+
+    response = TestClient(app).post("/ask", params={"question": "Who am I?"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # rejected on the authorizer's email, before the user is looked up
+    get_user_info.assert_not_called()
+
+
+def test_usage_is_attributed_to_the_current_user(monkeypatch):
+    monkeypatch.setattr(token_tracker, "_shared_tracker", None)
+    with mock.patch("boto3.resource"):
+        tracker = token_tracker.DynamoDBTokenTracker()
+
+    def track():
+        token_tracker.current_user_id.set("user-1")
+        return tracker.track_usage(service="anthropic", model="claude-3-5-haiku-20241022",
+                                   input_tokens=1, output_tokens=1)
+
+    assert contextvars.copy_context().run(track)["user_id"] == "user-1"
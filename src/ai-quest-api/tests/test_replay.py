@@ -0,0 +1,116 @@
+from unittest import mock
+
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from app.clients import db_client, llm_client, replay, response_cache
+from app.entities.chapter import Chapter
+from app.services.memory.replay_memory_store import ReplayMemoryStore
+from app.services.story import StoryService
+from app.services.user import UserInfo
+
+NO_LATENCY = replay.Latency.parse("fixed:0")
+TOOL = {"name": "story_response", "input_schema": {
+    "type": "object",
+    "properties": {
+        "narration": {"type": "string"},
+        "situation": {"type": "string"},
+        "choices": {"type": "array", "items": {"type": "string"}, "minItems": 3},
+    },
+}}
+
+
+def test_latency_distributions():
+    assert replay.Latency.parse("fixed:250").sample() == 0.25
+    assert all(0.1 <= replay.Latency.parse("uniform:100,200").sample() <= 0.2 for _ in range(20))
+    assert replay.Latency.parse("lognormal:1000,0.5").sample() > 0
+    with pytest.raises(ValueError):
+        replay.Latency.parse("gamma:1,2")
+
+
+def test_recorded_responses_replay_exactly_then_in_turn(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    live = mock.Mock(token_tracker=None)
+    live.send_messages = mock.AsyncMock(side_effect=['{"narration": "first"}', '{"narration": "second"}'])
+    recorder = replay.RecordingLLMClient(live, replay.Recording(path))
+    first = [{"role": "user", "content": "open the door"}]
+    second = [{"role": "user", "content": "run"}]
+    asyncio.run(recorder.send_messages(first, "prompt", tools=[TOOL]))
+    asyncio.run(recorder.send_messages(second, "prompt", tools=[TOOL]))
+
+    client = replay.ReplayLLMClient(replay.Recording(path), NO_LATENCY)
+
+    # the recorded request replays its own response, unknown requests cycle through the recording
+    assert asyncio.run(client.send_messages(second, "prompt", tools=[TOOL])) == '{"narration": "second"}'
+    unknown = [{"role": "user", "content": "sing"}]
+    assert [asyncio.run(client.send_messages(unknown, "prompt", tools=[TOOL])) for _ in range(3)] == [
+        '{"narration": "first"}', '{"narration": "second"}', '{"narration": "first"}'
+    ]
+
+
+def test_responses_are_synthesized_from_the_tool_schema_without_recording():
+    client = replay.ReplayLLMClient(replay.Recording(), NO_LATENCY)
+    messages = [{"role": "user", "content": "look around"}]
+
+    response = json.loads(asyncio.run(client.send_messages(messages, "prompt", tools=[TOOL])))
+
+    assert set(response) == {"narration", "situation", "choices"}
+    assert len(response["choices"]) == 3
+
+    async def stream():
+        return [snapshot async for snapshot in client.stream_tool_input(messages, "prompt", [TOOL], {})]
+
+    snapshots = asyncio.run(stream())
+    assert len(snapshots) == replay.STREAM_CHUNKS
+    assert len(snapshots[0]["narration"]) < len(snapshots[-1]["narration"])
+    assert snapshots[-1] == response
+
+
+def test_memory_store_ranks_recorded_embeddings_by_cosine_distance():
+    recording = replay.Recording()
+    chapters = [Chapter(number=number, narration=f"narration {number}", situation="s", choices=["a"],
+                        action="act", outcome="o") for number in (1, 2)]
+    recording.add("embedding", replay.text_key(chapters[0].to_json()), [1.0, 0.0])
+    recording.add("embedding", replay.text_key(chapters[1].to_json()), [0.0, 1.0])
+    recording.add("embedding", replay.text_key("the cave"), [0.1, 0.9])
+    store = ReplayMemoryStore(recording, NO_LATENCY, dimension=2)
+    story_id = uuid.uuid4()
+
+    async def scenario():
+        for chapter in chapters:
+            await store.add_memory(story_id, chapter)
+        return await store.search_memories(story_id, "the cave", max_results=2)
+
+    results = asyncio.run(scenario())
+
+    assert [result.chapter_number for result in results] == [2, 1]
+    assert results[0].relevance_score < results[1].relevance_score
+
+
+def test_story_turns_run_end_to_end_on_replayed_backends(run_async, monkeypatch):
+    for route in ("DM_TURN", "DM_INTRO", "SUMMARIZE_CHAPTER"):
+        monkeypatch.setenv(f"LLM_ROUTE_{route}_PROVIDER", "replay")
+    monkeypatch.setattr(llm_client, "_providers", {})
+    monkeypatch.setattr(llm_client, "_routed_clients", {})
+    monkeypatch.setattr(llm_client, "_cached_clients", {})
+    monkeypatch.setattr(response_cache, "_shared_cache", response_cache.create_response_cache("memory"))
+    monkeypatch.setattr(replay.config, "replay_llm_latency", "fixed:0")
+    user_info = UserInfo(user_id=uuid.uuid4(), email="test@test.com")
+    memory_store = ReplayMemoryStore(replay.Recording(), NO_LATENCY, dimension=8)
+
+    async def scenario():
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info, memory_store)
+            story = await service.init(user_info)
+            story_id = uuid.UUID(story.id)
+            for _ in range(3):
+                story = await service.act(story_id, story.current_choices[0], delta=True)
+        return story
+
+    story = run_async(scenario())
+
+    assert story.last_chapter_number == 4
+    assert story.chapters[0].action.startswith("Replayed choices")
@@ -0,0 +1,71 @@
+from unittest import mock
+
+import asyncio
+
+import pytest
+
+from app.clients import llm_client, response_cache, token_tracker
+
+
+@pytest.fixture(autouse=True)
+def no_aws(monkeypatch):
+    monkeypatch.setattr(token_tracker, "_shared_tracker", None)
+    with mock.patch("boto3.resource"):
+        yield
+
+
+def test_cache_key_ignores_dict_order_but_not_content():
+    key = response_cache.cache_key("model", "system", [{"role": "user", "content": "hi"}])
+
+    assert key == response_cache.cache_key("model", "system", [{"content": "hi", "role": "user"}])
+    assert key != response_cache.cache_key("other-model", "system", [{"role": "user", "content": "hi"}])
+    assert key != response_cache.cache_key("model", "system", [{"role": "user", "content": "hi"}], tools=[{}])
+
+
+def test_lru_tier_evicts_least_recently_used_and_expired_entries(monkeypatch):
+    store = response_cache.LRUResponseStore(max_entries=2)
+    store.put("a", "1", ttl_seconds=60)
+    store.put("b", "2", ttl_seconds=60)
+    store.get("a")
+    store.put("c", "3", ttl_seconds=60)
+
+    assert store.get("b") is None
+    assert store.get("a") == "1"
+
+    monkeypatch.setattr(response_cache.time, "time", lambda: 10**12)
+    assert store.get("a") is None
+
+
+def test_persistent_hits_are_promoted_and_counted(tmp_path):
+    sqlite_store = response_cache.SQLiteResponseStore(str(tmp_path / "cache.sqlite"), max_entries=2)
+    sqlite_store.put("key", "answer", ttl_seconds=60)
+    cache = response_cache.ResponseCache([response_cache.LRUResponseStore(max_entries=10), sqlite_store], 60)
+
+    assert cache.get("missing") is None
+    assert cache.get("key") == "answer"
+    assert cache.get("key") == "answer"
+
+    assert cache.stats() == {"misses": 1, "hits_sqlite": 1, "hits_memory": 1, "hit_ratio": 2 / 3}
+
+    for key in ("x", "y", "z"):
+        sqlite_store.put(key, key, ttl_seconds=60)
+    assert sqlite_store.get("x") is None
+    assert sqlite_store.get("z") == "z"
+
+
+def test_cached_client_calls_the_llm_once_per_prompt():
+    client = mock.Mock(model_name="model")
+    client.ask = mock.AsyncMock(side_effect=["first", "second"])
+    cache = response_cache.ResponseCache([response_cache.LRUResponseStore(max_entries=10)], 60)
+    cached_client = llm_client.CachedLLMClient(client, cache)
+
+    async def scenario():
+        return [
+            await cached_client.ask("summarize", "prompt"),
+            await cached_client.ask("summarize", "prompt"),
+            await cached_client.ask("summarize", "other prompt"),
+        ]
+
+    assert asyncio.run(scenario()) == ["first", "first", "second"]
+    assert client.ask.await_count == 2
+    assert cache.stats()["puts"] == 2
@@ -0,0 +1,362 @@
+import json
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from sqlalchemy import update
+
+from app.clients import config as config_module, db_client
+from app.entities.chapter import Chapter
+from app.entities.story import Story
+from app.repositories.unit_of_work import AsyncUnitOfWork
+from app.services import speculation, story_export
+from app.services.dm import DMResponse, DMStreamDelta
+from app.services import story as story_module
+from app.services.story import StoryService
+from app.services.user import UserInfo
+
+
+@pytest.fixture
+def user_info():
+    return UserInfo(user_id=uuid.uuid4(), email="test@test.com")
+
+
+@pytest.fixture
+def dungeon_master():
+    with mock.patch("app.services.story.dm.DungeonMaster") as dungeon_master_class, \
+            mock.patch("app.services.story.StoryContext"):
+        dungeon_master_class.return_value.send_messages = mock.AsyncMock()
+        dungeon_master_class.return_value.system_prompt = "You are the DM"
+        dungeon_master_class.return_value.story_response_tool = {"name": "story_response"}
+        yield dungeon_master_class.return_value
+
+
+async def _create_story(user_info: UserInfo, chapters: int) -> uuid.UUID:
+    story_id = uuid.uuid4()
+    async with db_client.async_session() as db:
+        async with AsyncUnitOfWork(db) as uow:
+            uow.stories.add(Story(
+                id=story_id.bytes,
+                user_id=user_info.user_id.bytes,
+                title="A story",
+                last_chapter_number=chapters,
+                chapter_count=chapters,
+                current_situation=f"situation {chapters}",
+                current_choices=["a", "b", "c"],
+            ))
+            for number in range(1, chapters + 1):
+                uow.chapters.add(Chapter(
+                    narration=f"narration {number}",
+                    situation=f"situation {number}",
+                    choices=["a", "b", "c"],
+                    action="act",
+                    outcome="outcome",
+                    number=number,
+                    story_id=story_id.bytes,
+                ))
+    return story_id
+
+
+def test_get_paginates_chapters(run_async, user_info, dungeon_master):
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=5)
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info)
+            first = await service.get(story_id, limit=2)
+            second = await service.get(story_id, since_chapter=first.next_since_chapter, limit=2)
+            last = await service.get(story_id, since_chapter=second.next_since_chapter, limit=2)
+            return first, second, last
+
+    first, second, last = run_async(scenario())
+
+    assert [c.number for c in first.chapters] == [1, 2]
+    assert [c.number for c in second.chapters] == [3, 4]
+    assert [c.number for c in last.chapters] == [5]
+    assert last.next_since_chapter is None
+    assert last.last_chapter_number == 5
+
+
+def test_act_delta_returns_only_new_chapter(run_async, user_info, dungeon_master):
+    dungeon_master.send_messages.return_value = DMResponse(
+        narration="new narration", outcome="new outcome", situation="new situation", choices=["x", "y", "z"]
+    )
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=3)
+        async with db_client.async_session() as db:
+            return await StoryService(db, user_info).act(story_id, "go north", delta=True)
+
+    story = run_async(scenario())
+
+    assert [c.number for c in story.chapters] == [4]
+    assert story.current_choices == ["x", "y", "z"]
+    assert story.last_chapter_number == 4
+
+
+def test_act_sends_memory_context_without_storing_it(run_async, user_info, dungeon_master):
+    dungeon_master.send_messages.return_value = DMResponse(
+        narration="new narration", outcome="new outcome", situation="new situation", choices=["x", "y", "z"]
+    )
+    memory_service = mock.Mock(add_memory=mock.AsyncMock())
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=1)
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info, memory_service)
+            service.story_context_service.provide_context = mock.AsyncMock(return_value="the dragon slept")
+            await service.act(story_id, "go north")
+        async with db_client.async_session() as db:
+            return await AsyncUnitOfWork(db).messages.get_recent_messages(story_id.bytes)
+
+    stored = run_async(scenario())
+
+    sent = dungeon_master.send_messages.call_args.args[0]
+    assert "the dragon slept" in sent[-1]["content"]
+    assert sent[-1]["content"].endswith("go north")
+    assert [message.content for message in stored if message.role == "user"] == ["go north"]
+
+
+def test_act_holds_no_connection_during_the_llm_call(run_async, user_info, dungeon_master):
+    story_ids, observed = [], {}
+
+    async def send_messages(messages):
+        observed["checked_out"] = db_client.get_async_engine().pool.checkedout()
+        async with db_client.async_session() as db:
+            observed["summary"] = (await AsyncUnitOfWork(db).chapters.get_chapter(story_ids[0].bytes, 1)).summary
+        return DMResponse(narration="n", outcome="o", situation="s", choices=["x", "y", "z"])
+
+    dungeon_master.send_messages.side_effect = send_messages
+
+    async def scenario():
+        story_ids.append(await _create_story(user_info, chapters=1))
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info, mock.Mock(add_memory=mock.AsyncMock()))
+
+            async def provide_context(story_id, current_situation, user_decision):
+                # summarization stages a summary while the context is built
+                chapter = await service.chapter_repository.get_chapter(story_id.bytes, 1)
+                chapter.summary = "summary 1"
+                await service.chapter_repository.update(chapter)
+                return ""
+
+            service.story_context_service.provide_context = provide_context
+            await service.act(story_ids[0], "go north")
+        async with db_client.async_session() as db:
+            return (await AsyncUnitOfWork(db).chapters.get_chapter(story_ids[0].bytes, 1)).summary
+
+    summary = run_async(scenario())
+
+    assert observed == {"checked_out": 0, "summary": None}
+    # the staged summary commits with the turn
+    assert summary == "summary 1"
+
+
+def test_list_paginates_by_last_activity(run_async, user_info, dungeon_master):
+    async def scenario():
+        story_ids = [await _create_story(user_info, chapters=number) for number in (1, 2, 3)]
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info)
+            first = await service.list(user_info, limit=2)
+            second = await service.list(user_info, limit=2, cursor=first.next_cursor)
+            return story_ids, first, second
+
+    story_ids, first, second = run_async(scenario())
+
+    assert [story.id for story in first.data] == [str(story_ids[2]), str(story_ids[1])]
+    assert [story.id for story in second.data] == [str(story_ids[0])]
+    assert second.next_cursor is None
+    assert first.data[0].chapter_count == 3
+    assert first.data[0].situation_preview == "situation 3"
+    assert first.data[0].last_played_at is not None
+
+
+def test_get_if_modified_short_circuits_on_matching_etag(run_async, user_info, dungeon_master):
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=2)
+        async with db_client.async_session() as db:
+            service = StoryService(db, user_info)
+            story_etag, full_story = await service.get_if_modified(story_id)
+            repeated_etag, not_modified = await service.get_if_modified(story_id, if_none_match=story_etag)
+            other_page_etag, _ = await service.get_if_modified(story_id, limit=1, if_none_match=story_etag)
+            return story_etag, full_story, repeated_etag, not_modified, other_page_etag
+
+    story_etag, full_story, repeated_etag, not_modified, other_page_etag = run_async(scenario())
+
+    assert full_story is not None
+    assert not_modified is None
+    assert repeated_etag == story_etag
+    assert other_page_etag != story_etag
+
+
+def test_export_streams_chapters_in_order(run_async, user_info, dungeon_master):
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=3)
+        async with db_client.async_session() as db:
+            story = await StoryService(db, user_info).get_entity(story_id)
+        ndjson = [part async for part in story_export.export_story(story, "ndjson")]
+        markdown = "".join([part async for part in story_export.export_story(story, "markdown")])
+        return ndjson, markdown
+
+    ndjson, markdown = run_async(scenario())
+
+    assert [json.loads(line)["number"] for line in ndjson] == [1, 2, 3]
+    assert markdown.startswith("# A story")
+    assert markdown.index("## Chapter 1") < markdown.index("## Chapter 3")
+
+
+def test_long_stories_export_in_parts(run_async, user_info, dungeon_master):
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=5)
+        async with db_client.async_session() as db:
+            story = await StoryService(db, user_info).get_entity(story_id)
+        parts, since_chapter = [], 0
+        while since_chapter is not None:
+            parts.append([json.loads(line)["number"]
+                          async for line in story_export.export_story(story, "ndjson", since_chapter, limit=2)])
+            since_chapter = story_export.next_part(story, since_chapter, limit=2)
+        markdown = "".join([part async for part in story_export.export_story(story, "markdown", 2, limit=2)])
+        return parts, markdown
+
+    parts, markdown = run_async(scenario())
+
+    assert parts == [[1, 2], [3, 4], [5]]
+    # the title heads the first part only
+    assert markdown.startswith("## Chapter 3")
+
+
+def test_act_stream_forwards_deltas_then_persisted_chapter(run_async, user_info, dungeon_master):
+    final = DMResponse(narration="Once upon", outcome="ok", situation="s", choices=["x", "y", "z"])
+
+    async def stream_messages(messages):
+        yield DMStreamDelta("narration", "Once ")
+        yield DMStreamDelta("narration", "upon")
+        yield final
+
+    dungeon_master.stream_messages = stream_messages
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=1)
+        async with db_client.async_session() as db:
+            events = [event async for event in StoryService(db, user_info).act_stream(story_id, "go")]
+        async with db_client.async_session() as db:
+            stored = await StoryService(db, user_info).get(story_id)
+        return events, stored
+
+    events, stored = run_async(scenario())
+
+    assert [event.text for event in events[:2]] == ["Once ", "upon"]
+    assert [c.number for c in events[2].chapters] == [2]
+    assert stored.last_chapter_number == 2
+
+
+@pytest.fixture
+def speculation_enabled(monkeypatch):
+    monkeypatch.setattr(story_module.config, "speculation_enabled", True)
+    monkeypatch.setattr(story_module.config, "speculation_top_k", 2)
+    budget = speculation.SpeculationBudget(daily_budget_usd=1, max_cost_per_turn_usd=1)
+    monkeypatch.setattr(budget, "estimate", lambda input_tokens: Decimal("0.3"))
+    monkeypatch.setattr(speculation, "_budget", budget)
+    return budget
+
+
+def test_speculate_stores_top_k_choices_within_budget(run_async, user_info, dungeon_master, speculation_enabled):
+    dungeon_master.send_messages.side_effect = lambda messages: DMResponse(
+        narration=f"narration for {messages[-1]['content']}", outcome="o", situation="s", choices=["x", "y", "z"]
+    )
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=1)
+        async with db_client.async_session() as db:
+            first = await StoryService(db, user_info).speculate(story_id)
+        async with db_client.async_session() as db:
+            # already speculated choices are skipped, and the daily budget (1 USD) fits only one more call
+            second = await StoryService(db, user_info).speculate(story_id)
+        async with db_client.async_session() as db:
+            keys = await AsyncUnitOfWork(db).speculations.get_choice_keys(story_id.bytes, 2)
+        return first, second, keys
+
+    first, second, keys = run_async(scenario())
+
+    assert (first, second) == (2, 1)
+    assert dungeon_master.send_messages.await_count == 3
+    assert len(keys) == 3
+
+
+def test_failed_speculation_gives_its_budget_back(run_async, user_info, dungeon_master, speculation_enabled):
+    def send_messages(messages):
+        if messages[-1]["content"] == "a":
+            raise RuntimeError("provider error")
+        return DMResponse(narration="n", outcome="o", situation="s", choices=["x", "y", "z"])
+
+    dungeon_master.send_messages.side_effect = send_messages
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=1)
+        async with db_client.async_session() as db:
+            return await StoryService(db, user_info).speculate(story_id)
+
+    assert run_async(scenario()) == 1
+    assert speculation_enabled.reserve([Decimal("0.7")]) == 1
+
+
+def test_speculation_for_a_head_the_player_moved_past_is_dropped(run_async, user_info, dungeon_master,
+                                                                 speculation_enabled):
+    story_ids = []
+
+    async def send_messages(messages):
+        # the player acts while the speculative calls are in flight
+        async with db_client.async_session() as db:
+            async with AsyncUnitOfWork(db):
+                await db.execute(update(Story).where(Story.id == story_ids[0].bytes).values(last_chapter_number=2))
+        return DMResponse(narration="n", outcome="o", situation="s", choices=["x", "y", "z"])
+
+    dungeon_master.send_messages.side_effect = send_messages
+
+    async def scenario():
+        story_ids.append(await _create_story(user_info, chapters=1))
+        async with db_client.async_session() as db:
+            stored = await StoryService(db, user_info).speculate(story_ids[0])
+        async with db_client.async_session() as db:
+            keys = await AsyncUnitOfWork(db).speculations.get_choice_keys(story_ids[0].bytes, 2)
+        return stored, keys
+
+    stored, keys = run_async(scenario())
+
+    assert stored == 0
+    assert keys == set()
+
+
+def test_speculation_is_dispatched_to_lambda_on_lambda(monkeypatch):
+    monkeypatch.setenv("SPECULATION_DISPATCH", "background")
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "ai-quest-api")
+    # Config is a singleton: read the environment into a fresh instance
+    monkeypatch.setattr(config_module.Config, "_instance", None)
+
+    assert config_module.Config().speculation_dispatch == "lambda"
+
+
+def test_act_serves_matching_speculation_and_discards_the_rest(run_async, user_info, dungeon_master,
+                                                               speculation_enabled):
+    dungeon_master.send_messages.side_effect = lambda messages: DMResponse(
+        narration=f"narration for {messages[-1]['content']}", outcome="o", situation="s", choices=["x", "y", "z"]
+    )
+
+    async def scenario():
+        story_id = await _create_story(user_info, chapters=1)
+        async with db_client.async_session() as db:
+            await StoryService(db, user_info).speculate(story_id)
+        dungeon_master.reset_mock()
+        async with db_client.async_session() as db:
+            # matching ignores case and surrounding whitespace
+            full_story = await StoryService(db, user_info).act(story_id, "  B ", delta=True)
+        async with db_client.async_session() as db:
+            keys = await AsyncUnitOfWork(db).speculations.get_choice_keys(story_id.bytes, 2)
+        return full_story, keys
+
+    full_story, keys = run_async(scenario())
+
+    assert full_story.chapters[0].narration == "narration for b"
+    dungeon_master.send_messages.assert_not_awaited()
+    dungeon_master.ensure_available.assert_not_called()
+    assert keys == set()
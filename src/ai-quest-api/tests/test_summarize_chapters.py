@@ -0,0 +1,179 @@
+from unittest import mock
+
+import datetime
+import json
+import uuid
+
+import anthropic
+import httpx
+import pytest
+
+from app.clients import db_client, token_tracker
+from app.entities.chapter import Chapter
+from app.entities.story import Story
+from app.entities.user import User
+from app.jobs import summarize_chapters
+from app.repositories.chapter import ChapterRepository
+
+
+class FakeBatchServer:
+    """Just enough of the Message Batches API: create, retrieve, list and results"""
+    def __init__(self, polls_until_ended: int = 1):
+        self.batches: dict[str, dict] = {}
+        self.requests: dict[str, list[dict]] = {}
+        self.polls_until_ended = polls_until_ended
+
+    def _batch(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        if batch["processing_status"] == "in_progress" and batch["_polls"] >= self.polls_until_ended:
+            batch.update(processing_status="ended", ended_at=datetime.datetime.now(datetime.UTC).isoformat(),
+                         results_url=f"https://fake.batches/v1/messages/batches/{batch_id}/results")
+        batch["_polls"] += 1
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "POST" and path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{len(self.batches) + 1}"
+            self.requests[batch_id] = json.loads(request.content)["requests"]
+            now = datetime.datetime.now(datetime.UTC).isoformat()
+            self.batches[batch_id] = {
+                "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+                "created_at": now, "expires_at": now, "ended_at": None, "results_url": None,
+                "request_counts": {"processing": len(self.requests[batch_id]), "succeeded": 0, "errored": 0,
+                                   "canceled": 0, "expired": 0},
+                "_polls": 0,
+            }
+            return httpx.Response(200, json=self._batch(batch_id))
+        if path == "/v1/messages/batches":
+            return httpx.Response(200, json={
+                "data": [self._batch(batch_id) for batch_id in reversed(list(self.batches))],
+                "has_more": False, "first_id": None, "last_id": None,
+            })
+        if path.endswith("/results"):
+            batch_id = path.split("/")[-2]
+            lines = [
+                json.dumps({"custom_id": item["custom_id"], "result": {"type": "succeeded", "message": {
+                    "id": "msg", "type": "message", "role": "assistant", "model": item["params"]["model"],
+                    "content": [{"type": "text", "text": f"summary of {item['custom_id']}"}],
+                    "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 100, "output_tokens": 20},
+                }}})
+                for item in self.requests[batch_id]
+            ]
+            return httpx.Response(200, content="\n".join(lines).encode())
+        return httpx.Response(200, json=self._batch(path.rsplit("/", 1)[-1]))
+
+
+@pytest.fixture
+def fake_server(sqlite_database, monkeypatch):
+    monkeypatch.setattr(token_tracker, "_shared_tracker", None)
+    with mock.patch("boto3.resource"):
+        yield FakeBatchServer()
+
+
+def _job(server: FakeBatchServer) -> summarize_chapters.ChapterSummaryBatchJob:
+    client = anthropic.Anthropic(
+        api_key="test", base_url="https://fake.batches",
+        http_client=httpx.Client(transport=httpx.MockTransport(server.handle)),
+    )
+    return summarize_chapters.ChapterSummaryBatchJob(client=client, model="model", poll_seconds=0)
+
+
+def _create_chapters(count: int, summarized: int = 0) -> list[bytes]:
+    with db_client.session() as db:
+        user = User(id=uuid.uuid4().bytes, email="player@example.com", locale="en")
+        story = Story(id=uuid.uuid4().bytes, user_id=user.id)
+        chapters = [
+            Chapter(id=uuid.uuid4().bytes, narration=f"narration {number}", situation="situation", choices=["a"],
+                    action="act", outcome="outcome", number=number, story_id=story.id,
+                    summary="live summary" if number <= summarized else None)
+            for number in range(1, count + 1)
+        ]
+        db.add_all([user, story, *chapters])
+        return [chapter.id for chapter in chapters]
+
+
+def test_job_summarizes_unsummarized_chapters_in_one_batch(fake_server):
+    chapter_ids = _create_chapters(4, summarized=1)
+    job = _job(fake_server)
+    job.token_tracker.track_usage = mock.Mock()
+
+    report = job.run(limit=10, wait_seconds=5)
+
+    assert report["submitted_batch"] == "msgbatch_1"
+    assert report["summaries_written"] == 3
+    assert len(fake_server.requests["msgbatch_1"]) == 3
+    with db_client.session() as db:
+        summaries = [ChapterRepository(db).get_chapter(chapter.story_id, chapter.number).summary
+                     for chapter in db.query(Chapter).order_by(Chapter.number)]
+    assert summaries[0] == "live summary"
+    assert summaries[1:] == [f"summary of {chapter_id.hex()}" for chapter_id in chapter_ids[1:]]
+    assert job.token_tracker.track_usage.call_args.kwargs["batch"] is True
+
+
+def test_pending_batch_is_collected_by_the_next_run(fake_server):
+    _create_chapters(2)
+    fake_server.polls_until_ended = 3
+
+    first = _job(fake_server).run(limit=10, wait_seconds=0)
+    second = _job(fake_server).run(limit=10, wait_seconds=5)
+
+    assert first["pending_batches"] == ["msgbatch_1"]
+    assert second["collected_batches"] == ["msgbatch_1"]
+    assert second["summaries_written"] == 2
+    # nothing left to summarize, so no duplicate batch is submitted
+    assert second["submitted_batch"] is None
+    assert len(fake_server.batches) == 1
+
+
+def test_update_summaries_does_not_overwrite_live_summaries(fake_server):
+    chapter_ids = _create_chapters(2, summarized=1)
+
+    with db_client.session() as db:
+        updated = ChapterRepository(db).update_summaries({chapter_id: "batch summary" for chapter_id in chapter_ids})
+        unsummarized = ChapterRepository(db).get_unsummarized(limit=10)
+
+    assert updated == 1
+    assert unsummarized == []
+
+
+def test_update_summaries_changes_the_story_version(fake_server):
+    chapter_ids = _create_chapters(2)
+
+    with db_client.session() as db:
+        ChapterRepository(db).update_summaries({chapter_ids[0]: "batch summary"})
+        story = db.query(Story).one()
+
+    assert story.summaries_version == 1
+
+
+def test_collected_batches_are_not_collected_again(fake_server):
+    _create_chapters(2)
+    # a batch of another workload in the same account
+    fake_server.handle(httpx.Request("POST", "https://fake.batches/v1/messages/batches",
+                                     json={"requests": [{"custom_id": "other", "params": {"model": "model"}}]}))
+    tracker = mock.Mock()
+    first_job, second_job = _job(fake_server), _job(fake_server)
+    first_job.token_tracker = second_job.token_tracker = tracker
+
+    first = first_job.run(limit=10, wait_seconds=5)
+    second = second_job.run(limit=10, wait_seconds=5)
+
+    assert first["collected_batches"] == ["msgbatch_2"] and first["summaries_written"] == 2
+    assert second == {"collected_batches": [], "summaries_written": 0, "submitted_batch": None,
+                      "pending_batches": []}
+    assert tracker.track_usage.call_count == 1
+    with db_client.session() as db:
+        assert db.query(Story).one().summaries_version == 1
+
+
+def test_update_summaries_without_changes_keeps_the_story_version(fake_server):
+    chapter_ids = _create_chapters(1, summarized=1)
+
+    with db_client.session() as db:
+        updated = ChapterRepository(db).update_summaries({chapter_ids[0]: "batch summary"})
+        story = db.query(Story).one()
+
+    assert updated == 0
+    assert story.summaries_version == 0
@@ -0,0 +1,114 @@
+from unittest import mock
+
+import time
+
+import pytest
+
+from app.clients import token_tracker
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(token_tracker, "_shared_tracker", None)
+    with mock.patch("boto3.resource"):
+        # A long interval keeps the time-triggered flush out of the way
+        yield token_tracker.DynamoDBTokenTracker(buffer_size=100, flush_interval_seconds=60)
+
+
+def _written(tracker) -> list[dict]:
+    writer = tracker.table.batch_writer.return_value.__enter__.return_value
+    return [call.kwargs["Item"] for call in writer.put_item.call_args_list]
+
+
+def _track(tracker, count: int) -> None:
+    for _ in range(count):
+        tracker.track_usage(service="anthropic", model="claude-3-5-haiku-20241022", input_tokens=10, output_tokens=5)
+
+
+def test_usage_is_buffered_until_flushed(tracker):
+    _track(tracker, 3)
+
+    assert _written(tracker) == []
+    assert tracker.stats()["buffered"] == 3
+
+    tracker.flush()
+
+    assert len(_written(tracker)) == 3
+    tracker.table.put_item.assert_not_called()
+    assert tracker.stats() == {"tracked": 3, "written": 3, "dropped": 0, "failed": 0, "rollups_failed": 0,
+                               "buffered": 0}
+
+
+def test_full_batch_is_written_by_the_worker(tracker):
+    _track(tracker, token_tracker.BATCH_WRITE_MAX_ITEMS)
+
+    deadline = time.monotonic() + 5
+    while tracker.stats()["written"] < token_tracker.BATCH_WRITE_MAX_ITEMS and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert tracker.stats()["written"] == token_tracker.BATCH_WRITE_MAX_ITEMS
+    assert tracker.table.batch_writer.call_count == 1
+
+
+def test_items_beyond_the_buffer_are_dropped_and_counted(tracker):
+    tracker.buffer_size = 2
+    # a stalled write keeps the buffer from draining
+    tracker._write_lock.acquire()
+    try:
+        _track(tracker, 5)
+    finally:
+        tracker._write_lock.release()
+
+    assert tracker.stats()["dropped"] == 3
+    tracker.flush()
+    assert len(_written(tracker)) == 2
+
+
+def test_failed_writes_are_counted_not_raised(tracker):
+    tracker.table.batch_writer.side_effect = RuntimeError("throttled")
+    _track(tracker, 2)
+
+    tracker.flush()
+
+    assert tracker.stats()["failed"] == 2
+    assert tracker.stats()["buffered"] == 0
+    # usage without a raw record is not rolled up
+    tracker.table.update_item.assert_not_called()
+
+
+def test_flush_adds_each_batch_to_its_rollups_once_per_key(tracker):
+    _track(tracker, 2)
+    tracker.track_usage(service="anthropic", model="claude-sonnet-4-20250514", input_tokens=100, output_tokens=50,
+                        user_id="user-1")
+
+    tracker.flush()
+
+    updates = {call.kwargs["Key"]["timestamp_request_id"].split("#")[-1]: call.kwargs
+               for call in tracker.table.update_item.call_args_list}
+    assert len(tracker.table.update_item.call_args_list) == 3
+    haiku = updates["claude-3-5-haiku-20241022"]
+    assert haiku["Key"]["service_date"] == "rollup#anthropic"
+    assert haiku["UpdateExpression"].startswith("ADD ")
+    assert haiku["ExpressionAttributeValues"][":requests"] == 2
+    assert haiku["ExpressionAttributeValues"][":input_tokens"] == 20
+    user_update = next(update for update in updates.values() if update["Key"]["service_date"] == "rollup#user#user-1")
+    assert user_update["ExpressionAttributeValues"][":output_tokens"] == 50
+
+
+def test_usage_summary_reads_every_page_of_rollups(tracker):
+    rollup = {"date": "2025-01-20", "model": "claude-3-5-haiku-20241022", "input_tokens": 10, "output_tokens": 5,
+              "cache_read_input_tokens": 20, "total_tokens": 35, "estimated_cost_usd": token_tracker.Decimal("0.5"), "requests": 2}
+    tracker.table.query.side_effect = [
+        {"Items": [rollup], "LastEvaluatedKey": {"service_date": "rollup#anthropic"}},
+        {"Items": [{**rollup, "date": "2025-01-21"}]},
+    ]
+
+    summary = tracker.get_usage_summary("anthropic", "2025-01-01", "2025-01-31")
+
+    assert tracker.table.query.call_count == 2
+    assert tracker.table.query.call_args.kwargs["ExclusiveStartKey"] == {"service_date": "rollup#anthropic"}
+    assert tracker.table.query.call_args.kwargs["ExpressionAttributeValues"][":partition"] == "rollup#anthropic"
+    assert summary["request_count"] == 4
+    assert summary["total_tokens"] == 70
+    assert summary["estimated_cost_usd"] == 1.0
+    assert summary["model_breakdown"]["claude-3-5-haiku-20241022"]["requests"] == 4
@@ -0,0 +1,112 @@
+from unittest import mock
+
+import datetime
+import threading
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from fastapi.testclient import TestClient
+
+from app.services import security, usage
+
+with mock.patch("boto3.resource"):
+    from app.main import app
+
+
+class FakeUsageTable:
+    """
+    Stand-in for the token usage table resource and its low-level client:
+    key-condition queries on service_date, paginated, with typed attribute values
+    """
+    name = "token-usage"
+
+    def __init__(self, page_size: int = 2):
+        self.partitions: dict[str, list[dict]] = {}
+        self.page_size = page_size
+        self.queries: list[str] = []
+        self.meta = mock.Mock(client=self)
+        self._lock = threading.Lock()
+
+    def put(self, service: str, day: datetime.date, model: str, input_tokens: int, cost: str) -> None:
+        self.partitions.setdefault(f"{service}#{day.isoformat()}", []).append({
+            "model": model, "input_tokens": input_tokens, "output_tokens": 1, "total_tokens": input_tokens + 1,
+            "estimated_cost_usd": Decimal(cost),
+        })
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, ExclusiveStartKey=None):
+        assert TableName == self.name
+        partition = ExpressionAttributeValues[":service_date"]["S"]
+        with self._lock:
+            self.queries.append(partition)
+        items = self.partitions.get(partition, [])
+        start = int(ExclusiveStartKey["offset"]["N"]) if ExclusiveStartKey else 0
+        serializer = TypeSerializer()
+        response = {"Items": [{name: serializer.serialize(value) for name, value in item.items()}
+                              for item in items[start:start + self.page_size]]}
+        if start + self.page_size < len(items):
+            response["LastEvaluatedKey"] = {"offset": {"N": str(start + self.page_size)}}
+        return response
+
+
+@pytest.fixture
+def table():
+    return FakeUsageTable()
+
+
+def test_report_follows_every_page_of_every_day(table):
+    day = datetime.date(2025, 1, 20)
+    for _ in range(5):
+        table.put("anthropic", day, "haiku", 10, "0.01")
+    table.put("anthropic", day + datetime.timedelta(days=2), "sonnet", 100, "0.5")
+
+    engine = usage.UsageQueryEngine(table, max_workers=4)
+    report = engine.usage_report("anthropic", day, day + datetime.timedelta(days=2))
+
+    assert report["requests"] == 6
+    assert report["input_tokens"] == 150
+    assert report["estimated_cost_usd"] == pytest.approx(0.55)
+    assert report["models"]["haiku"]["requests"] == 5
+    assert [entry["date"] for entry in report["days"]] == ["2025-01-20", "2025-01-22"]
+    # three pages for the first day, one for each of the others
+    assert len(table.queries) == 5
+
+
+def test_closed_days_are_cached_and_today_is_requeried(table):
+    today = datetime.datetime.now(datetime.UTC).date()
+    past = today - datetime.timedelta(days=3)
+    engine = usage.UsageQueryEngine(table)
+
+    engine.usage_report("anthropic", past, today)
+    table.queries.clear()
+    table.put("anthropic", today, "haiku", 10, "0.01")
+    report = engine.usage_report("anthropic", past, today)
+
+    assert table.queries == [f"anthropic#{today.isoformat()}"]
+    assert report["requests"] == 1
+    assert engine.stats()["days_cached"] == 3
+
+
+def test_invalid_ranges_are_rejected(table):
+    engine = usage.UsageQueryEngine(table)
+    with pytest.raises(ValueError):
+        engine.usage_report("anthropic", datetime.date(2025, 2, 1), datetime.date(2025, 1, 1))
+    with pytest.raises(ValueError):
+        engine.usage_report("anthropic", datetime.date(2023, 1, 1), datetime.date(2025, 1, 1))
+
+
+def test_admin_usage_requires_the_admin_key(table, monkeypatch):
+    monkeypatch.setattr(security, "ADMIN_API_KEY", "secret")
+    monkeypatch.setattr(usage, "_engine", usage.UsageQueryEngine(table))
+    table.put("anthropic", datetime.date(2025, 1, 20), "haiku", 10, "0.01")
+    client = TestClient(app)
+    params = {"start_date": "2025-01-20", "end_date": "2025-01-21"}
+
+    assert client.get("/admin/usage", params=params).status_code == 403
+    assert client.get("/admin/usage", params=params, headers={"X-ADMIN-API-KEY": "wrong"}).status_code == 403
+    response = client.get("/admin/usage", params=params, headers={"X-ADMIN-API-KEY": "secret"})
+    assert response.status_code == 200
+    assert response.json()["requests"] == 1
+    invalid = client.get("/admin/usage", params={"start_date": "2025-01-21", "end_date": "2025-01-20"},
+                         headers={"X-ADMIN-API-KEY": "secret"})
+    assert invalid.status_code == 400
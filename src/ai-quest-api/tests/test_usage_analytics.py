@@ -0,0 +1,89 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.services import usage, usage_analytics
+from tests.test_usage import FakeUsageTable
+
+
+def _item(model: str, hour: int, input_tokens: int, cost: str, user_id: str = None, cache_read: int = 0) -> dict:
+    item = {
+        "model": model, "timestamp": f"2025-01-20T{hour:02d}:15:00+00:00", "input_tokens": input_tokens,
+        "output_tokens": 10, "cache_creation_input_tokens": 0, "cache_read_input_tokens": cache_read,
+        "total_tokens": input_tokens + 10 + cache_read, "estimated_cost_usd": Decimal(cost),
+    }
+    if user_id:
+        item["user_id"] = user_id
+    return item
+
+
+ITEMS = [
+    _item("haiku", 9, 100, "0.01", user_id="user-1", cache_read=300),
+    _item("haiku", 9, 200, "0.02", user_id="user-2"),
+    _item("sonnet", 11, 1000, "0.50", user_id="user-1", cache_read=1000),
+    _item("sonnet", 11, 400, "0.20"),
+]
+
+
+def test_columns_dictionary_encode_models_and_users():
+    columns = usage_analytics.UsageColumns().extend(ITEMS)
+
+    assert len(columns) == 4
+    assert list(columns.codes["model"]) == [0, 0, 1, 1]
+    assert columns.labels["user_id"] == {"user-1": 0, "user-2": 1, "": 2}
+    assert list(columns.numeric["estimated_cost_usd"]) == [0.01, 0.02, 0.5, 0.2]
+    assert columns.numeric["timestamp"][0] == int(datetime.datetime(2025, 1, 20, 9, 15,
+                                                                     tzinfo=datetime.UTC).timestamp())
+
+
+def test_export_reads_every_page_of_every_day():
+    table = FakeUsageTable()
+    day = datetime.date(2025, 1, 20)
+    for _ in range(3):
+        table.put("anthropic", day, "haiku", 10, "0.01")
+    for item in table.partitions[f"anthropic#{day.isoformat()}"]:
+        item["timestamp"] = "2025-01-20T09:00:00+00:00"
+
+    columns = usage_analytics.export_usage("anthropic", day, day + datetime.timedelta(days=1),
+                                           engine=usage.UsageQueryEngine(table))
+
+    assert len(columns) == 3
+    assert table.queries == ["anthropic#2025-01-20", "anthropic#2025-01-20", "anthropic#2025-01-21"]
+
+
+def test_unsupported_formats_are_rejected():
+    with pytest.raises(ValueError):
+        usage_analytics.load("usage.csv")
+
+
+def test_report_groups_costs_and_tokens():
+    pytest.importorskip("numpy")
+    analytics = usage_analytics.UsageAnalytics(usage_analytics.UsageColumns().extend(ITEMS).to_arrays())
+
+    report = analytics.report()
+
+    assert report["requests"] == 4
+    assert report["estimated_cost_usd"] == pytest.approx(0.73)
+    assert report["models"]["sonnet"] == {"requests": 2, "total_tokens": 2420, "estimated_cost_usd": pytest.approx(0.7)}
+    assert report["users"]["user-1"]["requests"] == 2
+    assert report["users"][""]["estimated_cost_usd"] == pytest.approx(0.2)
+    assert report["hours"] == {"2025-01-20T09:00:00+00:00": pytest.approx(0.03),
+                               "2025-01-20T11:00:00+00:00": pytest.approx(0.7)}
+    assert report["token_percentiles"]["input_tokens"]["p50"] == 300
+    assert report["cache_hit_ratios"]["models"]["haiku"] == pytest.approx(300 / 600)
+    assert report["cache_hit_ratios"]["overall"] == pytest.approx(1300 / 3000)
+
+
+@pytest.mark.parametrize("extension", ["npz", "parquet"])
+def test_exports_round_trip(tmp_path, extension):
+    pytest.importorskip("numpy")
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"usage.{extension}")
+
+    usage_analytics.save(usage_analytics.UsageColumns().extend(ITEMS).to_arrays(), path)
+    analytics = usage_analytics.UsageAnalytics(usage_analytics.load(path))
+
+    assert analytics.cost_by("model")["haiku"]["requests"] == 2
+    assert analytics.cost_by("user_id")["user-2"]["estimated_cost_usd"] == pytest.approx(0.02)